@@ -0,0 +1,67 @@
+class Lazy:
+    """
+    a context value computed the first time it is used and kept for the rest of the request
+    NOTE: templates call callables they look up so {{ key }}, {% for x in key %}, {% if key %}... all resolve it; the
+        value is computed once no matter how often the template touches it and never when it does not
+    """
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.computed = False
+        self.value = None
+
+    def __call__(self):
+        if not self.computed:
+            self.value = self.fn(*self.args, **self.kwargs)
+            self.computed = True
+            # let the arguments (querysets, requests...) go
+            self.fn = self.args = self.kwargs = None
+        return self.value
+
+
+class PageContext(dict):
+    """
+    the context of one request of a docroot page; build a new one in get_context instead of updating the module level
+    context dict (the module can be shared by concurrent requests so the dict would be too)
+        def get_context(request):
+            ctx = PageContext(context, selected=request.GET)
+            ctx.lazy('projects', project_lookups)
+            ctx.lazy(('evaluations', 'next_cursor'), vendor_report_page, project)
+            return ctx
+    NOTE: lazy values are only computed if the template (or the code reading ctx[key]) uses them; ctx[key] and
+        ctx.get(key) return the computed value
+    """
+    def lazy(self, key, fn, *args, **kwargs):
+        """
+        add a value computed on first use by fn(*args, **kwargs)
+        :param key: the context key or a tuple of keys sharing one call of fn; its result is split across them (a
+            tuple by position, a dict by key)
+        :param fn: the function computing the value
+        :return: the Lazy of the call (call it for the value)
+        """
+        value = Lazy(fn, *args, **kwargs)
+        if isinstance(key, tuple):
+            for position, name in enumerate(key):
+                super().__setitem__(name, Lazy(_part, value, name, position))
+        else:
+            super().__setitem__(key, value)
+        return value
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        return value() if isinstance(value, Lazy) else value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def resolve(self):
+        """
+        :return: a plain dict with every lazy value computed Ex: for a JsonResponse
+        """
+        return {key: self[key] for key in self}
+
+
+def _part(value, name, position):
+    result = value()
+    return result[name] if isinstance(result, dict) else result[position]
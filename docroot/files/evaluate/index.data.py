@@ -0,0 +1,24 @@
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ObjectDoesNotExist
+from docroot.context import PageContext
+from eval.grid import get_score_grid
+from eval.lookups import project_lookups
+
+# static context definition
+context = {'title': 'SPE Evaluations', 'description': 'SPE Evaluation Application'}
+
+
+# dynamic context return
+# NOTE: build a new PageContext per request; the module level context is only the static defaults
+# NOTE: the grid is saved with PATCH /eval/api/grid/<project code>/ (see eval.views.score_grid)
+def get_context(request):
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    ctx = PageContext(context, grid=None, error=None, selected=request.GET.get('project', ''))
+    ctx.lazy('projects', project_lookups)
+    if ctx['selected']:
+        try:
+            ctx['grid'] = get_score_grid(ctx['selected'], request.user)
+        except ObjectDoesNotExist as ex:
+            ctx['error'] = str(ex)
+    return ctx
@@ -2,13 +2,21 @@
 # from django.conf import settings
 # from django.http import JsonResponse
 # from datetime import datetime
+# from docroot.context import PageContext
 
 # static context definition
 context = {'title': 'SPE Evaluations', 'description': 'SPE Evaluation Application'}
 
+# the page only changes with the user it greets so it is cached per user for an hour (see eval.pagecache)
+cache_ttl = 60 * 60
+
+
+def cache_key(request):
+    return f"{request.get_full_path()}:{request.user.pk}"
+
 
 # dynamic context return
-# NOTE: don't forget to use .update to add/replace instead of = which will ignore static definition
+# NOTE: build a new PageContext (docroot.context) per request; the module level context is only the static defaults
 # def get_context(request):
 #     regex_http_ = re.compile(r'^HTTP_.+$')
 #     regex_content_type = re.compile(r'^CONTENT_TYPE$')
@@ -23,8 +31,7 @@ context = {'title': 'SPE Evaluations', 'description': 'SPE Evaluation Applicatio
 #     b2 = getattr(settings, "BOOGER2", "")
 #     request_ip = request.META.get('REMOTE_ADDR')
 #     real_ip = request.META.get('HTTP_X_REAL_IP')
-#     context.update({'headers': request_headers, 'request_ip': str(request_ip), 'real_ip': str(real_ip), 'b': b, 'b2': b2})
-#     return context
+#     return PageContext(context, headers=request_headers, request_ip=str(request_ip), real_ip=str(real_ip), b=b, b2=b2)
 
 
 # web service definitions
@@ -32,7 +39,7 @@ context = {'title': 'SPE Evaluations', 'description': 'SPE Evaluation Applicatio
 #   if no data file or no web service methods defined returns 404-not found
 # BEST PRACTICE: GET does not update only reads and returns data
 # def GET(request):
-#     ctx = get_context(request)
+#     ctx = get_context(request).resolve()
 #     now = datetime.now()
 #     ctx['freshness_date'] = str(now)
 #     return JsonResponse(ctx, safe=False)
@@ -0,0 +1,24 @@
+from django.core.exceptions import ObjectDoesNotExist
+from docroot.context import PageContext
+from eval.lookups import project_lookups
+from eval.progress import project_progress
+
+# static context definition
+context = {'title': 'SPE Evaluation Progress', 'description': 'Who has scored how much of a project'}
+
+# served from the page cache (eval.pagecache); keyed by ?project= so every score change of the project invalidates it
+cache_ttl = 60
+
+
+# dynamic context return
+# NOTE: build a new PageContext per request; the module level context is only the static defaults
+# NOTE: the counts are read from the summary table (eval.progress) so the page never counts evaluations
+def get_context(request):
+    ctx = PageContext(context, progress=None, error=None, selected=request.GET.get('project', ''))
+    ctx.lazy('projects', project_lookups)
+    if ctx['selected']:
+        try:
+            ctx['progress'] = project_progress(ctx['selected'])
+        except ObjectDoesNotExist as ex:
+            ctx['error'] = str(ex)
+    return ctx
@@ -118,12 +118,29 @@ else:
 if 'default' in DATABASES and 'ENGINE' in DATABASES['default'] and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
     DATABASES['default']['NAME']=pathlib.Path(BASE_DIR, 'data', 'db.sqlite3')
 
+# the pages cache holds the docroot pages whose .data.py opts in with cache_ttl (see eval.pagecache)
+# NOTE: local memory is per process; to share the pages between processes use a file cache instead Ex:
+#   'pages': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#             'LOCATION': pathlib.Path(BASE_DIR, 'data', 'pages')},
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'eval-pages',
+    },
+}
+
 # OVERRIDE THE DEFAULT CACHE TO DISABLE TEMPLATE CACHING IN DEV
 if DEBUG:
     CACHES = {
         'default': {
             'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
         },
+        'pages': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
     }
 
 # SECURITY WARNING: keep the secret key used in production a secret!
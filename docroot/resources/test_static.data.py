@@ -7,5 +7,4 @@ context = {'title': 'my static title',
 
 # def get_context(request):
 #     # region_list = Web_Region.objects.values_list('region_name', flat=True)
-#     context.update({'data': 'my dynamic data'})
-#     return context
\ No newline at end of file
+#     return PageContext(context, data='my dynamic data')
\ No newline at end of file
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first so it measures everything below it, the docroot fallback pages included
+    'eval.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +57,18 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'docroot.urls'
 
+# per view request timings and query counts; read them from /eval/api/metrics/ (staff only)
+EVAL_METRICS_ENABLED = True
+# log queries slower than this many milliseconds (None to turn off)
+EVAL_SLOW_QUERY_MS = 250
+
+# threads per process the async read views (eval/async_views.py) run their queries in
+EVAL_ASYNC_READ_THREADS = 8
+# cache (CACHES alias) of the docroot pages whose .data.py sets cache_ttl; project changes invalidate their pages
+EVAL_PAGE_CACHE = 'pages'
+# running jobs (see eval.jobs) silent for this many seconds lost their worker and are queued again
+EVAL_JOB_STALE_SECONDS = 15 * 60
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -158,7 +172,8 @@ if 'docroot' not in INSTALLED_APPS and 'docrootcms' in INSTALLED_APPS:
     # INSTALLED_APPS.insert(docrootcms_idx, 'docroot')
 
 if 'docroot' in INSTALLED_APPS:
-    MIDDLEWARE += ('docrootcms.middleware.DocrootFallbackMiddleware',)
+    # async capable subclass of docrootcms.middleware.DocrootFallbackMiddleware (see eval.async_views)
+    MIDDLEWARE += ('eval.middleware.DocrootFallbackMiddleware',)
     if 'docroot/files/dt.inc' not in TEMPLATES[0]['DIRS'] or 'docroot/files/dt.inc/' not in TEMPLATES[0]['DIRS']:
         TEMPLATES[0]['DIRS'].append('docroot/files/dt.inc')
     if 'docrootcms.contrib.blog' not in INSTALLED_APPS:
@@ -231,6 +246,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'eval': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     }
 }
 if DEBUG:
@@ -248,12 +268,29 @@ else:
 if 'default' in DATABASES and 'ENGINE' in DATABASES['default'] and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
     DATABASES['default']['NAME']=pathlib.Path(BASE_DIR, 'data', 'db.sqlite3')
 
+# the pages cache holds the docroot pages whose .data.py opts in with cache_ttl (see eval.pagecache)
+# NOTE: local memory is per process; to share the pages between processes use a file cache instead Ex:
+#   'pages': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#             'LOCATION': pathlib.Path(BASE_DIR, 'data', 'pages')},
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'eval-pages',
+    },
+}
+
 # OVERRIDE THE DEFAULT CACHE TO DISABLE TEMPLATE CACHING IN DEV
 if DEBUG:
     CACHES = {
         'default': {
             'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
         },
+        'pages': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
     }
 
 # SECURITY WARNING: keep the secret key used in production a secret!
@@ -1,6 +1,6 @@
 from django import forms
-from django.contrib.auth.models import Group, User
-from django.db.models import Q
+from django.contrib.auth.models import Group
+from django.db.models import Q, Prefetch
 from django.contrib import admin
 from django.utils.encoding import force_text
 from markdownx.admin import MarkdownxModelAdmin
@@ -9,7 +9,8 @@ from import_export.admin import ExportMixin
 # from import_export.fields import Field
 from django.utils.html import format_html, linebreaks
 
-from .models import Project, ProjectVendor, ProjectFunctionality, Evaluation
+from .models import Project, ProjectVendor, ProjectFunctionality, PriorityWeight, Evaluation, Job
+from .lookups import project_lookups, group_lookups, get_username
 
 
 # trying to override the class to see if I can inherit from a different template
@@ -60,12 +61,21 @@ class EvaluationResource(resources.ModelResource):
 
 
 
+class PriorityWeightInline(admin.TabularInline):
+    """
+    weights used by the weighted vendor scores; a weight applies to the priority and every priority below it
+    """
+    model = PriorityWeight
+    extra = 1
+
+
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ('name', 'is_active')
     list_filter = ('is_active',)
     search_fields = ['name', 'id']
     readonly_fields = ['id']
+    inlines = [PriorityWeightInline]
 
 
 class ProjectFilter(admin.SimpleListFilter):
@@ -73,15 +83,8 @@ class ProjectFilter(admin.SimpleListFilter):
     parameter_name = 'project'
 
     def lookups(self, request, model_admin):
-        qs_proj = Project.objects.active()
-        list_proj = []
-        for proj in qs_proj:
-            list_proj.append(
-                (proj.code, proj.name)
-            )
-        return (
-            sorted(list_proj, key=lambda tp: tp[1])
-        )
+        # cached and already ordered by name; cleared when a project changes
+        return project_lookups()
 
     def queryset(self, request, queryset):
         if self.value():
@@ -118,15 +121,8 @@ class AppliesToFilter(admin.SimpleListFilter):
     parameter_name = 'applies_to'
 
     def lookups(self, request, model_admin):
-        qs_groups = Group.objects.filter(name__icontains=":").exclude(name__iendswith=":Members")
-        list_groups = []
-        for grp in qs_groups:
-            list_groups.append(
-                (grp.id, grp.name)
-            )
-        return (
-            sorted(list_groups, key=lambda tp: tp[1])
-        )
+        # cached and already ordered by name; cleared when a group changes
+        return group_lookups()
 
     def queryset(self, request, queryset):
         if self.value():
@@ -178,8 +174,13 @@ class PercentFilter(admin.SimpleListFilter):
 
 
 class UserFilter(admin.SimpleListFilter):
+    """
+    Me, Everyone and the picked user; any other user is found with the autocomplete box (eval:user_lookup) so the
+    changelist does not render every user
+    """
     title = 'user'
     parameter_name = 'user'
+    template = 'admin/eval/user_filter.html'
 
     def choices(self, changelist):
         """Copied from source code to remove the "All" Option"""
@@ -196,15 +197,13 @@ class UserFilter(admin.SimpleListFilter):
             }
 
     def lookups(self, request, model_admin):
-        qs_users = User.objects.exclude(id=request.user.id)
         list_users = [(0, ' Everyone')]
-        for usr in qs_users:
-            list_users.append(
-                (usr.id, usr.username)
-            )
-        return (
-            sorted(list_users, key=lambda tp: tp[1])
-        )
+        value = request.GET.get(self.parameter_name)
+        if value and value != '0' and value != str(request.user.id):
+            username = get_username(value)
+            if username:
+                list_users.append((value, username))
+        return list_users
 
     def queryset(self, request, queryset):
         if self.value() and self.value() != '0':
@@ -232,10 +231,16 @@ class EvaluationAdmin(EvaluationExportMixin, MarkdownxModelAdmin):
     formatted_functionality.short_description = 'functionality'
 
     def priorities(self, obj):
-        return format_html("<br>".join([str(p) for p in obj.functionality.priorities.all()]))
+        priorities = getattr(obj.functionality, 'priority_list', None)
+        if priorities is None:
+            priorities = obj.functionality.priorities.all()
+        return format_html("<br>".join([str(p) for p in priorities]))
 
     def categories(self, obj):
-        return format_html("<br>".join([str(c) for c in obj.functionality.categories.all()]))
+        categories = getattr(obj.functionality, 'category_list', None)
+        if categories is None:
+            categories = obj.functionality.categories.all()
+        return format_html("<br>".join([str(c) for c in categories]))
 
     def has_add_permission(self, request):
         return False
@@ -246,7 +251,12 @@ class EvaluationAdmin(EvaluationExportMixin, MarkdownxModelAdmin):
         :param request: the request for this call
         :return: the queryset to display on admin screen
         """
-        qs = super().get_queryset(request)
+        # load the foreign keys and tags shown in list_display up front instead of once per row
+        # NOTE: tags are prefetched into lists (to_attr); tagulous reloads its manager per instance otherwise
+        qs = super().get_queryset(request).select_related('user', 'vendor', 'functionality').prefetch_related(
+            Prefetch('functionality__priorities', to_attr='priority_list'),
+            Prefetch('functionality__categories', to_attr='category_list'),
+        )
         # if we specified another user let normal filtering happen
         if request.GET.get('user') or request.POST.get('user'):
             return qs
@@ -274,5 +284,16 @@ class EvaluationAdmin(EvaluationExportMixin, MarkdownxModelAdmin):
     #     return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'created_by', 'created', 'finished')
+    list_filter = ('kind', 'status')
+    readonly_fields = ['id', 'kind', 'params', 'status', 'progress', 'message', 'result_file', 'cancel_requested',
+                       'created_by', 'created', 'started', 'finished']
+
+    def has_add_permission(self, request):
+        return False
+
+
 def export_evaluations():
     return EvaluationResource().export()
@@ -0,0 +1,182 @@
+from django.contrib.auth.models import User
+
+from eval.models import ProjectVendor, ProjectFunctionality
+from eval.matrix import get_score_matrix
+from eval.utils import get_project
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# scores are 0-10 so there are 11 possible answers
+SCORE_OPTIONS = 11
+# variance of scores picked at random (uniform over the options); what r_wg compares the observed variance with
+EXPECTED_VARIANCE = (SCORE_OPTIONS ** 2 - 1) / 12
+# cells agreeing less than this are counted as disagreements (the usual r_wg cut off)
+AGREEMENT_THRESHOLD = 0.7
+
+
+def agreement(count, variance):
+    """
+    within group agreement (r_wg) of the scores of one cell: 1 - observed variance / EXPECTED_VARIANCE
+    NOTE: 1 is full agreement and 0 is no better than random scores; spreads wider than random are clipped to 0
+    :param count: number of scores of the cell
+    :param variance: sample variance of the scores
+    :return: 0-1 or None when fewer than 2 people scored the cell
+    """
+    if count < 2:
+        return None
+    return max(0.0, 1 - variance / EXPECTED_VARIANCE)
+
+
+def project_statistics(project, use_numpy=None):
+    """
+    score distribution and inter-rater agreement of a project computed in one pass over its scored evaluations
+        cells - per vendor and requirement: count, mean, sample variance, stddev, min, max and agreement (r_wg); least
+            agreement first
+        evaluators - per user: scored count, mean score and bias (average of score - mean of the other scores of the
+            cell over the cells at least one other person scored too) plus the average absolute deviation; biggest
+            bias first
+        vendors - per vendor: scored count, mean, score distribution (count of each score 0-10), agreement (mean r_wg
+            of its cells with 2+ scores) and the number of cells below AGREEMENT_THRESHOLD
+    NOTE: only active vendors and requirements count; the scores are read from the cached score matrix (eval.matrix)
+    :param project: a Project or a project code
+    :param use_numpy: force (True) or skip (False) the NumPy engine; by default NumPy is used when it is installed
+    :return: dict of project, name, scored_count, vendors, evaluators and cells
+    """
+    project = get_project(project)
+    rows = get_score_matrix(project).cells()
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    cells, users, distributions = _numpy_statistics(rows) if use_numpy else _python_statistics(rows)
+
+    vendor_names = dict(ProjectVendor.objects.active().filter(project=project).order_by().values_list('id', 'name'))
+    requirement_names = {requirement.id: str(requirement) for requirement in ProjectFunctionality.objects.active()
+                         .filter(project=project).order_by().only('id', 'order', 'description')}
+    usernames = dict(User.objects.filter(id__in=users).values_list('id', 'username'))
+
+    cell_results = []
+    vendor_agreements = {}
+    for (vendor_id, functionality_id), (count, total, squares, low, high) in cells.items():
+        variance = (squares - total * total / count) / (count - 1) if count > 1 else None
+        cell_agreement = agreement(count, variance)
+        if cell_agreement is not None:
+            vendor_agreements.setdefault(vendor_id, []).append(cell_agreement)
+        cell_results.append({
+            'vendor_id': vendor_id,
+            'vendor': vendor_names.get(vendor_id),
+            'functionality_id': functionality_id,
+            'requirement': requirement_names.get(functionality_id),
+            'count': count,
+            'mean': total / count,
+            'variance': variance,
+            'stddev': variance ** 0.5 if variance is not None else None,
+            'min': low,
+            'max': high,
+            'agreement': cell_agreement,
+        })
+    cell_results.sort(key=lambda cell: (cell['agreement'] is None, cell['agreement'] or 0, cell['vendor'] or '',
+                                        cell['requirement'] or ''))
+
+    vendors = []
+    for vendor_id, name in sorted(vendor_names.items(), key=lambda item: item[1]):
+        distribution = distributions.get(vendor_id, [0] * SCORE_OPTIONS)
+        scored_count = sum(distribution)
+        agreements = vendor_agreements.get(vendor_id, [])
+        vendors.append({
+            'vendor_id': vendor_id,
+            'name': name,
+            'scored_count': scored_count,
+            'mean': sum(score * count for score, count in enumerate(distribution)) / scored_count
+            if scored_count else None,
+            'distribution': distribution,
+            'rated_cells': len(agreements),
+            'agreement': sum(agreements) / len(agreements) if agreements else None,
+            'low_agreement_cells': sum(1 for value in agreements if value < AGREEMENT_THRESHOLD),
+        })
+
+    evaluators = []
+    for user_id, (count, total, compared, deviation, absolute_deviation) in users.items():
+        evaluators.append({
+            'user_id': user_id,
+            'username': usernames.get(user_id),
+            'scored_count': count,
+            'mean': total / count,
+            'compared_count': compared,
+            'bias': deviation / compared if compared else None,
+            'mean_absolute_deviation': absolute_deviation / compared if compared else None,
+        })
+    evaluators.sort(key=lambda evaluator: (evaluator['bias'] is None, -abs(evaluator['bias'] or 0),
+                                           evaluator['username'] or ''))
+    return {'project': project.code, 'name': project.name, 'scored_count': sum(cell[0] for cell in cells.values()),
+            'vendors': vendors, 'evaluators': evaluators, 'cells': cell_results}
+
+
+def _python_statistics(rows):
+    """
+    :return: (dict of (vendor id, functionality id) -> (count, sum, sum of squares, min, max),
+        dict of user id -> (count, sum, compared count, deviation sum, absolute deviation sum),
+        dict of vendor id -> list of the count of each score)
+    """
+    rows = list(rows)
+    cells = {}
+    distributions = {}
+    for user_id, vendor_id, functionality_id, score in rows:
+        key = (vendor_id, functionality_id)
+        count, total, squares, low, high = cells.get(key, (0, 0, 0, score, score))
+        cells[key] = (count + 1, total + score, squares + score * score, min(low, score), max(high, score))
+        distributions.setdefault(vendor_id, [0] * SCORE_OPTIONS)[score] += 1
+    users = {}
+    for user_id, vendor_id, functionality_id, score in rows:
+        count, total, compared, deviation, absolute_deviation = users.get(user_id, (0, 0, 0, 0.0, 0.0))
+        cell_count, cell_total = cells[(vendor_id, functionality_id)][:2]
+        if cell_count > 1:
+            # NOTE: the mean of the others; with their own score in it the bias of an evaluator is shrunk by
+            #   (n - 1) / n and a lone dissenter among two looks half as far off
+            difference = score - (cell_total - score) / (cell_count - 1)
+            compared, deviation, absolute_deviation = (compared + 1, deviation + difference,
+                                                       absolute_deviation + abs(difference))
+        users[user_id] = (count + 1, total + score, compared, deviation, absolute_deviation)
+    return cells, users, distributions
+
+
+def _numpy_statistics(rows):
+    """
+    same as _python_statistics but vectorized; every aggregate is a bincount over the cell or user index of the rows
+    """
+    data = numpy.array(list(rows), dtype=numpy.int64).reshape(-1, 4)
+    if not len(data):
+        return {}, {}, {}
+    scores = data[:, 3]
+    cell_keys, cell_index = numpy.unique(data[:, 1:3], axis=0, return_inverse=True)
+    cell_index = cell_index.reshape(-1)
+    counts = numpy.bincount(cell_index)
+    totals = numpy.bincount(cell_index, weights=scores)
+    squares = numpy.bincount(cell_index, weights=scores * scores)
+    lows = numpy.full(len(cell_keys), SCORE_OPTIONS, dtype=numpy.int64)
+    numpy.minimum.at(lows, cell_index, scores)
+    highs = numpy.full(len(cell_keys), -1, dtype=numpy.int64)
+    numpy.maximum.at(highs, cell_index, scores)
+    cells = {(int(vendor_id), int(functionality_id)): (int(counts[i]), int(totals[i]), int(squares[i]), int(lows[i]),
+                                                       int(highs[i]))
+             for i, (vendor_id, functionality_id) in enumerate(cell_keys)}
+
+    user_ids, user_index = numpy.unique(data[:, 0], return_inverse=True)
+    compared = counts[cell_index] > 1
+    others = numpy.maximum(counts - 1, 1)[cell_index]
+    differences = numpy.where(compared, scores - (totals[cell_index] - scores) / others, 0.0)
+    user_counts = numpy.bincount(user_index)
+    user_totals = numpy.bincount(user_index, weights=scores)
+    user_compared = numpy.bincount(user_index, weights=compared)
+    user_deviations = numpy.bincount(user_index, weights=differences)
+    user_absolute_deviations = numpy.bincount(user_index, weights=numpy.abs(differences))
+    users = {int(user_id): (int(user_counts[i]), int(user_totals[i]), int(user_compared[i]),
+                            float(user_deviations[i]), float(user_absolute_deviations[i]))
+             for i, user_id in enumerate(user_ids)}
+
+    vendor_ids, vendor_index = numpy.unique(data[:, 1], return_inverse=True)
+    histogram = numpy.bincount(vendor_index * SCORE_OPTIONS + scores, minlength=len(vendor_ids) * SCORE_OPTIONS)\
+        .reshape(-1, SCORE_OPTIONS)
+    distributions = {int(vendor_id): [int(count) for count in histogram[i]] for i, vendor_id in enumerate(vendor_ids)}
+    return cells, users, distributions
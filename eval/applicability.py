@@ -0,0 +1,82 @@
+from django.contrib.auth.models import User
+
+from eval.models import ProjectFunctionality
+
+
+class ApplicabilityIndex:
+    """
+    which active requirements apply to which members of a project, loaded in three queries (memberships with group
+    names, active requirement ids and requirement group links) and resolved in memory
+        - members are the users of the <code>:Members group
+        - a member in other groups of the project (names starting with the code) only gets the requirements that
+          apply to one of those groups; any other member gets every active requirement
+    NOTE: requirement sets are built once per distinct combination of groups and shared by the members with that
+        combination, so resolving a whole project is linear in the number of memberships and links
+    """
+    def __init__(self, project, user_ids=None, functionality_ids=None):
+        """
+        :param project: the project
+        :param user_ids: only load these users (None for every member)
+        :param functionality_ids: only load these requirements (None for every active requirement)
+        """
+        self.project = project
+        members_group = f"{project.code}:Members".lower()
+        memberships = User.groups.through.objects.filter(group__name__istartswith=project.code)
+        requirements = ProjectFunctionality.objects.active().filter(project=project)
+        links = ProjectFunctionality.groups.through.objects.filter(projectfunctionality__project=project,
+                                                                   projectfunctionality__is_active=True)
+        if user_ids is not None:
+            memberships = memberships.filter(user_id__in=user_ids)
+        if functionality_ids is not None:
+            requirements = requirements.filter(id__in=functionality_ids)
+            links = links.filter(projectfunctionality_id__in=functionality_ids)
+
+        self.members = set()
+        self._user_groups = {}
+        for user_id, group_id, name in memberships.values_list('user_id', 'group_id', 'group__name'):
+            if name.lower() == members_group:
+                self.members.add(user_id)
+            else:
+                self._user_groups.setdefault(user_id, set()).add(group_id)
+        self.requirement_ids = frozenset(requirements.values_list('id', flat=True))
+        self._group_requirements = {}
+        for functionality_id, group_id in links.values_list('projectfunctionality_id', 'group_id'):
+            self._group_requirements.setdefault(group_id, set()).add(functionality_id)
+        self._resolved = {}
+
+    def requirements_for(self, user_id):
+        """
+        :param user_id: a user id
+        :return: frozenset of the requirement ids that apply to the user (empty for users that are not members)
+        """
+        if user_id not in self.members:
+            return frozenset()
+        groups = frozenset(self._user_groups.get(user_id, ()))
+        if not groups:
+            return self.requirement_ids
+        if groups not in self._resolved:
+            requirement_ids = set()
+            for group_id in groups:
+                requirement_ids.update(self._group_requirements.get(group_id, ()))
+            self._resolved[groups] = frozenset(requirement_ids & self.requirement_ids)
+        return self._resolved[groups]
+
+    def applies(self, user_id, functionality_id):
+        """
+        :return: True if the requirement applies to the user
+        """
+        return functionality_id in self.requirements_for(user_id)
+
+    def users_for(self, functionality_id):
+        """
+        :param functionality_id: a requirement id
+        :return: set of the member ids the requirement applies to
+        """
+        return {user_id for user_id in self.members if self.applies(user_id, functionality_id)}
+
+    def items(self):
+        """
+        :return: generator of (member id, frozenset of requirement ids) for every member
+        """
+        for user_id in self.members:
+            yield user_id, self.requirements_for(user_id)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EvalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'eval'
+
+    def ready(self):
+        # register the model signal handlers
+        from . import signals  # noqa: F401
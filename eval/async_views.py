@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import HttpResponse
+from django.http import JsonResponse, Http404
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
+
+from .models import Job
+from .jobs import job_status
+from .scorecard import get_scorecard
+from .reports import vendor_report_page, vendor_report_request, evaluation_row
+from .middleware import count_queries
+
+# the read views below run their queries in this many threads per process (EVAL_ASYNC_READ_THREADS); bounded so a
+#   burst of pollers queues here instead of opening a database connection each
+READ_THREADS = getattr(settings, 'EVAL_ASYNC_READ_THREADS', 8)
+READ_EXECUTOR = ThreadPoolExecutor(max_workers=READ_THREADS, thread_name_prefix='eval-read')
+
+
+def _read(request, fn, args):
+    """
+    run fn in a pool thread like a request: stale connections of the thread are closed before and after (what the
+    request_started/request_finished signals do for the request thread) and its queries are counted for the metrics
+    """
+    close_old_connections()
+    try:
+        with count_queries(request):
+            return fn(*args)
+    finally:
+        close_old_connections()
+
+
+async def read(request, fn, *args):
+    """
+    await a sync function that reads the database without blocking the event loop or the one thread django keeps
+    for thread sensitive code
+    :param request: the request (for the query metrics)
+    :param fn: the function to run in READ_EXECUTOR
+    :return: what fn returns
+    """
+    return await sync_to_async(_read, thread_sensitive=False, executor=READ_EXECUTOR)(request, fn, args)
+
+
+def _job_status(job_id):
+    try:
+        return job_status(Job.objects.get(id=job_id))
+    except Job.DoesNotExist:
+        raise Http404(f"Job [{job_id}] was not found")
+
+
+def _evaluation_page(params):
+    options = vendor_report_request(params)
+    if not options:
+        raise ValidationError("Parameter [project] is required")
+    evaluations, next_cursor = vendor_report_page(**options)
+    return {'evaluations': [evaluation_row(evaluation) for evaluation in evaluations], 'next_cursor': next_cursor}
+
+
+async def vendor_scorecard(request, product_code):
+    """
+    async twin of views.vendor_scorecard for dashboards polling through an ASGI server
+    :param request: request object
+    :param product_code: the project code
+    :return: json scorecard
+    """
+    try:
+        return JsonResponse(await read(request, get_scorecard, product_code))
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+async def job_detail(request, job_id):
+    """
+    async twin of views.job_detail for progress polling
+    :return: json status and progress of a job
+    """
+    return JsonResponse(await read(request, _job_status, job_id))
+
+
+async def evaluation_list(request):
+    """
+    one page of evaluations (the vendor report json) for dashboards polling through an ASGI server
+    :param request: request object; project (code, required), vendor, requirement, after (cursor), limit
+    :return: json {"evaluations": [...], "next_cursor": "..." or null}
+    """
+    try:
+        return JsonResponse(await read(request, _evaluation_page, request.GET))
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
@@ -0,0 +1,421 @@
+import asyncio
+import json
+import platform
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import django
+from django.db import connection, connections, transaction
+from django.test import Client, AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User, Group
+from eval.models import Project, ProjectVendor, ProjectFunctionality, Evaluation, PriorityCategory, \
+    FunctionalityCategory
+from eval.applicability import ApplicabilityIndex
+from eval.utils import generate_evaluations
+
+# rows per insert when seeding synthetic data
+SEED_BATCH_SIZE = 1000
+# markdown repeated to build the synthetic notes
+SEED_NOTE = "**Finding** the vendor covers this with *some* setup.\n\n" \
+            "- configuration\n- [docs](https://example.com)\n\n"
+
+
+def seed_project(code, members=40, vendors=8, requirements=300, scored=0.5, seed=None, groups=0, tags=0, notes=0):
+    """
+    seed a synthetic project with a full evaluation matrix (every member x applicable requirement x vendor) for
+    benchmarking
+    NOTE: an existing project with the same code is left alone; delete it first to reseed
+    :param code: the project code to create
+    :param members: number of users to add to the <code>:Members group
+    :param vendors: number of vendors to create
+    :param requirements: number of requirements to create
+    :param scored: fraction (0-1) of evaluations given a random score; the rest are left unscored
+    :param seed: random seed so runs can be repeated
+    :param groups: number of requirement groups (<code>:Group n); every requirement applies to one of them and
+        members are split across them with one share left in no group (they see every requirement)
+    :param tags: number of top level priority and category tags; each requirement is tagged with a two level path
+        under one of them (0 for no tags)
+    :param notes: size in characters of the markdown notes added to the scored evaluations (0 for no notes)
+    :return: the project
+    """
+    rnd = random.Random(seed)
+    project = Project.objects.filter(code=code).first()
+    if project:
+        return project
+    with transaction.atomic():
+        project = Project.objects.create(code=code, name=f"Benchmark {code}")
+        members_group, created = Group.objects.get_or_create(name=f"{code}:Members")
+        User.objects.bulk_create([User(username=f"{code}_user{i}") for i in range(members)],
+                                 batch_size=SEED_BATCH_SIZE, ignore_conflicts=True)
+        users = list(User.objects.filter(username__startswith=f"{code}_user").order_by('id'))
+        members_group.user_set.add(*users)
+        ProjectVendor.objects.bulk_create([ProjectVendor(project=project, name=f"Vendor {i}") for i in range(vendors)])
+        ProjectFunctionality.objects.bulk_create([
+            ProjectFunctionality(project=project, description=f"Requirement {i}", order=i + 1)
+            for i in range(requirements)
+        ], batch_size=SEED_BATCH_SIZE)
+        vendor_ids = list(ProjectVendor.objects.filter(project=project).values_list('id', flat=True))
+        requirement_ids = list(ProjectFunctionality.objects.filter(project=project).order_by('id')
+                               .values_list('id', flat=True))
+        if groups:
+            _seed_groups(code, groups, users, requirement_ids)
+        if tags:
+            _seed_tags(tags, requirement_ids)
+        note = (SEED_NOTE * (notes // len(SEED_NOTE) + 1))[:notes] if notes else None
+        note_html = Evaluation(notes=note).render_notes()
+
+        index = ApplicabilityIndex(project)
+        batch = []
+        for user in users:
+            for requirement_id in sorted(index.requirements_for(user.id)):
+                for vendor_id in vendor_ids:
+                    is_scored = rnd.random() < scored
+                    batch.append(Evaluation(user_id=user.id, vendor_id=vendor_id, functionality_id=requirement_id,
+                                            score=rnd.randint(0, 10) if is_scored else None,
+                                            notes=note if is_scored else None,
+                                            notes_html=note_html if is_scored else None))
+                    if len(batch) >= SEED_BATCH_SIZE:
+                        Evaluation.objects.bulk_create(batch)
+                        batch = []
+        Evaluation.objects.bulk_create(batch)
+    return project
+
+
+def _seed_groups(code, groups, users, requirement_ids):
+    """
+    requirement groups for seed_project; member i is in group i % (groups + 1) where the last share is in no group
+    """
+    group_list = [Group.objects.get_or_create(name=f"{code}:Group {g}")[0] for g in range(groups)]
+    memberships = [User.groups.through(user_id=user.id, group_id=group_list[i % (groups + 1)].id)
+                   for i, user in enumerate(users) if i % (groups + 1) < groups]
+    User.groups.through.objects.bulk_create(memberships, batch_size=SEED_BATCH_SIZE)
+    links = [ProjectFunctionality.groups.through(projectfunctionality_id=requirement_id,
+                                                 group_id=group_list[j % groups].id)
+             for j, requirement_id in enumerate(requirement_ids)]
+    ProjectFunctionality.groups.through.objects.bulk_create(links, batch_size=SEED_BATCH_SIZE)
+
+
+def _seed_tags(tags, requirement_ids):
+    """
+    tag trees for seed_project; the link tables are filled directly so requirements are not saved one by one
+    NOTE: tag counts are not maintained; they only order tag autocomplete suggestions
+    """
+    priorities, categories = {}, {}
+    priority_links, category_links = [], []
+    for j, requirement_id in enumerate(requirement_ids):
+        priority = f"size{j % tags}/level{j % 3}"
+        category = f"area{j % tags}/topic{j % 5}"
+        if priority not in priorities:
+            priorities[priority] = PriorityCategory.objects.get_or_create(name=priority)[0].id
+        if category not in categories:
+            categories[category] = FunctionalityCategory.objects.get_or_create(name=category)[0].id
+        priority_links.append(ProjectFunctionality.priorities.through(projectfunctionality_id=requirement_id,
+                                                                      prioritycategory_id=priorities[priority]))
+        category_links.append(ProjectFunctionality.categories.through(projectfunctionality_id=requirement_id,
+                                                                      functionalitycategory_id=categories[category]))
+    ProjectFunctionality.priorities.through.objects.bulk_create(priority_links, batch_size=SEED_BATCH_SIZE)
+    ProjectFunctionality.categories.through.objects.bulk_create(category_links, batch_size=SEED_BATCH_SIZE)
+
+
+def benchmark_client(project):
+    """
+    a test client logged in as the benchmark superuser (<code>_admin) so pages run through the full middleware stack
+    """
+    user, created = User.objects.get_or_create(username=f"{project.code}_admin",
+                                               defaults={'is_staff': True, 'is_superuser': True})
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _get(client, url):
+    """
+    request a page and read all of its content (streaming responses included)
+    :return: the number of bytes returned
+    """
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"[{url}] returned status [{response.status_code}]")
+    if response.streaming:
+        return sum(len(part) for part in response.streaming_content)
+    return len(response.content)
+
+
+def hot_path_scenarios(project):
+    """
+    the hot paths measured by run_benchmarks, keyed by name
+    :param project: the (seeded) project
+    :return: dict of name -> callable with no arguments
+    """
+    client = benchmark_client(project)
+    code = project.code
+    return {
+        'generate_evaluations': lambda: generate_evaluations(code),
+        'export csv': lambda: _get(client, f"/eval/api/export/?project={code}"),
+        'admin changelist (everyone)': lambda: _get(client, f"/admin/eval/evaluation/?user=0&project={code}"),
+        'vendor report page': lambda: _get(client, f"/reports/vendor/?project={code}"),
+    }
+
+
+def measure(fn, repeat=5):
+    """
+    time a callable and record the queries and peak python memory of one extra run
+    NOTE: memory is traced in a separate run so tracing does not slow down the timed runs
+    :param fn: the callable
+    :param repeat: timed runs
+    :return: dict of best_ms, median_ms, queries and peak_kb
+    """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'best_ms': round(min(timings), 3), 'median_ms': round(statistics.median(timings), 3),
+            'queries': len(queries), 'peak_kb': round(peak / 1024, 1)}
+
+
+def run_benchmarks(project, repeat=5, only=None):
+    """
+    measure every hot path for a project
+    :param project: the (seeded) project
+    :param repeat: timed runs per scenario
+    :param only: names of the scenarios to run (all if None)
+    :return: dict of meta (what was measured where) and results (scenario -> measure())
+    """
+    results = {}
+    for name, fn in hot_path_scenarios(project).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(fn, repeat=repeat)
+    return {
+        'meta': {
+            'project': project.code,
+            'members': Group.objects.get(name__iexact=f"{project.code}:Members").user_set.count(),
+            'vendors': ProjectVendor.objects.filter(project=project).count(),
+            'requirements': ProjectFunctionality.objects.filter(project=project).count(),
+            'evaluations': Evaluation.objects.filter(vendor__project=project).count(),
+            'repeat': repeat,
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'created': timezone.now().isoformat(),
+        },
+        'results': results,
+    }
+
+
+def compare_benchmarks(baseline, current, threshold=1.2):
+    """
+    compare two run_benchmarks results (loaded from their json files)
+    :param baseline: the reference results
+    :param current: the new results
+    :param threshold: a scenario regresses when its best time grows by more than this factor or it runs more queries
+    :return: list of dicts (name, baseline_ms, current_ms, ratio, baseline_queries, current_queries, regressed)
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        ratio = result['best_ms'] / base['best_ms'] if base['best_ms'] else None
+        rows.append({
+            'name': name,
+            'baseline_ms': base['best_ms'],
+            'current_ms': result['best_ms'],
+            'ratio': ratio,
+            'baseline_queries': base['queries'],
+            'current_queries': result['queries'],
+            'regressed': (ratio is not None and ratio > threshold) or result['queries'] > base['queries'],
+        })
+    return rows
+
+
+def write_results(results, path):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+
+def read_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def load_scenarios(project, base_url=None):
+    """
+    the dashboard polling paths load_test compares, keyed by name
+    NOTE: in process the sync view runs through the WSGI client handler (one thread per concurrent poller) and the
+        async view through the ASGI handler (one event loop, the queries in eval.async_views.READ_EXECUTOR); with a
+        base_url both are plain http requests to a running server so a WSGI and an ASGI deployment can be compared
+    :param project: the (seeded) project
+    :param base_url: Ex: http://localhost:8000 to test a running server instead of the in process handlers
+    :return: dict of name -> (callable taking no arguments, is async)
+    """
+    sync_url = f"/eval/api/scorecard/{project.code}/"
+    async_url = f"/eval/api/async/scorecard/{project.code}/"
+    if base_url:
+        return {
+            'scorecard (sync view)': (lambda: _http_get(base_url.rstrip('/') + sync_url), False),
+            'scorecard (async view)': (lambda: _http_get(base_url.rstrip('/') + async_url), False),
+        }
+    clients = threading.local()
+    async_client = AsyncClient()
+
+    def wsgi_get():
+        if not hasattr(clients, 'client'):
+            clients.client = Client()
+        return _get(clients.client, sync_url)
+
+    async def asgi_get():
+        response = await async_client.get(async_url)
+        if response.status_code != 200:
+            raise RuntimeError(f"[{async_url}] returned status [{response.status_code}]")
+        return len(response.content)
+    return {'scorecard (wsgi, sync view)': (wsgi_get, False), 'scorecard (asgi, async view)': (asgi_get, True)}
+
+
+def _http_get(url):
+    with urllib.request.urlopen(url) as response:
+        return len(response.read())
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    try:
+        fn()
+        return (time.perf_counter() - start) * 1000, None
+    except Exception as ex:
+        return (time.perf_counter() - start) * 1000, str(ex)
+    finally:
+        connections.close_all()
+
+
+async def _timed_async(fn, semaphore):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await fn()
+            return (time.perf_counter() - start) * 1000, None
+        except Exception as ex:
+            return (time.perf_counter() - start) * 1000, str(ex)
+
+
+async def _run_async(fn, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*[_timed_async(fn, semaphore) for i in range(requests)])
+
+
+def load_test(project, requests=500, concurrency=20, base_url=None, only=None):
+    """
+    fire requests at the dashboard polling paths with a number of them in flight at once
+    :param project: the (seeded) project
+    :param requests: requests per scenario
+    :param concurrency: requests in flight at once
+    :param base_url: test a running server instead of the in process handlers (see load_scenarios)
+    :param only: names of the scenarios to run (all if None)
+    :return: dict of name -> {requests, errors, seconds, per_second, p50_ms, p95_ms, max_ms, error}
+    """
+    results = {}
+    for name, (fn, is_async) in load_scenarios(project, base_url).items():
+        if only and name not in only:
+            continue
+        start = time.perf_counter()
+        if is_async:
+            timings = asyncio.run(_run_async(fn, requests, concurrency))
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                timings = list(executor.map(lambda i: _timed(fn), range(requests)))
+        seconds = time.perf_counter() - start
+        latencies = sorted(elapsed for elapsed, error in timings)
+        errors = [error for elapsed, error in timings if error]
+        results[name] = {
+            'requests': requests,
+            'concurrency': concurrency,
+            'errors': len(errors),
+            'seconds': round(seconds, 3),
+            'per_second': round(requests / seconds, 1),
+            'p50_ms': round(latencies[len(latencies) // 2], 3),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+            'max_ms': round(latencies[-1], 3),
+            'error': errors[0] if errors else None,
+        }
+    return results
+
+
+def time_query(queryset, repeat=5):
+    """
+    evaluate a queryset several times and return the best wall time in milliseconds
+    :param queryset: the queryset to evaluate (cloned each run so the result cache is not used)
+    :param repeat: number of runs
+    :return: best time in ms
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        list(queryset.all())
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def evaluation_index_queries(project):
+    """
+    the query shapes the evaluation admin changelist runs, keyed by a short description
+    :param project: the (seeded) project to build the queries for
+    :return: dict of description -> queryset
+    """
+    user = Group.objects.get(name=f"{project.code}:Members").user_set.first()
+    vendor = ProjectVendor.objects.filter(project=project).first()
+    qs = Evaluation.objects.filter(user=user)
+    return {
+        'changelist (me)': qs[:100],
+        'project filter': qs.filter(vendor__project__code=project.code)[:100],
+        'vendor filter': Evaluation.objects.filter(vendor=vendor)[:100],
+        'has score: not entered': qs.filter(score__isnull=True)[:100],
+        'has score: less than 6': qs.filter(score__lt=6)[:100],
+    }
+
+
+def drop_evaluation_indexes():
+    """
+    remove the evaluation indexes and the project code index so queries can be measured without them
+    NOTE: always call restore_evaluation_indexes() afterwards
+    """
+    with connection.schema_editor() as schema_editor:
+        for index in Evaluation._meta.indexes:
+            schema_editor.remove_index(Evaluation, index)
+        schema_editor.alter_field(Project, *_project_code_fields(indexed=False))
+
+
+def restore_evaluation_indexes():
+    """
+    re-create the indexes removed by drop_evaluation_indexes()
+    """
+    with connection.schema_editor() as schema_editor:
+        for index in Evaluation._meta.indexes:
+            schema_editor.add_index(Evaluation, index)
+        schema_editor.alter_field(Project, *reversed(_project_code_fields(indexed=False)))
+
+
+def _project_code_fields(indexed):
+    """
+    :return: (current field, copy of the field with db_index set to indexed) for Project.code
+    """
+    field = Project._meta.get_field('code')
+    changed = field.clone()
+    changed.db_index = indexed
+    changed.set_attributes_from_name('code')
+    changed.model = Project
+    return field, changed
@@ -0,0 +1,264 @@
+import csv
+import json
+import tempfile
+from django.core.exceptions import ValidationError
+from tagulous.utils import render_tags
+from eval.models import Evaluation, ProjectFunctionality
+from eval.admin import EvaluationResource
+from eval.utils import is_true
+
+# rows fetched from the database per round trip while streaming an export
+EXPORT_CHUNK_SIZE = 2000
+# bytes of each column of the columnar export kept in memory before it is spooled to disk, and read back at a time
+COLUMN_SPOOL_SIZE = 1024 * 1024
+COLUMN_SPOOL_BLOCK = 64 * 1024
+
+
+def _render_integer(value):
+    return "" if value is None else str(int(value))
+
+
+def _render_boolean(value):
+    if value is None:
+        return ""
+    return "1" if value else "0"
+
+
+def _render_text(value):
+    return "" if value is None else str(value)
+
+
+# export column -> (values_list lookup, renderer) matching how EvaluationResource (import-export) renders each field
+# NOTE: functionality__priorities is a tag field; the lookup loads the functionality id and the tag string is filled
+#   in from a map loaded once per export instead of once per row
+EXPORT_COLUMNS = {
+    'id': ('id', _render_text),
+    'user__username': ('user__username', _render_text),
+    'vendor__name': ('vendor__name', _render_text),
+    'functionality__description': ('functionality__description', _render_text),
+    'score': ('score', _render_integer),
+    'confirmed': ('confirmed', _render_boolean),
+    'functionality__priorities': ('functionality_id', None),
+    'notes': ('notes', _render_text),
+}
+# text columns that repeat on most rows; dictionary encoded in the columnar format
+DICTIONARY_COLUMNS = ('user__username', 'vendor__name', 'functionality__description', 'functionality__priorities')
+
+
+class Echo:
+    """
+    file-like object that hands back whatever is written so csv.writer can feed a streaming response
+    """
+    def write(self, value):
+        return value
+
+
+def get_priority_strings(queryset):
+    """
+    load the priority tag string for every requirement referenced by the queryset in one query
+    :param queryset: evaluation queryset being exported
+    :return: dict of functionality id -> tag string (same format tagulous renders for the field)
+    """
+    through = ProjectFunctionality.priorities.through
+    names = {}
+    for functionality_id, name in through.objects.filter(
+            projectfunctionality_id__in=queryset.values('functionality_id')).values_list(
+            'projectfunctionality_id', 'prioritycategory__name'):
+        names.setdefault(functionality_id, []).append(name)
+    return {functionality_id: render_tags(tags) for functionality_id, tags in names.items()}
+
+
+def filter_evaluations(params, queryset=None):
+    """
+    apply the export filters so only the requested evaluations are read from the database
+    :param params: dict like object (request.GET) with any of: project (code), vendor (names), user (usernames),
+        score_min, score_max, confirmed (true/false); vendor and user accept comma separated lists
+    :param queryset: evaluation queryset to filter; defaults to all evaluations
+    :return: the filtered queryset
+    """
+    if queryset is None:
+        queryset = Evaluation.objects.all()
+    if params.get('project'):
+        queryset = queryset.filter(vendor__project__code__iexact=params['project'])
+    vendors = _split_param(params.get('vendor'))
+    if vendors:
+        queryset = queryset.filter(vendor__name__in=vendors)
+    users = _split_param(params.get('user'))
+    if users:
+        queryset = queryset.filter(user__username__in=users)
+    score_min = _score_param(params, 'score_min')
+    if score_min is not None:
+        queryset = queryset.filter(score__gte=score_min)
+    score_max = _score_param(params, 'score_max')
+    if score_max is not None:
+        queryset = queryset.filter(score__lte=score_max)
+    if params.get('confirmed'):
+        queryset = queryset.filter(confirmed=is_true(params['confirmed']))
+    return queryset
+
+
+def get_export_columns(params):
+    """
+    :param params: dict like object (request.GET); columns is a comma separated list of export columns
+    :return: the requested columns in order or the EvaluationResource export_order if none were requested
+    """
+    columns = _split_param(params.get('columns'))
+    if not columns:
+        return list(EvaluationResource._meta.export_order)
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValidationError(f"Unknown export column(s) [{', '.join(unknown)}]! "
+                              f"Valid columns are [{', '.join(EXPORT_COLUMNS)}]")
+    return columns
+
+
+def get_export_format(params):
+    """
+    :param params: dict like object (request.GET); format is one of EXPORT_FORMATS (defaults to csv)
+    :return: the requested format
+    """
+    export_format = (params.get('format') or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValidationError(f"Unknown export format [{export_format}]! "
+                              f"Valid formats are [{', '.join(EXPORT_FORMATS)}]")
+    return export_format
+
+
+def _split_param(value):
+    return [part.strip() for part in value.split(',') if part.strip()] if value else []
+
+
+def _score_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        score = int(value)
+    except ValueError:
+        score = None
+    if score is None or not 0 <= score <= 10:
+        raise ValidationError(f"Parameter [{name}] must be a whole number from 0 to 10; got [{value}]")
+    return score
+
+
+def iter_evaluation_values(queryset=None, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    generate one list of raw database values per evaluation without loading the whole queryset
+    :param queryset: evaluations to export; defaults to all evaluations in the default ordering
+    :param columns: the columns to export in order; defaults to EvaluationResource export_order
+    :param chunk_size: rows fetched per database round trip
+    :return: generator of lists (priorities are already converted to their tag string)
+    """
+    if queryset is None:
+        queryset = Evaluation.objects.all()
+    if columns is None:
+        columns = EvaluationResource._meta.export_order
+    lookups = [EXPORT_COLUMNS[column][0] for column in columns]
+    priority_index = list(columns).index('functionality__priorities') \
+        if 'functionality__priorities' in columns else None
+    priorities = get_priority_strings(queryset) if priority_index is not None else {}
+
+    for values in queryset.values_list(*lookups).iterator(chunk_size=chunk_size):
+        values = list(values)
+        if priority_index is not None:
+            values[priority_index] = priorities.get(values[priority_index], "")
+        yield values
+
+
+def iter_evaluation_rows(queryset=None, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    generate the header and then one list of rendered values per evaluation without loading the whole queryset
+    :param queryset: evaluations to export; defaults to all evaluations in the default ordering
+    :param columns: the columns to export in order; defaults to EvaluationResource export_order
+    :param chunk_size: rows fetched per database round trip
+    :return: generator of lists of strings
+    """
+    if columns is None:
+        columns = EvaluationResource._meta.export_order
+    renderers = [EXPORT_COLUMNS[column][1] or _render_text for column in columns]
+
+    yield list(columns)
+    for values in iter_evaluation_values(queryset, columns, chunk_size):
+        yield [renderer(value) for renderer, value in zip(renderers, values)]
+
+
+def stream_evaluations_csv(queryset=None, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    csv encode iter_evaluation_rows() one line at a time for a StreamingHttpResponse
+    :return: generator of csv lines
+    """
+    writer = csv.writer(Echo())
+    for row in iter_evaluation_rows(queryset, columns, chunk_size):
+        yield writer.writerow(row)
+
+
+def stream_evaluations_jsonl(queryset=None, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    JSON Lines export; one object per evaluation keyed by column with native json types (null for no score)
+    :return: generator of json lines
+    """
+    if columns is None:
+        columns = EvaluationResource._meta.export_order
+    for values in iter_evaluation_values(queryset, columns, chunk_size):
+        yield json.dumps(dict(zip(columns, values)), default=str) + "\n"
+
+
+def stream_evaluations_columns(queryset=None, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    columnar json export (parquet-like) streamed one column at a time:
+        {"columns": [...], "data": {"<column>": [...], ...}, "row_count": n}
+    repeating text columns (DICTIONARY_COLUMNS) are dictionary encoded as {"indices": [...], "dictionary": [...]}
+    NOTE: the rows are read in one pass (one query, so every column sees the same rows) and each column is spooled to
+        a temporary file (kept in memory up to COLUMN_SPOOL_SIZE) until the pass is done
+    :return: generator of json fragments
+    """
+    if columns is None:
+        columns = EvaluationResource._meta.export_order
+    dictionaries = {position: {} for position, column in enumerate(columns) if column in DICTIONARY_COLUMNS}
+    spools = [tempfile.SpooledTemporaryFile(max_size=COLUMN_SPOOL_SIZE, mode='w+') for _ in columns]
+    try:
+        yield '{"columns": %s, "data": {' % json.dumps(list(columns))
+        row_count = 0
+        for chunk in _chunks(iter_evaluation_values(queryset, columns, chunk_size), chunk_size):
+            for position, spool in enumerate(spools):
+                values = (row[position] for row in chunk)
+                if position in dictionaries:
+                    dictionary = dictionaries[position]
+                    values = (dictionary.setdefault(value, len(dictionary)) for value in values)
+                spool.write(('' if row_count == 0 else ', ') +
+                            ', '.join(json.dumps(value, default=str) for value in values))
+            row_count += len(chunk)
+        for position, (column, spool) in enumerate(zip(columns, spools)):
+            yield ('' if position == 0 else ', ') + json.dumps(column) + ': '
+            if position in dictionaries:
+                yield '{"indices": '
+            yield '['
+            spool.seek(0)
+            for block in iter(lambda: spool.read(COLUMN_SPOOL_BLOCK), ''):
+                yield block
+            yield ']'
+            if position in dictionaries:
+                yield ', "dictionary": %s}' % json.dumps(list(dictionaries[position]), default=str)
+        yield '}, "row_count": %d}' % row_count
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def _chunks(values, size):
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# export format -> (streaming function, content type, file extension)
+EXPORT_FORMATS = {
+    'csv': (stream_evaluations_csv, 'text/csv', 'csv'),
+    'jsonl': (stream_evaluations_jsonl, 'application/x-ndjson', 'jsonl'),
+    'columns': (stream_evaluations_columns, 'application/json', 'json'),
+}
@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.core.exceptions import ValidationError
+
+from eval.models import ProjectVendor, ProjectFunctionality, Evaluation
+from eval.scorecard import change_summaries
+from eval.utils import get_project
+
+# rows per update statement when saving the grid
+GRID_BATCH_SIZE = 500
+
+
+def get_score_grid(project, user):
+    """
+    the requirements x vendors score grid of one evaluator for a project in four queries (project, vendors, cells
+    and requirements)
+    :param project: a Project or project code
+    :param user: the evaluator
+    :return: dict of project, vendors [{id, name}] and requirements [{id, name, cells}] where cells lines up with
+        vendors and holds {id, score, confirmed} or None when the evaluator has no cell for that vendor
+    """
+    project = get_project(project)
+    vendors = list(ProjectVendor.objects.active().filter(project=project).order_by('name').values('id', 'name'))
+    cells = {}
+    for evaluation_id, vendor_id, functionality_id, score, confirmed in Evaluation.objects.filter(
+            user=user, vendor__project=project).order_by().values_list('id', 'vendor_id', 'functionality_id', 'score',
+                                                                       'confirmed'):
+        cells[(functionality_id, vendor_id)] = {'id': evaluation_id, 'score': score, 'confirmed': confirmed}
+    requirement_ids = {functionality_id for functionality_id, vendor_id in cells}
+    requirements = []
+    for requirement in ProjectFunctionality.objects.active().filter(id__in=requirement_ids)\
+            .order_by('order', 'description'):
+        requirements.append({
+            'id': requirement.id,
+            'name': str(requirement),
+            'cells': [cells.get((requirement.id, vendor['id'])) for vendor in vendors],
+        })
+    return {'project': project.code, 'name': project.name, 'vendors': vendors, 'requirements': requirements}
+
+
+def _grid_score(value):
+    if value in (None, ''):
+        return None
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Score must be a whole number from 0 to 10; got [{value}]")
+    if not 0 <= score <= 10:
+        raise ValidationError(f"Score must be a whole number from 0 to 10; got [{value}]")
+    return score
+
+
+def save_score_grid(project, user, changes, batch_size=GRID_BATCH_SIZE):
+    """
+    save the edited cells of an evaluator's grid in batched updates
+    NOTE: concurrency is optimistic and checked by value: each change carries the score/confirmed the grid was loaded
+        with (expected) and a cell that no longer has those values was changed somewhere else; it is not saved and is
+        returned as a conflict with its current values so the grid can show them
+    NOTE: bulk_update skips the model signals so the saved changes are moved into the scorecard rows here, in the
+        same transaction (see eval.scorecard.change_summaries)
+    :param project: a Project or project code
+    :param user: the evaluator; only their own cells of the project can be saved
+    :param changes: list of dicts {id, score, confirmed, expected: {score, confirmed}}
+    :param batch_size: rows per update statement
+    :return: dict of saved (count) and conflicts [{id, score, confirmed}]
+    """
+    project = get_project(project)
+    parsed = {}
+    for change in changes:
+        try:
+            evaluation_id = int(change['id'])
+            expected = change.get('expected') or {}
+            parsed[evaluation_id] = (_grid_score(change.get('score')), bool(change.get('confirmed')),
+                                     _grid_score(expected.get('score')), bool(expected.get('confirmed')))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValidationError(f"Invalid grid change [{change}]! Pass id, score, confirmed and expected")
+
+    with transaction.atomic():
+        evaluations = Evaluation.objects.select_for_update().filter(id__in=parsed, user=user, vendor__project=project)\
+            .only('id', 'vendor_id', 'functionality_id', 'score', 'confirmed')
+        found = set()
+        changed = []
+        summary_changes = []
+        conflicts = []
+        for evaluation in evaluations:
+            found.add(evaluation.id)
+            score, confirmed, expected_score, expected_confirmed = parsed[evaluation.id]
+            if (evaluation.score, evaluation.confirmed) != (expected_score, expected_confirmed):
+                conflicts.append({'id': evaluation.id, 'score': evaluation.score, 'confirmed': evaluation.confirmed})
+            elif (evaluation.score, evaluation.confirmed) != (score, confirmed):
+                cell = (evaluation.vendor_id, evaluation.functionality_id, user.id)
+                summary_changes.append((cell + (evaluation.score, evaluation.confirmed), cell + (score, confirmed)))
+                evaluation.score, evaluation.confirmed = score, confirmed
+                changed.append(evaluation)
+        missing = set(parsed) - found
+        if missing:
+            raise ValidationError(f"Evaluation(s) [{', '.join(str(i) for i in sorted(missing))}] are not yours to edit "
+                                  f"in project [{project.code}]!")
+        Evaluation.objects.bulk_update(changed, ['score', 'confirmed'], batch_size=batch_size)
+        change_summaries(summary_changes)
+    return {'saved': len(changed), 'conflicts': conflicts}
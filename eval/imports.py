@@ -0,0 +1,291 @@
+import csv
+import io
+from markdown import Markdown
+from markdownx.settings import MARKDOWNX_MARKDOWN_EXTENSIONS, MARKDOWNX_MARKDOWN_EXTENSION_CONFIGS
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+
+from eval.models import ProjectVendor, ProjectFunctionality, Evaluation
+from eval.scorecard import refresh_project_summary
+from eval.utils import get_project, TRUE_VALUES
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# rows written per update statement
+IMPORT_CHUNK_SIZE = 1000
+# rows per notes bulk_update; its CASE WHEN statements get slower per row the bigger they are
+IMPORT_NOTES_CHUNK_SIZE = 200
+# most row errors reported back; the import stops collecting after this many
+IMPORT_MAX_ERRORS = 100
+FALSE_VALUES = ('', '0', 'false', 'no', 'off')
+# columns that name the evaluation (the export columns) and the ones an import can change
+KEY_COLUMNS = ('user__username', 'vendor__name', 'functionality__description')
+VALUE_COLUMNS = ('score', 'confirmed', 'notes')
+IMPORT_FORMATS = ('csv', 'xlsx')
+# lookup value of a name shared by more than one vendor/requirement of the project; rows must use the id instead
+AMBIGUOUS = -1
+
+
+def get_import_format(file_name, import_format=None):
+    """
+    :param file_name: the uploaded file name (the extension picks the format)
+    :param import_format: csv or xlsx to override the extension
+    :return: the import format
+    """
+    import_format = (import_format or file_name.rsplit('.', 1)[-1]).lower()
+    if import_format not in IMPORT_FORMATS:
+        raise ValidationError(f"Unknown import format [{import_format}]! Valid formats are "
+                              f"[{', '.join(IMPORT_FORMATS)}]")
+    if import_format == 'xlsx' and openpyxl is None:
+        raise ValidationError("Importing xlsx needs openpyxl; pip install openpyxl or upload csv")
+    return import_format
+
+
+def iter_import_rows(source, import_format):
+    """
+    read an upload one row at a time
+    :param source: binary file object (the upload or an open file)
+    :param import_format: csv or xlsx
+    :return: generator of dicts of column -> value; the first row holds the column names
+    """
+    if import_format == 'xlsx':
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(column).strip() if column is not None else '' for column in next(rows, ())]
+            for row in rows:
+                if any(value not in (None, '') for value in row):
+                    yield dict(zip(header, row))
+        finally:
+            workbook.close()
+    else:
+        for row in csv.DictReader(io.TextIOWrapper(source, encoding='utf-8-sig', newline='')):
+            yield {(column or '').strip(): value for column, value in row.items()}
+
+
+def _lookup(pairs):
+    """
+    :return: dict of name -> id where names used more than once map to AMBIGUOUS
+    """
+    lookup = {}
+    for name, object_id in pairs:
+        lookup[name] = AMBIGUOUS if name in lookup else object_id
+    return lookup
+
+
+def _import_id(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"id must be a number; got [{value}]")
+
+
+def _import_score(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"score must be a whole number from 0 to 10; got [{value}]")
+    if not score.is_integer() or not 0 <= score <= 10:
+        raise ValueError(f"score must be a whole number from 0 to 10; got [{value}]")
+    return int(score)
+
+
+def _import_boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = '' if value is None else str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"confirmed must be true or false; got [{value}]")
+
+
+def _import_notes(value):
+    if value is None:
+        return None
+    text = str(value)
+    return text if text.strip() else None
+
+
+def _notes_renderer():
+    """
+    :return: function rendering notes to html the same way as Evaluation.render_notes()
+    NOTE: markdownify builds a new Markdown (and loads its extensions) for every call which is most of the time of
+        rendering thousands of notes; the import renders them all with one instance reset between notes
+    """
+    markdown = Markdown(extensions=MARKDOWNX_MARKDOWN_EXTENSIONS,
+                        extension_configs=MARKDOWNX_MARKDOWN_EXTENSION_CONFIGS)
+    return lambda notes: markdown.reset().convert(str(notes)) if notes else notes
+
+
+class EvaluationImport:
+    """
+    imports scores, confirmed flags and notes for the evaluations of one project from export shaped rows
+        - rows are matched by user__username, vendor__name and functionality__description (or by id when those are
+          left out) through lookup dicts loaded once, so there are no per row queries
+        - only the value columns present in the file are changed; a file without notes leaves notes alone
+        - every row is validated before anything is written; any error means nothing is written
+    """
+    def __init__(self, project, user=None):
+        """
+        :param project: a Project or project code
+        :param user: limit the import to the cells of this evaluator (None for staff imports of any cell)
+        """
+        self.project = get_project(project)
+        self.user = user
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.vendors = _lookup(ProjectVendor.objects.filter(project=self.project).order_by()
+                              .values_list('name', 'id'))
+        self.requirements = _lookup(ProjectFunctionality.objects.filter(project=self.project).order_by()
+                                    .values_list('description', 'id'))
+        cells = Evaluation.objects.filter(vendor__project=self.project).order_by()
+        if user is not None:
+            cells = cells.filter(user=user)
+        self.cells = {}
+        self.keys = {}
+        for evaluation_id, user_id, vendor_id, functionality_id, score, confirmed, notes in cells.values_list(
+                'id', 'user_id', 'vendor_id', 'functionality_id', 'score', 'confirmed', 'notes'):
+            self.cells[evaluation_id] = (score, confirmed, notes)
+            self.keys[(user_id, vendor_id, functionality_id)] = evaluation_id
+        self.errors = []
+        self.error_count = 0
+        self.changes = []
+        self.row_count = 0
+
+    def error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def resolve(self, row):
+        """
+        :return: the evaluation id a row refers to
+        """
+        row_id = _import_id(row.get('id'))
+        if all(row.get(column) not in (None, '') for column in KEY_COLUMNS):
+            names = [str(row[column]).strip() for column in KEY_COLUMNS]
+            ids = (self.users.get(names[0]), self.vendors.get(names[1]), self.requirements.get(names[2]))
+            # an id settles names that are used more than once
+            if row_id is None or AMBIGUOUS not in ids:
+                for name, found, column in zip(names, ids, KEY_COLUMNS):
+                    if found is None:
+                        raise ValueError(f"{column} [{name}] was not found in project [{self.project.code}]")
+                    if found == AMBIGUOUS:
+                        raise ValueError(f"{column} [{name}] is used more than once in project "
+                                         f"[{self.project.code}]; pass the id instead")
+                evaluation_id = self.keys.get(ids)
+                if evaluation_id is None:
+                    raise ValueError(f"no evaluation of [{names[0]}] for [{names[1]}] and [{names[2]}] you can "
+                                     f"import")
+                if row_id is not None and row_id != evaluation_id:
+                    raise ValueError(f"id [{row_id}] does not match the evaluation of [{names[0]}] for "
+                                     f"[{names[1]}] and [{names[2]}]")
+                return evaluation_id
+        if row_id is None:
+            raise ValueError(f"pass either id or {', '.join(KEY_COLUMNS)}")
+        if row_id not in self.cells:
+            raise ValueError(f"evaluation [{row_id}] is not one you can import in project [{self.project.code}]")
+        return row_id
+
+    def read(self, rows):
+        """
+        validate the rows and work out what would change (the diff); nothing is written
+        :param rows: iterable of dicts (see iter_import_rows)
+        :return: self
+        """
+        seen = set()
+        columns = None
+        # row 1 is the header
+        for row_number, row in enumerate(rows, start=2):
+            if columns is None:
+                columns = [column for column in VALUE_COLUMNS if column in row]
+                if not columns:
+                    raise ValidationError(f"No columns to import! Include any of [{', '.join(VALUE_COLUMNS)}]")
+            self.row_count += 1
+            try:
+                evaluation_id = self.resolve(row)
+                if evaluation_id in seen:
+                    raise ValueError(f"evaluation [{evaluation_id}] is in the file more than once")
+                seen.add(evaluation_id)
+                current = dict(zip(VALUE_COLUMNS, self.cells[evaluation_id]))
+                current['notes'] = _import_notes(current['notes'])
+                new = dict(current)
+                if 'score' in columns:
+                    new['score'] = _import_score(row.get('score'))
+                if 'confirmed' in columns:
+                    new['confirmed'] = _import_boolean(row.get('confirmed'))
+                if 'notes' in columns:
+                    new['notes'] = _import_notes(row.get('notes'))
+            except ValueError as ex:
+                self.error(row_number, str(ex))
+                continue
+            changed = {column: [current[column], new[column]] for column in columns
+                       if current[column] != new[column]}
+            if changed:
+                self.changes.append({'id': evaluation_id, 'row': row_number, 'changes': changed})
+        return self
+
+    def apply(self, chunk_size=IMPORT_CHUNK_SIZE, notes_chunk_size=IMPORT_NOTES_CHUNK_SIZE):
+        """
+        write the changes found by read() in chunks and refresh the project scorecard
+        NOTE: score and confirmed only have a few possible values so the changes are grouped by their new values and
+            written with one update per group and chunk of ids (bulk_update's CASE WHEN per row is several times
+            slower); notes are mostly unique so they go through chunked bulk_update with the html rendered here as
+            bulk_update does not run Evaluation.save()
+        :return: the number of evaluations updated
+        """
+        if self.errors:
+            raise ValidationError(f"The import has {self.error_count} error(s); nothing was written")
+        by_values = {}
+        notes = []
+        render = _notes_renderer()
+        for change in self.changes:
+            values = change['changes']
+            if 'notes' in values:
+                notes.append(Evaluation(id=change['id'], notes=values['notes'][1],
+                                        notes_html=render(values['notes'][1])))
+            group = tuple((column, values[column][1]) for column in ('score', 'confirmed') if column in values)
+            if group:
+                by_values.setdefault(group, []).append(change['id'])
+        with transaction.atomic():
+            for group, ids in by_values.items():
+                for start in range(0, len(ids), chunk_size):
+                    Evaluation.objects.filter(id__in=ids[start:start + chunk_size]).update(**dict(group))
+            Evaluation.objects.bulk_update(notes, ['notes', 'notes_html'], batch_size=notes_chunk_size)
+            if self.changes:
+                refresh_project_summary(self.project)
+        return len(self.changes)
+
+    def result(self, dry_run, updated=0):
+        """
+        :return: dict for the api and command output: rows, changed, updated, error_count, errors (the first
+            IMPORT_MAX_ERRORS) and the diff
+        """
+        return {'project': self.project.code, 'dry_run': dry_run, 'rows': self.row_count,
+                'changed': len(self.changes), 'updated': updated, 'error_count': self.error_count,
+                'errors': self.errors, 'diff': self.changes}
+
+
+def import_evaluations(project, source, import_format, user=None, dry_run=False):
+    """
+    validate an upload and apply it (or only report the diff when dry_run)
+    :param project: a Project or project code
+    :param source: binary file object
+    :param import_format: csv or xlsx (see get_import_format)
+    :param user: limit the import to the cells of this evaluator; None for any cell of the project
+    :param dry_run: only validate and report what would change
+    :return: EvaluationImport.result()
+    """
+    evaluation_import = EvaluationImport(project, user=user).read(iter_import_rows(source, import_format))
+    if dry_run or evaluation_import.errors:
+        return evaluation_import.result(dry_run=dry_run)
+    return evaluation_import.result(dry_run=False, updated=evaluation_import.apply())
@@ -0,0 +1,208 @@
+import logging
+import math
+import tempfile
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from eval.models import Job
+from eval.utils import generate_evaluations, is_true
+from eval.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, filter_evaluations, get_export_columns, get_export_format
+
+log = logging.getLogger("eval.jobs")
+
+# where export job results are written in default storage
+JOB_RESULT_DIR = 'jobs'
+# running jobs report they are alive at least this often (seconds) while they make progress
+JOB_HEARTBEAT_SECONDS = 30
+# running jobs silent for longer than this (seconds; EVAL_JOB_STALE_SECONDS) lost their worker and are requeued
+JOB_STALE_SECONDS = getattr(settings, 'EVAL_JOB_STALE_SECONDS', 15 * 60)
+
+
+class JobCancelled(Exception):
+    """
+    raised from a progress callback when someone asked for the running job to be cancelled
+    """
+    pass
+
+
+def enqueue_job(kind, params=None, user=None):
+    """
+    queue a job for the worker; parameters are validated now so bad requests fail before they are queued
+    :param kind: Job.GENERATE or Job.EXPORT
+    :param params: dict of parameters for the job (generate: project_code, dry_run; export: the export api params)
+    :param user: the user queueing the job
+    :return: the queued job
+    """
+    params = dict(params or {})
+    if kind == Job.GENERATE:
+        if not params.get('project_code'):
+            raise ValidationError("A project code is required to generate evaluations")
+    elif kind == Job.EXPORT:
+        get_export_format(params)
+        get_export_columns(params)
+        filter_evaluations(params)
+    else:
+        raise ValidationError(f"Unknown job kind [{kind}]!")
+    return Job.objects.create(kind=kind, params=params,
+                              created_by=user if user is not None and user.is_authenticated else None)
+
+
+def cancel_job(job):
+    """
+    cancel a job; queued jobs are cancelled right away, running jobs stop at their next progress update
+    :param job: the job to cancel
+    :return: the job refreshed from the database
+    """
+    if Job.objects.filter(id=job.id, status=Job.QUEUED).update(status=Job.CANCELLED, finished=timezone.now()):
+        log.info(f"cancelled queued job [{job}]")
+    else:
+        Job.objects.filter(id=job.id, status=Job.RUNNING).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale_jobs(stale_seconds=JOB_STALE_SECONDS):
+    """
+    reclaim running jobs whose worker stopped reporting (killed or crashed); they are queued again (generate keeps
+    the batches already written and export starts over) unless a cancel was requested, then they are cancelled
+    :param stale_seconds: seconds without a heartbeat after which a running job is given up on
+    :return: the number of jobs reclaimed
+    """
+    now = timezone.now()
+    limit = now - timedelta(seconds=stale_seconds)
+    stale = Job.objects.filter(Q(heartbeat__lt=limit) | Q(heartbeat__isnull=True, started__lt=limit),
+                               status=Job.RUNNING)
+    cancelled = stale.filter(cancel_requested=True).update(
+        status=Job.CANCELLED, finished=now, message="Cancelled; the worker running it stopped")
+    requeued = stale.filter(cancel_requested=False).update(
+        status=Job.QUEUED, progress=0, started=None, heartbeat=None,
+        message=f"Requeued; the worker running it stopped reporting for over {stale_seconds} seconds")
+    if cancelled or requeued:
+        log.warning(f"reclaimed stale running jobs: {requeued} requeued, {cancelled} cancelled")
+    return cancelled + requeued
+
+
+def claim_next_job():
+    """
+    take the oldest queued job (after requeueing stale running ones); the status is switched with a conditional update
+    so only one worker (thread or process) can win a job without needing row locks or a broker
+    :return: the claimed job or None if nothing is queued
+    """
+    requeue_stale_jobs()
+    for job_id in Job.objects.filter(status=Job.QUEUED).order_by('created', 'id').values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.RUNNING, started=now, heartbeat=now):
+            return Job.objects.get(id=job_id)
+    return None
+
+
+class JobProgress:
+    """
+    progress callback for a running job; saves the percent complete when it changes (and the heartbeat at least every
+    JOB_HEARTBEAT_SECONDS) and raises JobCancelled when a cancel was requested
+    NOTE: call it outside of any transaction of the job (generate_evaluations commits each batch first) so pollers
+        see the progress right away and a cancel does not roll it back
+    """
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, done, total):
+        percent = int(done * 100 / total) if total else 100
+        now = timezone.now()
+        if percent != self.job.progress or self.job.heartbeat is None or \
+                now - self.job.heartbeat >= timedelta(seconds=JOB_HEARTBEAT_SECONDS):
+            self.job.progress = percent
+            self.job.heartbeat = now
+            Job.objects.filter(id=self.job.id).update(progress=percent, heartbeat=now)
+        if Job.objects.filter(id=self.job.id, cancel_requested=True).exists():
+            raise JobCancelled(f"Job [{self.job.id}] was cancelled")
+
+
+def run_job(job):
+    """
+    run a claimed job to completion and record the outcome on the job row
+    NOTE: called from worker threads; database connections are cleaned up before and after
+    :param job: a job in the running state (see claim_next_job)
+    :return: the finished job
+    """
+    close_old_connections()
+    try:
+        log.info(f"running job [{job}]")
+        progress = JobProgress(job)
+        if job.kind == Job.GENERATE:
+            job.message = generate_evaluations(job.params['project_code'], dry_run=is_true(job.params.get('dry_run')),
+                                               progress=progress)
+        elif job.kind == Job.EXPORT:
+            job.result_file = run_export(job, progress)
+            job.message = "done!\n"
+        else:
+            raise ValidationError(f"Unknown job kind [{job.kind}]!")
+        job.status = Job.DONE
+        job.progress = 100
+    except JobCancelled as ex:
+        job.status = Job.CANCELLED
+        job.message = str(ex)
+    except Exception as ex:
+        log.exception(f"job [{job}] failed")
+        job.status = Job.FAILED
+        job.message = str(ex)
+    finally:
+        job.finished = timezone.now()
+        job.save(update_fields=['status', 'progress', 'message', 'result_file', 'finished'])
+        close_old_connections()
+    return job
+
+
+def run_export(job, progress):
+    """
+    stream an export to a temporary file and then into default storage
+    :param job: the export job; params are the export api parameters
+    :param progress: JobProgress callback, called after each chunk of rows
+    :return: the name of the stored result
+    """
+    params = job.params
+    export_format = get_export_format(params)
+    columns = get_export_columns(params)
+    queryset = filter_evaluations(params)
+    stream, content_type, extension = EXPORT_FORMATS[export_format]
+    total = queryset.count()
+    # csv/jsonl stream one part per row (plus the csv header); columns streams a few parts per chunk of each column
+    if export_format == 'columns':
+        total_parts = len(columns) * (math.ceil(total / EXPORT_CHUNK_SIZE) + 3)
+    else:
+        total_parts = total + 1
+    # report about every percent
+    step = max(1, total_parts // 100)
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as tmp:
+        done = 0
+        for part in stream(queryset, columns):
+            tmp.write(part)
+            done += 1
+            if done % step == 0:
+                progress(min(done, total_parts), total_parts)
+        tmp.seek(0)
+        return default_storage.save(f"{JOB_RESULT_DIR}/{job.id}.{extension}", File(tmp))
+
+
+def job_status(job):
+    """
+    :return: dict describing the job for the polling api
+    """
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'cancel_requested': job.cancel_requested,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+        'has_result': job.status == Job.DONE,
+    }
@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.contrib.auth.models import Group, User
+
+from eval.models import Project
+
+# the signals in eval.signals clear these when projects, groups or users change; the timeout only bounds how stale
+#   another process (with its own local memory cache) can get
+LOOKUP_CACHE_TIMEOUT = 60 * 10
+PROJECT_LOOKUPS_KEY = 'eval:lookups:projects'
+PROJECT_IDS_KEY = 'eval:lookups:project_ids'
+GROUP_LOOKUPS_KEY = 'eval:lookups:groups'
+USER_LOOKUPS_KEY = 'eval:lookups:users'
+# most users returned by one autocomplete search
+USER_SEARCH_LIMIT = 20
+
+
+def project_lookups():
+    """
+    :return: list of (code, name) of the active projects ordered by name
+    """
+    return cache.get_or_set(PROJECT_LOOKUPS_KEY, lambda: list(
+        Project.objects.active().order_by('name').values_list('code', 'name')), LOOKUP_CACHE_TIMEOUT)
+
+
+def project_ids():
+    """
+    :return: dict of lowercase code -> id of every project (codes are matched case insensitive)
+    """
+    return cache.get_or_set(PROJECT_IDS_KEY, lambda: {code.lower(): project_id for project_id, code in
+                                                      Project.objects.order_by('id').values_list('id', 'code')},
+                            LOOKUP_CACHE_TIMEOUT)
+
+
+def group_lookups():
+    """
+    :return: list of (id, name) of the requirement groups (project:group excluding project:Members) ordered by name
+    """
+    return cache.get_or_set(GROUP_LOOKUPS_KEY, lambda: list(
+        Group.objects.filter(name__icontains=":").exclude(name__iendswith=":Members").order_by('name')
+        .values_list('id', 'name')), LOOKUP_CACHE_TIMEOUT)
+
+
+def user_lookups():
+    """
+    :return: list of (id, username) of every user ordered by username
+    """
+    return cache.get_or_set(USER_LOOKUPS_KEY, lambda: list(
+        User.objects.order_by('username').values_list('id', 'username')), LOOKUP_CACHE_TIMEOUT)
+
+
+def search_users(term, exclude_id=None, limit=USER_SEARCH_LIMIT):
+    """
+    autocomplete search of the cached user list; usernames starting with the term come before ones only containing it
+    :param term: part of a username (case insensitive)
+    :param exclude_id: a user id to leave out (the current user is already the "Me" choice)
+    :param limit: the most users to return
+    :return: list of (id, username)
+    """
+    term = (term or '').strip().lower()
+    users = [(user_id, username) for user_id, username in user_lookups()
+             if user_id != exclude_id and term in username.lower()]
+    users.sort(key=lambda user: not user[1].lower().startswith(term))
+    return users[:limit]
+
+
+def get_username(user_id):
+    """
+    :return: the username of a user id from the cached user list or None
+    """
+    return next((username for lookup_id, username in user_lookups() if str(lookup_id) == str(user_id)), None)
+
+
+def clear_project_lookups():
+    cache.delete_many([PROJECT_LOOKUPS_KEY, PROJECT_IDS_KEY])
+
+
+def clear_group_lookups():
+    cache.delete(GROUP_LOOKUPS_KEY)
+
+
+def clear_user_lookups():
+    cache.delete(USER_LOOKUPS_KEY)
@@ -0,0 +1,148 @@
+from django.core.management.base import BaseCommand, CommandError
+from argparse import RawTextHelpFormatter
+from eval.benchmark import seed_project, time_query, evaluation_index_queries, drop_evaluation_indexes, \
+    restore_evaluation_indexes, run_benchmarks, compare_benchmarks, write_results, read_results, load_test
+
+
+class Command(BaseCommand):
+    help = """
+        usage: ./manage.py benchmark [option]
+        --------------------------------------
+        usage: ./manage.py benchmark indexes [--project code] [--members n] [--vendors n] [--requirements n]
+        example: ./manage.py benchmark indexes --members 200 --vendors 10 --requirements 250
+        usage: ./manage.py benchmark seed [--project code] [--members n] [--vendors n] [--requirements n]
+                   [--groups n] [--tags n] [--notes n] [--scored fraction]
+        example: ./manage.py benchmark seed --project big --members 200 --groups 3 --tags 4 --notes 400
+        usage: ./manage.py benchmark run [--project code] [--repeat n] [--only name] [--output file.json]
+        example: ./manage.py benchmark run --project big --output before.json
+        usage: ./manage.py benchmark compare baseline.json current.json [--threshold factor]
+        example: ./manage.py benchmark compare before.json after.json --threshold 1.2
+        usage: ./manage.py benchmark load [--project code] [--requests n] [--concurrency n] [--url base_url]
+        example: ./manage.py benchmark load --requests 2000 --concurrency 50
+
+        options
+        --------
+        indexes - seeds a synthetic project (if it does not exist yet) and prints the EXPLAIN plan and best timing
+                  of the evaluation admin queries without (before) and with (after) the evaluation indexes
+        seed - seeds a synthetic project (left alone if it already exists) with requirement groups, tag trees and
+               notes of the given size
+        run - seeds the project if needed and measures generate_evaluations, the csv export, the evaluation admin
+              changelist and the vendor report page: best/median ms, query count and peak python memory; the
+              results are printed and written as json with --output
+        compare - compares two run outputs; errors (exit status 1) when a scenario is slower by more than the
+                  threshold factor or runs more queries
+        load - seeds the project if needed and polls the vendor scorecard with --concurrency requests in flight:
+               the sync view through the WSGI handler against the async view through the ASGI handler (in process),
+               or both views of a running server with --url; prints requests per second and latency percentiles
+
+        NOTE: the indexes are dropped and re-created on the configured database; do not run against production
+        NOTE: seed and run write to the configured database; use a copy or a development database
+    """
+
+    def create_parser(self, *args, **kwargs):
+        parser = super(Command, self).create_parser(*args, **kwargs)
+        parser.formatter_class = RawTextHelpFormatter
+        return parser
+
+    def add_arguments(self, parser):
+        parser.add_argument('option', nargs='+', type=str)
+        parser.add_argument('--project', default='bench', help='project code to seed/benchmark')
+        parser.add_argument('--members', type=int, default=40)
+        parser.add_argument('--vendors', type=int, default=8)
+        parser.add_argument('--requirements', type=int, default=300)
+        parser.add_argument('--repeat', type=int, default=5, help='runs per query; the best time is reported')
+        parser.add_argument('--groups', type=int, default=0, help='seed: requirement groups to split members into')
+        parser.add_argument('--tags', type=int, default=0, help='seed: top level priority/category tags')
+        parser.add_argument('--notes', type=int, default=0, help='seed: characters of notes on scored evaluations')
+        parser.add_argument('--scored', type=float, default=0.5, help='seed: fraction of evaluations scored')
+        parser.add_argument('--only', action='append', help='run/load: only this scenario (repeat for more)')
+        parser.add_argument('--output', help='run/load: write the results to this json file')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='compare: slowdown factor that counts as a regression')
+        parser.add_argument('--requests', type=int, default=500, help='load: requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=20, help='load: requests in flight at once')
+        parser.add_argument('--url', help='load: base url of a running server Ex: http://localhost:8000')
+
+    def handle(self, *args, **options):
+        params = options['option']
+        if "indexes" in params:
+            self.benchmark_indexes(options)
+        elif "seed" in params:
+            project = self.seed(options)
+            self.stdout.write(self.style.SUCCESS(f'project: {project.code}'))
+            self.stdout.write(self.style.SUCCESS('done!'))
+        elif "run" in params:
+            self.run(options)
+        elif "load" in params:
+            self.load(options)
+        elif "compare" in params and len(params) >= 3:
+            self.compare(params[1], params[2], options['threshold'])
+        else:
+            self.stdout.write(self.style.SUCCESS(self.help))
+
+    def benchmark_indexes(self, options):
+        project = seed_project(options['project'], members=options['members'], vendors=options['vendors'],
+                               requirements=options['requirements'], seed=1)
+        self.stdout.write(self.style.SUCCESS(f'project: {project.code}'))
+        drop_evaluation_indexes()
+        try:
+            before = self.run_queries(project, 'before', options['repeat'])
+        finally:
+            restore_evaluation_indexes()
+        after = self.run_queries(project, 'after', options['repeat'])
+        self.stdout.write(self.style.SUCCESS('summary (best ms)'))
+        for name in before:
+            self.stdout.write(f'     {name:<30} before: {before[name]:10.2f}  after: {after[name]:10.2f}')
+
+    def run_queries(self, project, label, repeat):
+        timings = {}
+        for name, queryset in evaluation_index_queries(project).items():
+            timings[name] = time_query(queryset, repeat=repeat)
+            self.stdout.write(self.style.SUCCESS(f'[{label}] {name}: {timings[name]:.2f} ms'))
+            self.stdout.write(queryset.explain())
+        return timings
+
+    def seed(self, options):
+        return seed_project(options['project'], members=options['members'], vendors=options['vendors'],
+                            requirements=options['requirements'], scored=options['scored'], seed=1,
+                            groups=options['groups'], tags=options['tags'], notes=options['notes'])
+
+    def run(self, options):
+        project = self.seed(options)
+        results = run_benchmarks(project, repeat=options['repeat'], only=options['only'])
+        self.stdout.write(self.style.SUCCESS(f'project: {project.code} ({results["meta"]["evaluations"]} evaluations)'))
+        for name, result in results['results'].items():
+            self.stdout.write(f'     {name:<30} best: {result["best_ms"]:10.2f} ms  '
+                              f'median: {result["median_ms"]:10.2f} ms  queries: {result["queries"]:5}  '
+                              f'peak: {result["peak_kb"]:10.1f} kb')
+        if options['output']:
+            write_results(results, options['output'])
+            self.stdout.write(self.style.SUCCESS(f'results written to {options["output"]}'))
+
+    def load(self, options):
+        project = self.seed(options)
+        results = load_test(project, requests=options['requests'], concurrency=options['concurrency'],
+                            base_url=options['url'], only=options['only'])
+        self.stdout.write(self.style.SUCCESS(f'project: {project.code} ({options["requests"]} requests, '
+                                             f'{options["concurrency"]} at once)'))
+        for name, result in results.items():
+            line = f'     {name:<30} {result["per_second"]:10.1f} req/s  p50: {result["p50_ms"]:10.2f} ms' \
+                   f'  p95: {result["p95_ms"]:10.2f} ms  max: {result["max_ms"]:10.2f} ms  errors: {result["errors"]}'
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+            if result['error']:
+                self.stdout.write(self.style.ERROR(f'     first error: {result["error"]}'))
+        if options['output']:
+            write_results(results, options['output'])
+            self.stdout.write(self.style.SUCCESS(f'results written to {options["output"]}'))
+
+    def compare(self, baseline_path, current_path, threshold):
+        rows = compare_benchmarks(read_results(baseline_path), read_results(current_path), threshold=threshold)
+        for row in rows:
+            ratio = f'{row["ratio"]:6.2f}x' if row['ratio'] is not None else '     -'
+            line = f'     {row["name"]:<30} {row["baseline_ms"]:10.2f} -> {row["current_ms"]:10.2f} ms {ratio}' \
+                   f'  queries: {row["baseline_queries"]} -> {row["current_queries"]}'
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+        regressed = [row['name'] for row in rows if row['regressed']]
+        if regressed:
+            raise CommandError(f"Regressed: {', '.join(regressed)}")
+        self.stdout.write(self.style.SUCCESS('no regressions'))
@@ -1,11 +1,22 @@
 from django.core.management.base import BaseCommand
 from argparse import RawTextHelpFormatter
 from eval.models import *
-from eval.utils import generate_evaluations
+from eval.utils import generate_evaluations, render_evaluation_notes
+from eval.imports import import_evaluations, get_import_format
+from eval.scorecard import refresh_project_summary
+from eval.analytics import project_statistics, AGREEMENT_THRESHOLD
+from eval.progress import project_progress
 
 from django.contrib.auth.models import User
 # from django.db import connection
 
+# cells listed by the statistics option
+STATISTICS_CELLS = 10
+
+
+def _number(value):
+    return '-' if value is None else f'{value:.2f}'
+
 
 class Command(BaseCommand):
     project_code = None
@@ -13,12 +24,32 @@ class Command(BaseCommand):
     help = """
         usage: ./manage.py evaluations [option]
         --------------------------------------
-        usage: ./manage.py evaluations generate project_code
+        usage: ./manage.py evaluations generate project_code [--dry-run]
         example: ./manage.py evaluations generate auth
+        usage: ./manage.py evaluations scorecard project_code
+        example: ./manage.py evaluations scorecard auth
+        usage: ./manage.py evaluations notes [project_code] [--all]
+        example: ./manage.py evaluations notes auth
+        usage: ./manage.py evaluations import project_code file.csv|file.xlsx [--dry-run]
+        example: ./manage.py evaluations import auth scores.xlsx --dry-run
+        usage: ./manage.py evaluations statistics project_code
+        example: ./manage.py evaluations statistics auth
+        usage: ./manage.py evaluations progress project_code
+        example: ./manage.py evaluations progress auth
 
         options
         --------
         generate - generates evaluations for the specified project
+        --dry-run - only report how many evaluations would be generated; nothing is written
+        scorecard - rebuilds the vendor scorecard summary rows (progress counters included) for the specified project
+        notes - renders the stored notes html of evaluations saved before it existed (all projects if none passed)
+        --all - render the notes html of every evaluation again (after changing the markdown settings)
+        import - updates score, confirmed and notes from a file shaped like the export; rows are matched by
+                 user__username, vendor__name and functionality__description (or id); nothing is written if any row
+                 has an error; --dry-run lists the changes instead
+        statistics - prints the agreement of each vendor, the bias of each evaluator and the cells people disagree
+                     on most
+        progress - prints how many evaluations each user has scored, least complete last
         
         NOTE: errors if project code is not found
     """
@@ -30,12 +61,77 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('option', nargs='+', type=str)
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='report counts only; do not write anything')
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help='notes: render every evaluation again instead of only the missing ones')
 
     def handle(self, *args, **options):
         params = options['option']
         if "generate" in params and len(params) >= 2:
             self.project_code = params[1]
             self.stdout.write(self.style.SUCCESS(f'project: {str(self.project_code)}'))
-            self.stdout.write(self.style.SUCCESS('%s' % generate_evaluations(self.project_code)))
+            self.stdout.write(self.style.SUCCESS('%s' % generate_evaluations(self.project_code,
+                                                                             dry_run=options['dry_run'])))
+        elif "scorecard" in params and len(params) >= 2:
+            self.project_code = params[1]
+            project = Project.objects.get(code__iexact=self.project_code)
+            self.stdout.write(self.style.SUCCESS(f'project: {project.code}'))
+            self.stdout.write(self.style.SUCCESS(f'     {refresh_project_summary(project)} summary rows written'))
+            self.stdout.write(self.style.SUCCESS('done!'))
+        elif "import" in params and len(params) >= 3:
+            self.project_code = params[1]
+            with open(params[2], 'rb') as source:
+                result = import_evaluations(self.project_code, source, get_import_format(params[2]),
+                                            dry_run=options['dry_run'])
+            self.stdout.write(self.style.SUCCESS(f'project: {result["project"]}'))
+            for change in result['diff'] if options['dry_run'] else []:
+                values = ', '.join(f'{column}: {old!r} -> {new!r}' for column, (old, new) in change['changes'].items())
+                self.stdout.write(f'     row {change["row"]} evaluation {change["id"]}: {values}')
+            for error in result['errors']:
+                self.stdout.write(self.style.ERROR(f'     row {error["row"]}: {error["error"]}'))
+            self.stdout.write(self.style.SUCCESS(f'     {result["rows"]} rows, {result["changed"]} changed, '
+                                                 f'{result["updated"]} updated, {result["error_count"]} errors'))
+            self.stdout.write(self.style.SUCCESS('done!'))
+        elif "statistics" in params and len(params) >= 2:
+            self.project_code = params[1]
+            statistics = project_statistics(self.project_code)
+            self.stdout.write(self.style.SUCCESS(f'project: {statistics["project"]}'))
+            self.stdout.write(f'     {statistics["scored_count"]} scores')
+            self.stdout.write('vendors (agreement is 0-1):')
+            for vendor in statistics['vendors']:
+                self.stdout.write(f'     {vendor["name"]}: mean {_number(vendor["mean"])}, agreement '
+                                  f'{_number(vendor["agreement"])}, {vendor["low_agreement_cells"]} of '
+                                  f'{vendor["rated_cells"]} cells below {AGREEMENT_THRESHOLD}, scores 0-10 '
+                                  f'{vendor["distribution"]}')
+            self.stdout.write('evaluators (bias is the average difference from the mean of the other scores of a '
+                              'cell):')
+            for evaluator in statistics['evaluators']:
+                self.stdout.write(f'     {evaluator["username"]}: {evaluator["scored_count"]} scored, mean '
+                                  f'{_number(evaluator["mean"])}, bias {_number(evaluator["bias"])}, mean absolute '
+                                  f'deviation {_number(evaluator["mean_absolute_deviation"])}')
+            self.stdout.write(f'least agreement (first {STATISTICS_CELLS} cells):')
+            for cell in statistics['cells'][:STATISTICS_CELLS]:
+                self.stdout.write(f'     {cell["vendor"]} / {cell["requirement"]}: {cell["count"]} scores from '
+                                  f'{cell["min"]} to {cell["max"]}, mean {_number(cell["mean"])}, stddev '
+                                  f'{_number(cell["stddev"])}, agreement {_number(cell["agreement"])}')
+            self.stdout.write(self.style.SUCCESS('done!'))
+        elif "progress" in params and len(params) >= 2:
+            self.project_code = params[1]
+            progress = project_progress(self.project_code)
+            self.stdout.write(self.style.SUCCESS(f'project: {progress["project"]}'))
+            self.stdout.write(f'     {progress["scored_count"]} of {progress["cell_count"]} scored, '
+                              f'{progress["unscored_count"]} not entered')
+            for user in progress['users']:
+                self.stdout.write(f'     {user["rank"]}. {user["username"]}: {user["scored_count"]} of '
+                                  f'{user["cell_count"]} scored ({_number((user["coverage"] or 0) * 100)}%), '
+                                  f'{user["unscored_count"]} not entered')
+            self.stdout.write(self.style.SUCCESS('done!'))
+        elif "notes" in params:
+            self.project_code = params[1] if len(params) >= 2 else None
+            self.stdout.write(self.style.SUCCESS(f'project: {self.project_code or "all"}'))
+            rendered = render_evaluation_notes(self.project_code, rerender=options['all'])
+            self.stdout.write(self.style.SUCCESS(f'     {rendered} evaluation notes rendered'))
+            self.stdout.write(self.style.SUCCESS('done!'))
         else:
             self.stdout.write(self.style.SUCCESS(self.help))
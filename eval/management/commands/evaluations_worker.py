@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from argparse import RawTextHelpFormatter
+from eval.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = """
+        usage: ./manage.py evaluations_worker [--threads n] [--poll seconds] [--once]
+        --------------------------------------
+        example: ./manage.py evaluations_worker --threads 2
+
+        runs queued generate/export jobs (see /eval/api/jobs/) in a thread pool; jobs are claimed from the database
+        so more than one worker process can run at the same time without a broker
+        running jobs whose worker stopped (killed or crashed) are queued again once they have not reported progress for
+        EVAL_JOB_STALE_SECONDS (default 15 minutes)
+
+        options
+        --------
+        --threads - number of jobs to run at the same time (default 2)
+        --poll - seconds to wait between checks for new jobs when idle (default 2)
+        --once - run until the queue is empty and then exit (useful from cron)
+    """
+
+    def create_parser(self, *args, **kwargs):
+        parser = super(Command, self).create_parser(*args, **kwargs)
+        parser.formatter_class = RawTextHelpFormatter
+        return parser
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2)
+        parser.add_argument('--poll', type=float, default=2.0)
+        parser.add_argument('--once', action='store_true')
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        self.stdout.write(self.style.SUCCESS(f'worker started with {threads} thread(s)'))
+        running = set()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            try:
+                while True:
+                    running = {future for future in running if not future.done()}
+                    job = claim_next_job() if len(running) < threads else None
+                    if job:
+                        self.stdout.write(self.style.SUCCESS(f'claimed job [{job}]'))
+                        running.add(executor.submit(run_job, job))
+                        continue
+                    if options['once'] and not running:
+                        break
+                    time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('stopping; waiting for running jobs to finish...'))
+        self.stdout.write(self.style.SUCCESS('done!'))
@@ -0,0 +1,232 @@
+import struct
+import sys
+from array import array
+from itertools import product
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from eval.models import Evaluation
+from eval.utils import get_project
+from eval.versions import project_version
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the matrices are cached (as their to_bytes blob) under the version of their project (see eval.versions); the
+#   timeout only bounds how stale another process (with its own local memory cache) can get
+MATRIX_CACHE_TIMEOUT = 60 * 10
+MATRIX_KEY = 'eval:matrix:{project_id}:{version}'
+# axes of the matrix in storage order
+AXES = ('user', 'vendor', 'functionality')
+# score of the cells nobody scored (or without an evaluation)
+UNSCORED = -1
+# blob header: magic, format version, project id and the length of each axis
+BLOB_MAGIC = b'EVSM'
+BLOB_HEADER = struct.Struct('<4sBqIII')
+
+
+class ScoreMatrix:
+    """
+    the scores of a project as one int8 per (user, vendor, requirement) cell; a project of 100 users, 20 vendors and
+    500 requirements is 1MB instead of a million Evaluation objects
+        scores - array('b') of the cells in (user, vendor, requirement) order; UNSCORED (-1) when there is no score
+        user_ids, vendor_ids, functionality_ids - the ids of each axis in index order
+    NOTE: only active vendors and requirements are loaded; a user is on the user axis once they have an evaluation
+    NOTE: aggregates use NumPy (over a view of the same bytes) when it is installed and plain python otherwise
+    """
+    def __init__(self, project_id, user_ids, vendor_ids, functionality_ids, scores=None):
+        self.project_id = project_id
+        self.user_ids = tuple(user_ids)
+        self.vendor_ids = tuple(vendor_ids)
+        self.functionality_ids = tuple(functionality_ids)
+        self.shape = (len(self.user_ids), len(self.vendor_ids), len(self.functionality_ids))
+        size = self.shape[0] * self.shape[1] * self.shape[2]
+        self.scores = scores if scores is not None else array('b', [UNSCORED]) * size
+        if len(self.scores) != size:
+            raise ValidationError(f"Score matrix of shape {self.shape} needs {size} scores; got [{len(self.scores)}]")
+        self._positions = [{item_id: position for position, item_id in enumerate(ids)} for ids in self.axes()]
+
+    @classmethod
+    def from_project(cls, project):
+        """
+        build the matrix of a project from one query of (user, vendor, requirement, score) values
+        :param project: a Project or project code
+        :return: ScoreMatrix
+        """
+        project = get_project(project)
+        rows = list(Evaluation.objects.filter(vendor__project=project, vendor__is_active=True,
+                                              functionality__is_active=True).order_by()
+                    .values_list('user_id', 'vendor_id', 'functionality_id', 'score'))
+        matrix = cls(project.id, *(sorted({row[axis] for row in rows}) for axis in range(len(AXES))))
+        users, vendors, functionalities = matrix._positions
+        vendor_count, functionality_count = matrix.shape[1:]
+        for user_id, vendor_id, functionality_id, score in rows:
+            if score is not None:
+                matrix.scores[(users[user_id] * vendor_count + vendors[vendor_id]) * functionality_count +
+                              functionalities[functionality_id]] = score
+        return matrix
+
+    def axes(self):
+        return self.user_ids, self.vendor_ids, self.functionality_ids
+
+    def __len__(self):
+        return len(self.scores)
+
+    @property
+    def nbytes(self):
+        return len(self.scores) * self.scores.itemsize
+
+    def index(self, user_id, vendor_id, functionality_id):
+        """
+        :return: position of a cell in scores or None if one of the ids is not in the matrix
+        """
+        users, vendors, functionalities = self._positions
+        if user_id not in users or vendor_id not in vendors or functionality_id not in functionalities:
+            return None
+        return (users[user_id] * self.shape[1] + vendors[vendor_id]) * self.shape[2] + functionalities[functionality_id]
+
+    def score(self, user_id, vendor_id, functionality_id):
+        """
+        :return: the score of a cell or None when it is unscored (or not in the matrix)
+        """
+        position = self.index(user_id, vendor_id, functionality_id)
+        if position is None or self.scores[position] == UNSCORED:
+            return None
+        return self.scores[position]
+
+    def cells(self):
+        """
+        :return: generator of (user id, vendor id, functionality id, score) of the scored cells in storage order
+        """
+        if numpy is not None:
+            scores = self.to_numpy()
+            scored = numpy.nonzero(scores != UNSCORED)
+            for user, vendor, functionality, score in zip(*(index.tolist() for index in scored),
+                                                          scores[scored].tolist()):
+                yield self.user_ids[user], self.vendor_ids[vendor], self.functionality_ids[functionality], score
+            return
+        vendor_count, functionality_count = self.shape[1:]
+        for position, score in enumerate(self.scores):
+            if score != UNSCORED:
+                user, rest = divmod(position, vendor_count * functionality_count)
+                vendor, functionality = divmod(rest, functionality_count)
+                yield self.user_ids[user], self.vendor_ids[vendor], self.functionality_ids[functionality], score
+
+    def to_numpy(self):
+        """
+        :return: int8 NumPy array of shape (users, vendors, requirements) sharing the bytes of scores (no copy)
+        """
+        if numpy is None:
+            raise ValidationError("NumPy is not installed")
+        return numpy.frombuffer(self.scores, dtype=numpy.int8).reshape(self.shape)
+
+    def slice(self, user_ids=None, vendor_ids=None, functionality_ids=None):
+        """
+        a smaller matrix of some of the users, vendors and/or requirements
+        :param user_ids: the users to keep (None for all); ids not in the matrix are skipped
+        :param vendor_ids: the vendors to keep
+        :param functionality_ids: the requirements to keep
+        :return: ScoreMatrix
+        """
+        kept = []
+        for ids, positions, wanted in zip(self.axes(), self._positions, (user_ids, vendor_ids, functionality_ids)):
+            kept.append(list(range(len(ids))) if wanted is None else
+                        [positions[item_id] for item_id in wanted if item_id in positions])
+        users, vendors, functionalities = kept
+        if numpy is not None:
+            scores = array('b', self.to_numpy()[numpy.ix_(users, vendors, functionalities)].tobytes())
+        else:
+            vendor_count, functionality_count = self.shape[1:]
+            scores = array('b', (self.scores[(user * vendor_count + vendor) * functionality_count + functionality]
+                                 for user in users for vendor in vendors for functionality in functionalities))
+        return ScoreMatrix(self.project_id, *([ids[position] for position in positions]
+                                              for ids, positions in zip(self.axes(), kept)), scores=scores)
+
+    def aggregate(self, by='vendor', use_numpy=None):
+        """
+        count and sum of the scored cells grouped by one or more axes
+        :param by: an axis (user, vendor or functionality) or a tuple of axes Ex: ('vendor', 'functionality')
+        :param use_numpy: force (True) or skip (False) the NumPy engine; by default NumPy is used when it is installed
+        :return: dict of id (tuple of ids when grouped by several axes) -> (scored count, score sum); groups without
+            scores are included with (0, 0)
+        """
+        axes = (by,) if isinstance(by, str) else tuple(by)
+        for axis in axes:
+            if axis not in AXES:
+                raise ValidationError(f"Unknown axis [{axis}]! Valid axes are [{', '.join(AXES)}]")
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        totals = self._numpy_aggregate(axes) if use_numpy else self._python_aggregate(axes)
+        return {key[0] if len(axes) == 1 else key: value for key, value in totals.items()}
+
+    def means(self, by='vendor', use_numpy=None):
+        """
+        :return: dict of id (see aggregate) -> mean score or None when nothing is scored
+        """
+        return {key: total / count if count else None
+                for key, (count, total) in self.aggregate(by, use_numpy).items()}
+
+    def _python_aggregate(self, axes):
+        totals = {key: (0, 0) for key in product(*(self.axes()[AXES.index(axis)] for axis in axes))}
+        for cell in self.cells():
+            key = tuple(cell[AXES.index(axis)] for axis in axes)
+            count, total = totals[key]
+            totals[key] = (count + 1, total + cell[3])
+        return totals
+
+    def _numpy_aggregate(self, axes):
+        scores = self.to_numpy()
+        scored = scores != UNSCORED
+        summed = tuple(position for position, axis in enumerate(AXES) if axis not in axes)
+        order = [sorted(AXES.index(axis) for axis in axes).index(AXES.index(axis)) for axis in axes]
+        counts = scored.sum(axis=summed, dtype=numpy.int64).transpose(order)
+        sums = numpy.where(scored, scores, 0).sum(axis=summed, dtype=numpy.int64).transpose(order)
+        keys = [self.axes()[AXES.index(axis)] for axis in axes]
+        return {tuple(ids[position] for ids, position in zip(keys, index)): (int(counts[index]), int(sums[index]))
+                for index in numpy.ndindex(counts.shape)}
+
+    def to_bytes(self):
+        """
+        :return: the matrix as a compact binary blob (header, the ids of each axis as int64, then the scores)
+        """
+        ids = array('q', self.user_ids + self.vendor_ids + self.functionality_ids)
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return BLOB_HEADER.pack(BLOB_MAGIC, 1, self.project_id, *self.shape) + ids.tobytes() + self.scores.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        :param data: a blob made by to_bytes
+        :return: ScoreMatrix
+        """
+        try:
+            magic, version, project_id, *shape = BLOB_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValidationError("Invalid score matrix blob; the header is incomplete")
+        if magic != BLOB_MAGIC or version != 1:
+            raise ValidationError(f"Invalid score matrix blob; unknown format [{magic!r} {version}]")
+        id_count = sum(shape)
+        size = shape[0] * shape[1] * shape[2]
+        ids_end = BLOB_HEADER.size + id_count * 8
+        if len(data) != ids_end + size:
+            raise ValidationError(f"Invalid score matrix blob; expected [{ids_end + size}] bytes got [{len(data)}]")
+        ids = array('q', data[BLOB_HEADER.size:ids_end])
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        users, vendors = shape[0], shape[0] + shape[1]
+        return cls(project_id, ids[:users], ids[users:vendors], ids[vendors:], scores=array('b', data[ids_end:]))
+
+
+def get_score_matrix(project):
+    """
+    the cached score matrix of a project (see ScoreMatrix.from_project); built again only after the project changes
+    :param project: a Project or project code
+    :return: ScoreMatrix
+    """
+    project = get_project(project)
+    key = MATRIX_KEY.format(project_id=project.id, version=project_version(project.id))
+    return ScoreMatrix.from_bytes(cache.get_or_set(key, lambda: ScoreMatrix.from_project(project).to_bytes(),
+                                                   MATRIX_CACHE_TIMEOUT))
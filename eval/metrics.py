@@ -0,0 +1,96 @@
+import bisect
+import threading
+
+# upper bounds (ms) of the histogram buckets; anything slower goes in the last (overflow) bucket
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """
+    request timings of one view (or docroot page) in fixed buckets plus running totals
+    NOTE: fixed buckets keep recording O(log buckets) with constant memory; percentiles are the upper bound of the
+        bucket they fall in
+    """
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, wall_ms, db_ms, queries):
+        self.count += 1
+        self.total_ms += wall_ms
+        self.max_ms = max(self.max_ms, wall_ms)
+        self.db_ms += db_ms
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, wall_ms)] += 1
+
+    def percentile(self, fraction):
+        """
+        :param fraction: 0-1 Ex: 0.95
+        :return: the upper bound (ms) of the bucket holding that percentile; max_ms for the overflow bucket
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+            'avg_db_ms': round(self.db_ms / self.count, 3) if self.count else None,
+            'avg_queries': round(self.queries / self.count, 2) if self.count else None,
+            'max_queries': self.max_queries,
+            'buckets': {('inf' if index == len(BUCKETS_MS) else str(BUCKETS_MS[index])): count
+                        for index, count in enumerate(self.buckets) if count},
+        }
+
+
+class MetricsRegistry:
+    """
+    in process histograms keyed by view name; every worker process keeps its own
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, key, wall_ms, db_ms, queries):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.add(wall_ms, db_ms, queries)
+
+    def snapshot(self, reset=False):
+        """
+        :param reset: start over once the snapshot is taken
+        :return: dict of key -> histogram dict, slowest average first
+        """
+        with self._lock:
+            histograms = self._histograms
+            if reset:
+                self._histograms = {}
+            result = {key: histogram.as_dict() for key, histogram in histograms.items()}
+        return dict(sorted(result.items(), key=lambda item: -(item[1]['avg_ms'] or 0)))
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+# the registry the middleware records into
+METRICS = MetricsRegistry()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from contextlib import ExitStack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from docrootcms import views as cms_views
+from docrootcms.middleware import DocrootFallbackMiddleware as CmsDocrootFallbackMiddleware
+
+from eval.metrics import METRICS
+from eval.pagecache import cached_page
+
+log = logging.getLogger("eval.metrics")
+
+
+class QueryCounter:
+    """
+    database execute wrapper (connection.execute_wrapper) that adds up the queries and their time for one request
+    and logs the ones slower than the threshold
+    """
+    def __init__(self, request, slow_query_ms=None):
+        self.request = request
+        self.slow_query_ms = slow_query_ms
+        self.count = 0
+        self.db_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.db_ms += elapsed
+            if self.slow_query_ms is not None and elapsed >= self.slow_query_ms:
+                log.warning(f"slow query {elapsed:.1f} ms on [{self.request.path}]: {sql[:1000]}")
+
+
+def count_queries(request):
+    """
+    add up the queries this thread runs for a request into its QueryCounter (set by RequestMetricsMiddleware)
+    NOTE: execute wrappers belong to the connections of one thread; async views run their queries in pool threads
+        (eval.async_views) which enter this themselves
+    :return: context manager
+    """
+    stack = ExitStack()
+    counter = getattr(request, '_eval_query_counter', None)
+    if counter is not None:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+    return stack
+
+
+class RequestMetricsMiddleware:
+    """
+    records wall time, database time and query count of every request into the in process histograms
+    (eval.metrics.METRICS) keyed by view name (docroot:<path> for docroot pages and apis)
+    settings:
+        EVAL_METRICS_ENABLED - False removes the middleware at startup (default True)
+        EVAL_SLOW_QUERY_MS - log queries at least this slow (ms); None to turn off (default None)
+    NOTE: place it first in MIDDLEWARE so the docroot fallback (which renders pages after the url resolver 404s) is
+        measured too; a streamed response is only timed until its first byte is ready
+    NOTE: it runs sync or async to match the stack so ASGI requests are not funneled through one sync thread; under
+        ASGI only the queries of the async views (eval.async_views) are counted
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'EVAL_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed('EVAL_METRICS_ENABLED is off')
+        self.get_response = get_response
+        self.slow_query_ms = getattr(settings, 'EVAL_SLOW_QUERY_MS', None)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # same marker django.utils.deprecation.MiddlewareMixin sets so the handler awaits this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request._eval_query_counter = counter = QueryCounter(request, self.slow_query_ms)
+        start = time.perf_counter()
+        with count_queries(request):
+            response = self.get_response(request)
+        self.record(request, response, start, counter)
+        return response
+
+    async def __acall__(self, request):
+        request._eval_query_counter = counter = QueryCounter(request, self.slow_query_ms)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, start, counter)
+        return response
+
+    def record(self, request, response, start, counter):
+        wall_ms = (time.perf_counter() - start) * 1000
+        METRICS.record(self.metrics_key(request, response), wall_ms, counter.db_ms, counter.count)
+
+    @staticmethod
+    def metrics_key(request, response):
+        """
+        :return: the view name for urls the resolver matched, docroot:<path> for pages the docroot fallback served
+            or the status code for everything else (keeps random 404 paths from growing the histograms)
+        """
+        match = getattr(request, 'resolver_match', None)
+        if match:
+            return match.view_name or match._func_path
+        if response.status_code != 404:
+            return f"docroot:{request.path_info}"
+        return str(response.status_code)
+
+
+class DocrootFallbackMiddleware(CmsDocrootFallbackMiddleware):
+    """
+    the docrootcms fallback (404s are served as docroot static files, pages or apis) able to run in an async stack
+    NOTE: the docrootcms middleware is sync only which makes django run the whole middleware chain of every ASGI
+        request in its one sync thread; this one awaits the async views and only hops to that thread to render a
+        docroot page for a 404
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.fallback(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.status_code != 404:
+            return response
+        return await sync_to_async(self.fallback, thread_sensitive=True)(request, response)
+
+    @staticmethod
+    def fallback(request, response):
+        """
+        :return: the docroot static file, page or api for a 404 response (or the 404 when there is none)
+        NOTE: pages and apis whose .data.py opts in are served from the page cache (see eval.pagecache)
+        """
+        if response.status_code != 404:
+            return response
+        return cms_views.static(request) or cached_page(request, cms_views.page) or \
+            cached_page(request, cms_views.api, api=True) or response
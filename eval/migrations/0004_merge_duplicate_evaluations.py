@@ -0,0 +1,40 @@
+# Generated by Django 3.2.6 on 2026-10-18 10:27
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_evaluations(apps, schema_editor):
+    """
+    collapse evaluations sharing the same (user, vendor, functionality) into the oldest row so the unique constraint
+    can be added.  The kept row takes the first score entered if it has none, is confirmed if any duplicate was and
+    gets the distinct notes of every duplicate appended.
+    """
+    Evaluation = apps.get_model('eval', 'Evaluation')
+    duplicate_keys = Evaluation.objects.values('user_id', 'vendor_id', 'functionality_id')\
+        .annotate(row_count=Count('id')).filter(row_count__gt=1).order_by()
+    for key in duplicate_keys:
+        rows = list(Evaluation.objects.filter(user_id=key['user_id'], vendor_id=key['vendor_id'],
+                                              functionality_id=key['functionality_id']).order_by('id'))
+        keep, duplicates = rows[0], rows[1:]
+        notes = [str(keep.notes)] if keep.notes else []
+        for duplicate in duplicates:
+            if keep.score is None and duplicate.score is not None:
+                keep.score = duplicate.score
+            keep.confirmed = keep.confirmed or duplicate.confirmed
+            if duplicate.notes and str(duplicate.notes) not in notes:
+                notes.append(str(duplicate.notes))
+        keep.notes = "\n\n".join(notes) if notes else keep.notes
+        keep.save(update_fields=['score', 'confirmed', 'notes'])
+        Evaluation.objects.filter(id__in=[duplicate.id for duplicate in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0003_alter_projectfunctionality_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_evaluations, migrations.RunPython.noop),
+    ]
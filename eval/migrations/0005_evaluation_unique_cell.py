@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0004_merge_duplicate_evaluations'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='evaluation',
+            constraint=models.UniqueConstraint(fields=('user', 'vendor', 'functionality'), name='unique_evaluation_cell'),
+        ),
+    ]
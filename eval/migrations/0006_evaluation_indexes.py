@@ -0,0 +1,30 @@
+# Generated by Django 3.2.6 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0005_evaluation_unique_cell'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='code',
+            field=models.CharField(db_index=True, max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='evaluation',
+            index=models.Index(fields=['vendor', 'functionality', 'user'], name='evaluation_vendor_func_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evaluation',
+            index=models.Index(fields=['user', 'score'], name='evaluation_user_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evaluation',
+            index=models.Index(condition=models.Q(('score__isnull', True)), fields=['user', 'vendor'], name='evaluation_unscored_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.2.6 on 2026-10-18 10:36
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Avg, Q
+import django.db.models.deletion
+
+
+def fill_summaries(apps, schema_editor):
+    """
+    write the summary rows of every project from the evaluations already there (the grouped queries of
+    eval.scorecard.refresh_project_summary) so the scorecard does not start out empty on an existing database
+    """
+    Evaluation = apps.get_model('eval', 'Evaluation')
+    ScoreSummary = apps.get_model('eval', 'ScoreSummary')
+    evaluations = Evaluation.objects.order_by()
+    aggregates = dict(cell_count=Count('id'), scored_count=Count('score'),
+                      confirmed_count=Count('id', filter=Q(confirmed=True)), score_sum=Sum('score'),
+                      score_avg=Avg('score'))
+    rows = []
+    for level, group, target in (('vendor', (), None), ('requirement', ('functionality_id',), 'functionality_id'),
+                                 ('category', ('functionality__categories',), 'category_id')):
+        queryset = evaluations.filter(functionality__categories__isnull=False) if level == 'category' else evaluations
+        for values in queryset.values('vendor__project_id', 'vendor_id', *group).annotate(**aggregates):
+            row = ScoreSummary(project_id=values['vendor__project_id'], vendor_id=values['vendor_id'], level=level,
+                               cell_count=values['cell_count'], scored_count=values['scored_count'],
+                               confirmed_count=values['confirmed_count'], score_sum=values['score_sum'] or 0,
+                               score_avg=values['score_avg'])
+            if target:
+                setattr(row, target, values[group[0]])
+            rows.append(row)
+    ScoreSummary.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0007_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('vendor', 'Vendor'), ('requirement', 'Requirement'), ('category', 'Category')], max_length=16)),
+                ('cell_count', models.PositiveIntegerField(default=0)),
+                ('scored_count', models.PositiveIntegerField(default=0)),
+                ('confirmed_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.PositiveIntegerField(default=0)),
+                ('score_avg', models.FloatField(blank=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='eval.functionalitycategory')),
+                ('functionality', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='eval.projectfunctionality')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='eval.project')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='eval.projectvendor')),
+            ],
+            options={
+                'ordering': ['project', 'vendor', 'level'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='scoresummary',
+            index=models.Index(fields=['project', 'level'], name='scoresummary_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scoresummary',
+            index=models.Index(fields=['vendor', 'level'], name='scoresummary_vendor_idx'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
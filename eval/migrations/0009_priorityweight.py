@@ -0,0 +1,31 @@
+# Generated by Django 3.2.6 on 2026-10-18 10:37
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0008_scoresummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriorityWeight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField(default=1.0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('priority', models.ForeignKey(help_text='Applies to this priority and every priority below it unless they have their own weight', on_delete=django.db.models.deletion.CASCADE, to='eval.prioritycategory')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='eval.project')),
+            ],
+            options={
+                'ordering': ['project', 'priority'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='priorityweight',
+            constraint=models.UniqueConstraint(fields=('project', 'priority'), name='unique_priority_weight'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0009_priorityweight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evaluation',
+            name='notes_html',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+    ]
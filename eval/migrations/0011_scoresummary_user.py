@@ -0,0 +1,51 @@
+# Generated by Django 3.2.6 on 2026-10-18 11:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum, Avg, Q
+import django.db.models.deletion
+
+
+def fill_user_summaries(apps, schema_editor):
+    """
+    write the user (progress) rows of every vendor and user from all the evaluations already there (the progress
+    counters are only moved by each change from then on so they must start out complete)
+    """
+    Evaluation = apps.get_model('eval', 'Evaluation')
+    ScoreSummary = apps.get_model('eval', 'ScoreSummary')
+    rows = [ScoreSummary(project_id=values['vendor__project_id'], vendor_id=values['vendor_id'], level='user',
+                         user_id=values['user_id'], cell_count=values['cell_count'],
+                         scored_count=values['scored_count'], confirmed_count=values['confirmed_count'],
+                         score_sum=values['score_sum'] or 0, score_avg=values['score_avg'])
+            for values in Evaluation.objects.order_by()
+            .values('vendor__project_id', 'vendor_id', 'user_id')
+            .annotate(cell_count=Count('id'), scored_count=Count('score'),
+                      confirmed_count=Count('id', filter=Q(confirmed=True)), score_sum=Sum('score'),
+                      score_avg=Avg('score'))]
+    ScoreSummary.objects.bulk_create(rows, batch_size=1000)
+
+
+def remove_user_summaries(apps, schema_editor):
+    apps.get_model('eval', 'ScoreSummary').objects.filter(level='user').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eval', '0010_evaluation_notes_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scoresummary',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='scoresummary',
+            name='level',
+            field=models.CharField(choices=[('vendor', 'Vendor'), ('requirement', 'Requirement'), ('category', 'Category'), ('user', 'User')], max_length=16),
+        ),
+        migrations.RunPython(fill_user_summaries, remove_user_summaries),
+    ]
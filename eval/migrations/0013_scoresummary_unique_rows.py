@@ -0,0 +1,50 @@
+# Generated by Django 3.2.6 on 2026-10-18 11:28
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+# the key of a row at each level
+SUMMARY_KEYS = {
+    'vendor': ('vendor_id',),
+    'requirement': ('vendor_id', 'functionality_id'),
+    'category': ('vendor_id', 'category_id'),
+    'user': ('vendor_id', 'user_id'),
+}
+
+
+def remove_duplicate_summaries(apps, schema_editor):
+    """
+    keep the newest row of each key that racing refreshes wrote twice so the unique constraints can be added
+    """
+    ScoreSummary = apps.get_model('eval', 'ScoreSummary')
+    for level, fields in SUMMARY_KEYS.items():
+        rows = ScoreSummary.objects.filter(level=level)
+        for values in rows.order_by().values(*fields).annotate(rows=Count('id'), keep=Max('id')).filter(rows__gt=1):
+            rows.filter(**{field: values[field] for field in fields}).exclude(id=values['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eval', '0012_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='scoresummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('level', 'vendor')), fields=('vendor',), name='unique_summary_vendor'),
+        ),
+        migrations.AddConstraint(
+            model_name='scoresummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('level', 'requirement')), fields=('vendor', 'functionality'), name='unique_summary_requirement'),
+        ),
+        migrations.AddConstraint(
+            model_name='scoresummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('level', 'category')), fields=('vendor', 'category'), name='unique_summary_category'),
+        ),
+        migrations.AddConstraint(
+            model_name='scoresummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('level', 'user')), fields=('vendor', 'user'), name='unique_summary_user'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User, Group
 from django.utils.safestring import mark_safe
 from django.core.validators import MaxValueValidator, MinValueValidator
@@ -7,6 +8,10 @@ from docrootcms.models import ContentMarkdownField
 from markdownx.utils import markdownify
 
 
+# loaded_value of a field that was not loaded; never equal to a field value
+NOT_LOADED = object()
+
+
 class EvaluationManager(models.Manager):
     """
     Currently using one evaluation manager for all is_active stuff; split if need other specialized methods
@@ -45,7 +50,7 @@ class Project(models.Model):
     basic project info to group evaluations
     """
     objects = EvaluationManager()
-    code = models.CharField(max_length=16)
+    code = models.CharField(max_length=16, db_index=True)
     name = models.CharField(max_length=255)
     notes = models.CharField(max_length=500, null=True, blank=True)
     is_active = models.BooleanField(default=True)
@@ -109,6 +114,28 @@ class ProjectFunctionality(models.Model):
         return self.description
 
 
+class PriorityWeight(models.Model):
+    """
+    weight given to scores of requirements tagged with a priority (or any priority below it in the tree) for a project
+    Ex: 'large' 3.0, 'large/must-have' 5.0, 'small/like-to-have' 0.5
+    """
+    DEFAULT_WEIGHT = 1.0
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    priority = models.ForeignKey(PriorityCategory, on_delete=models.CASCADE,
+                                 help_text="Applies to this priority and every priority below it unless they have "
+                                           "their own weight")
+    weight = models.FloatField(default=DEFAULT_WEIGHT, validators=[MinValueValidator(0)])
+
+    class Meta:
+        ordering = ['project', 'priority']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'priority'], name='unique_priority_weight'),
+        ]
+
+    def __str__(self):
+        return f'{self.priority} ({self.weight})'
+
+
 class Evaluation(models.Model):
     """
     a user evaluation for a vendor
@@ -125,14 +152,223 @@ class Evaluation(models.Model):
     confirmed = models.BooleanField(default=False, verbose_name="Confirmed during product demonstration or evaluation")
     notes = ContentMarkdownField(field_image_prefix='evaluation/notes', null=True, blank=True, help_text=mark_safe(
         'Markdown Reference: <a href="https://commonmark.org/help/">https://commonmark.org/help/</a>'))
+    # notes rendered to html on save so pages never run markdown; fill older rows with ./manage.py evaluations notes
+    notes_html = models.TextField(null=True, blank=True, editable=False)
     
+    # fields remembered as loaded from the database (see from_db)
+    TRACKED_FIELDS = ('user_id', 'vendor_id', 'functionality_id', 'score', 'confirmed', 'notes')
+
     class Meta:
         ordering = ['vendor', 'functionality', 'user']
+        constraints = [
+            # one evaluation per person per vendor per requirement; lets generation insert without checking first
+            models.UniqueConstraint(fields=['user', 'vendor', 'functionality'], name='unique_evaluation_cell'),
+        ]
+        # NOTE: the unique constraint above already covers lookups by user (the admin default of "me")
+        indexes = [
+            # default ordering plus the vendor and project (vendor__project__code) filters
+            models.Index(fields=['vendor', 'functionality', 'user'], name='evaluation_vendor_func_idx'),
+            # has score filters for a user (zero / less than 6)
+            models.Index(fields=['user', 'score'], name='evaluation_user_score_idx'),
+            # has score "Not Entered" filter; only the unscored rows are kept in the index
+            models.Index(fields=['user', 'vendor'], name='evaluation_unscored_idx', condition=Q(score__isnull=True)),
+        ]
 
-    def formatted_markdown(self):
+    def render_notes(self):
+        """
+        :return: the notes rendered from markdown to html (empty notes are returned as is)
+        """
         if self.notes:
             return markdownify(str(self.notes))
         return self.notes
 
+    def formatted_markdown(self):
+        """
+        :return: the stored notes html; only rows not saved or backfilled since notes_html was added render here
+        """
+        if self.notes_html is None and self.notes:
+            return self.render_notes()
+        return self.notes_html
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the tracked values as loaded so save() only runs markdown when the notes changed and the progress counters
+        #   (eval.scorecard) can take the change out of what the row counted before
+        instance._loaded = {name: getattr(instance, name) for name in cls.TRACKED_FIELDS if name in field_names}
+        return instance
+
+    def loaded_value(self, name, default=None):
+        """
+        :return: the value of a TRACKED_FIELDS field as it was loaded from the database (default for new rows or rows
+            loaded without it)
+        """
+        return getattr(self, '_loaded', {}).get(name, default)
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        # the reloaded values are the loaded ones again Ex: after a rolled back save
+        deferred = self.get_deferred_fields()
+        self._loaded = dict(getattr(self, '_loaded', {}), **{name: getattr(self, name) for name in
+                                                            self.saved_fields(fields) if name not in deferred})
+
+    def saved_fields(self, update_fields=None):
+        """
+        :param update_fields: the update_fields of a save (or the fields of a refresh_from_db) as field names or
+            attnames; None for every field
+        :return: the TRACKED_FIELDS written (or read) by it
+        """
+        if update_fields is None:
+            return set(self.TRACKED_FIELDS)
+        return {self._meta.get_field(name).attname for name in update_fields} & set(self.TRACKED_FIELDS)
+
+    def notes_changed(self):
+        """
+        :return: True if the notes differ from the ones loaded from the database (always for new rows or rows loaded
+            without their notes)
+        """
+        return self.loaded_value('notes', NOT_LOADED) != self.notes
+
+    def save(self, *args, **kwargs):
+        """
+        render notes_html when the notes changed (or are listed in update_fields); saving only a score runs no markdown
+        NOTE: loaded notes without html (rows saved before notes_html was added) are rendered too
+        NOTE: runs in a transaction so the progress counters updated by the post_save signal commit with the row
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            render = 'notes' in update_fields
+        else:
+            render = self.notes_changed() or \
+                (self.notes and 'notes_html' not in self.get_deferred_fields() and self.notes_html is None)
+        if render:
+            self.notes_html = self.render_notes()
+            if update_fields is not None and 'notes_html' not in update_fields:
+                kwargs['update_fields'] = list(update_fields) + ['notes_html']
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        # only the saved fields are what the database now holds
+        saved = self.saved_fields(kwargs.get('update_fields'))
+        deferred = self.get_deferred_fields()
+        self._loaded = dict(getattr(self, '_loaded', {}), **{name: getattr(self, name) for name in self.TRACKED_FIELDS
+                                                            if name not in deferred and name in saved})
+
+    def __str__(self):
+        return f'({self.score}) {str(self.functionality)}'
+
+
+class Job(models.Model):
+    """
+    a long running generate/export operation queued from the api and run by ./manage.py evaluations_worker
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    GENERATE = 'generate'
+    EXPORT = 'export'
+    KIND_CHOICES = (
+        (GENERATE, 'Generate evaluations'),
+        (EXPORT, 'Export evaluations'),
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete (0-100)")
+    message = models.TextField(null=True, blank=True, help_text="Status output or the error if the job failed")
+    result_file = models.CharField(max_length=255, null=True, blank=True,
+                                   help_text="Name of the result in default storage (exports)")
+    cancel_requested = models.BooleanField(default=False)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    # last time the worker running the job reported it alive; running jobs that stop reporting are requeued
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            # the worker polls for the oldest queued job
+            models.Index(fields=['status', 'created'], name='job_status_created_idx'),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def __str__(self):
+        return f'{self.kind} #{self.id} ({self.status})'
+
+
+class ScoreSummary(models.Model):
+    """
+    materialized vendor scorecard row; one per vendor, per vendor/requirement, per vendor/category and per
+    vendor/user (the evaluation progress of each evaluator, see eval.progress).
+    Kept up to date from evaluations by eval.scorecard so dashboards never have to scan evaluations
+    """
+    VENDOR = 'vendor'
+    REQUIREMENT = 'requirement'
+    CATEGORY = 'category'
+    USER = 'user'
+    LEVEL_CHOICES = (
+        (VENDOR, 'Vendor'),
+        (REQUIREMENT, 'Requirement'),
+        (CATEGORY, 'Category'),
+        (USER, 'User'),
+    )
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    vendor = models.ForeignKey(ProjectVendor, on_delete=models.CASCADE)
+    level = models.CharField(max_length=16, choices=LEVEL_CHOICES)
+    functionality = models.ForeignKey(ProjectFunctionality, null=True, blank=True, on_delete=models.CASCADE)
+    category = models.ForeignKey(FunctionalityCategory, null=True, blank=True, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
+    cell_count = models.PositiveIntegerField(default=0)
+    scored_count = models.PositiveIntegerField(default=0)
+    confirmed_count = models.PositiveIntegerField(default=0)
+    score_sum = models.PositiveIntegerField(default=0)
+    score_avg = models.FloatField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['project', 'vendor', 'level']
+        indexes = [
+            models.Index(fields=['project', 'level'], name='scoresummary_project_idx'),
+            models.Index(fields=['vendor', 'level'], name='scoresummary_vendor_idx'),
+        ]
+        # one row per vendor at each level; a refresh racing another one fails instead of doubling the scorecard
+        constraints = [
+            models.UniqueConstraint(fields=['vendor'], condition=models.Q(level='vendor'),
+                                    name='unique_summary_vendor'),
+            models.UniqueConstraint(fields=['vendor', 'functionality'], condition=models.Q(level='requirement'),
+                                    name='unique_summary_requirement'),
+            models.UniqueConstraint(fields=['vendor', 'category'], condition=models.Q(level='category'),
+                                    name='unique_summary_category'),
+            models.UniqueConstraint(fields=['vendor', 'user'], condition=models.Q(level='user'),
+                                    name='unique_summary_user'),
+        ]
+
+    @property
+    def unscored_count(self):
+        return self.cell_count - self.scored_count
+
+    @property
+    def coverage(self):
+        """ratio (0-1) of cells that have been scored"""
+        return self.scored_count / self.cell_count if self.cell_count else None
+
+    @property
+    def confirmed_ratio(self):
+        """ratio (0-1) of cells confirmed during a demonstration or evaluation"""
+        return self.confirmed_count / self.cell_count if self.cell_count else None
+
     def __str__(self):
-        return f'({self.score}) {str(self.functionality)}'
\ No newline at end of file
+        return f'{self.vendor} {self.level} ({self.score_avg})'
@@ -0,0 +1,101 @@
+import hashlib
+import importlib.util
+import os
+from django.conf import settings
+from django.core.cache import caches
+from docrootcms.views import TemplateMeta, ApiMeta
+
+from eval.lookups import project_ids
+from eval.versions import project_version
+
+# cache alias (settings.CACHES) the docroot pages are kept in; the default cache is used when it is not configured
+PAGE_CACHE_ALIAS = getattr(settings, 'EVAL_PAGE_CACHE', 'pages')
+PAGE_KEY = 'eval:page:{project_id}:{version}:{key}'
+# data file -> (modified time, module) of the page modules loaded to read their cache settings
+_modules = {}
+
+
+def page_cache():
+    return caches[PAGE_CACHE_ALIAS if PAGE_CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def page_module(request, api=False):
+    """
+    the .data.py module docroot would run for a page (or its .json api) loaded once per change of the file to read
+    its cache settings
+    :return: the module or None if the request is not for a docroot page with a data file
+    """
+    meta = ApiMeta(request) if api else TemplateMeta(request)
+    if not meta.is_found:
+        return None
+    file_name = meta.file_name if api else meta.file_name[:-len('dt')] + 'data.py'
+    try:
+        modified = os.path.getmtime(file_name)
+    except OSError:
+        return None
+    loaded = _modules.get(file_name)
+    if loaded is None or loaded[0] != modified:
+        spec = importlib.util.spec_from_file_location(f"eval_page_cache.{meta.path}", file_name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        loaded = _modules[file_name] = (modified, module)
+    return loaded[1]
+
+
+def page_cache_key(request, module):
+    """
+    the cache key of a page response or None when it is not cached
+    a .data.py module opts in with
+        cache_ttl = 60                      # seconds; leave out (or 0) to never cache the page
+        def cache_key(request):             # optional; defaults to the path and query string
+            return request.get_full_path()  # return None to skip the cache for this request
+        def cache_project(request):         # optional; the project code the page shows, defaults to ?project=
+            return request.GET.get('project')
+    NOTE: the key holds the version of the page's project (see eval.versions) so changes to the project (scores,
+        notes, vendors, requirements...) invalidate only its pages; pages without a project are only timed out
+    :param request: the request
+    :param module: the page module (see page_module)
+    :return: the key or None
+    """
+    if not getattr(module, 'cache_ttl', None) or request.method not in ('GET', 'HEAD') or '_method' in request.GET:
+        return None
+    key_function = getattr(module, 'cache_key', None)
+    key = key_function(request) if key_function else request.get_full_path()
+    if key is None:
+        return None
+    project_function = getattr(module, 'cache_project', None)
+    code = project_function(request) if project_function else request.GET.get('project')
+    project_id = project_ids().get(code.lower()) if code else None
+    return PAGE_KEY.format(project_id=project_id, version=project_version(project_id) if project_id else 0,
+                           key=hashlib.md5(f"{request.method}:{key}".encode()).hexdigest())
+
+
+def is_cacheable(request, response):
+    """
+    :return: True for complete 200 responses that are the same for everyone; responses holding a csrf token or
+        setting cookies belong to one visitor
+    """
+    return (response is not None and response.status_code == 200 and not response.streaming and
+            not response.cookies and not request.META.get('CSRF_COOKIE_USED'))
+
+
+def cached_page(request, render, api=False):
+    """
+    serve a docroot page (or api) from the page cache when its module opts in (see page_cache_key)
+    :param request: the request
+    :param render: the docroot view rendering it Ex: docrootcms.views.page
+    :param api: True for the .json apis of the data files
+    :return: the response of render (None when docroot has no such page)
+    """
+    module = page_module(request, api=api)
+    key = page_cache_key(request, module) if module else None
+    if key is None:
+        return render(request)
+    cache = page_cache()
+    response = cache.get(key)
+    if response is not None:
+        return response
+    response = render(request)
+    if is_cacheable(request, response):
+        cache.set(key, response, module.cache_ttl)
+    return response
@@ -0,0 +1,46 @@
+from eval.models import ScoreSummary
+from eval.utils import get_project
+
+
+def _counts(cell_count=0, scored_count=0, confirmed_count=0):
+    return {
+        'cell_count': cell_count,
+        'scored_count': scored_count,
+        'unscored_count': cell_count - scored_count,
+        'confirmed_count': confirmed_count,
+        'coverage': scored_count / cell_count if cell_count else None,
+    }
+
+
+def _add(totals, cell_count, scored_count, confirmed_count):
+    return _counts(totals['cell_count'] + cell_count, totals['scored_count'] + scored_count,
+                   totals['confirmed_count'] + confirmed_count)
+
+
+def project_progress(project):
+    """
+    evaluation progress of every evaluator of a project read from the user rows of the summary table (eval.scorecard
+    moves every evaluation change into them in the transaction of the change) so it never counts evaluations
+        users - per user: cell, scored, unscored and confirmed counts, coverage (0-1) and rank plus the same per vendor;
+            most complete first so whoever is behind is at the bottom
+    NOTE: only active vendors count
+    :param project: a Project or a project code
+    :return: dict of project, name, the project totals and users
+    """
+    project = get_project(project)
+    users = {}
+    totals = _counts()
+    for user_id, username, vendor_id, vendor, cell_count, scored_count, confirmed_count in ScoreSummary.objects\
+            .filter(project=project, level=ScoreSummary.USER, vendor__is_active=True).order_by('vendor__name')\
+            .values_list('user_id', 'user__username', 'vendor_id', 'vendor__name', 'cell_count', 'scored_count',
+                         'confirmed_count'):
+        user = users.setdefault(user_id, dict(user_id=user_id, username=username, vendors=[], **_counts()))
+        user.update(_add(user, cell_count, scored_count, confirmed_count))
+        user['vendors'].append(dict(vendor_id=vendor_id, name=vendor,
+                                    **_counts(cell_count, scored_count, confirmed_count)))
+        totals = _add(totals, cell_count, scored_count, confirmed_count)
+    ranked = sorted(users.values(), key=lambda user: (-(user['coverage'] or 0), user['unscored_count'],
+                                                       user['username']))
+    for rank, user in enumerate(ranked, start=1):
+        user['rank'] = rank
+    return dict(project=project.code, name=project.name, users=ranked, **totals)
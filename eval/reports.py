@@ -0,0 +1,124 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from eval.models import Project, ProjectVendor, ProjectFunctionality, Evaluation
+from eval.utils import get_project
+
+# evaluations per page of the vendor report
+REPORT_PAGE_SIZE = 100
+REPORT_MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(evaluation):
+    """
+    :return: keyset cursor for the position after this evaluation; vendor.functionality.user ids
+    """
+    return f"{evaluation.vendor_id}.{evaluation.functionality_id}.{evaluation.user_id}"
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: a cursor from encode_cursor or None/empty for the first page
+    :return: (vendor_id, functionality_id, user_id) or None
+    """
+    if not cursor:
+        return None
+    try:
+        vendor_id, functionality_id, user_id = (int(part) for part in cursor.split('.'))
+    except ValueError:
+        raise ValidationError(f"Invalid page cursor [{cursor}]!")
+    return vendor_id, functionality_id, user_id
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"Parameter [{name}] must be an id; got [{value}]")
+
+
+def vendor_report_page(project, after=None, vendor_id=None, functionality_id=None, limit=REPORT_PAGE_SIZE):
+    """
+    one page of the vendor report ordered by (vendor, functionality, user) ids using keyset pagination so every page
+    is an index range scan (evaluation_vendor_func_idx) no matter how deep into the report it is
+    :param project: a Project or project code
+    :param after: cursor of the last row of the previous page (see encode_cursor) or None for the first page
+    :param vendor_id: only this vendor
+    :param functionality_id: only this requirement
+    :param limit: rows per page (capped at REPORT_MAX_PAGE_SIZE)
+    NOTE: the raw notes are not loaded; the page shows the html stored on save (notes_html)
+    :return: (list of evaluations with user/vendor/functionality loaded, cursor of the next page or None)
+    """
+    project = get_project(project)
+    limit = max(1, min(limit or REPORT_PAGE_SIZE, REPORT_MAX_PAGE_SIZE))
+    queryset = Evaluation.objects.filter(vendor__project=project, vendor__is_active=True)\
+        .select_related('user', 'vendor', 'functionality').defer('notes')\
+        .order_by('vendor_id', 'functionality_id', 'user_id')
+    if vendor_id:
+        queryset = queryset.filter(vendor_id=vendor_id)
+    if functionality_id:
+        queryset = queryset.filter(functionality_id=functionality_id)
+    position = decode_cursor(after)
+    if position:
+        after_vendor, after_functionality, after_user = position
+        queryset = queryset.filter(
+            Q(vendor_id__gt=after_vendor) |
+            Q(vendor_id=after_vendor, functionality_id__gt=after_functionality) |
+            Q(vendor_id=after_vendor, functionality_id=after_functionality, user_id__gt=after_user)
+        )
+    evaluations = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(evaluations[limit - 1]) if len(evaluations) > limit else None
+    return evaluations[:limit], next_cursor
+
+
+def vendor_report_request(params):
+    """
+    read the vendor report filters from request parameters
+    :param params: dict like object (request.GET): project (code, required), vendor (id), requirement (id),
+        after (cursor), limit
+    :return: dict of keyword arguments for vendor_report_page (empty if no project was picked yet)
+    """
+    if not params.get('project'):
+        return {}
+    return {
+        'project': get_project(params['project']),
+        'vendor_id': _int_param(params, 'vendor'),
+        'functionality_id': _int_param(params, 'requirement'),
+        'after': params.get('after') or None,
+        'limit': _int_param(params, 'limit') or REPORT_PAGE_SIZE,
+    }
+
+
+def vendor_report_filters(project=None):
+    """
+    choices for the report filter form (projects; vendors and requirements once a project is picked)
+    :return: dict of projects, vendors and requirements lists of (id/code, name)
+    """
+    filters = {'projects': list(Project.objects.active().order_by('name').values_list('code', 'name')),
+               'vendors': [], 'requirements': []}
+    if project:
+        filters['vendors'] = list(ProjectVendor.objects.active().filter(project=project).order_by('name')
+                                  .values_list('id', 'name'))
+        filters['requirements'] = [(requirement.id, str(requirement)) for requirement in
+                                   ProjectFunctionality.objects.active().filter(project=project)]
+    return filters
+
+
+def evaluation_row(evaluation):
+    """
+    :return: dict of an evaluation for the report json
+    """
+    return {
+        'id': evaluation.id,
+        'vendor_id': evaluation.vendor_id,
+        'vendor': str(evaluation.vendor),
+        'functionality_id': evaluation.functionality_id,
+        'functionality': str(evaluation.functionality),
+        'user': str(evaluation.user),
+        'score': evaluation.score,
+        'confirmed': evaluation.confirmed,
+        'notes_html': evaluation.notes_html or '',
+    }
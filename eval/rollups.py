@@ -0,0 +1,108 @@
+from django.core.cache import cache
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from tagulous.utils import split_tree_name, join_tree_name
+
+from eval.models import ProjectVendor, ProjectFunctionality, ScoreSummary
+from eval.utils import get_project
+from eval.versions import project_version, tag_version
+
+# the rollups are cached under the versions of their project and of the tag trees (see eval.versions); the timeout
+#   only bounds how stale another process (with its own local memory cache) can get
+ROLLUP_CACHE_TIMEOUT = 60 * 10
+ROLLUP_KEY = 'eval:rollups:{project_id}:{tree}:{version}:{tag_version}'
+# tag trees a project can be rolled up by and the requirement tag field holding each
+ROLLUP_TREES = {
+    'categories': ProjectFunctionality.categories,
+    'priorities': ProjectFunctionality.priorities,
+}
+
+
+def _totals():
+    return {'cell_count': 0, 'scored_count': 0, 'confirmed_count': 0, 'score_sum': 0}
+
+
+def build_rollups(project, tree='categories'):
+    """
+    roll the vendor scores of a project up a tag tree: every node (Ex: user, user/basic, user/advanced) gets the
+    requirements tagged with it or any tag below it and the totals of each vendor over those requirements
+    NOTE: built from the requirement rows of the scorecard summary (eval.scorecard) in three queries no matter how
+        deep the tree is; a requirement tagged twice under the same node is only counted once for it
+    :param project: a Project or project code
+    :param tree: categories or priorities (see ROLLUP_TREES)
+    :return: dict of project, tree, vendors [{id, name}] and nodes [{name, label, level, parent, requirement_ids,
+        vendors: {vendor id: {cell_count, scored_count, confirmed_count, score_avg, coverage}}}] in tree order
+    """
+    project = get_project(project)
+    field = ROLLUP_TREES[tree].field
+    vendors = list(ProjectVendor.objects.active().filter(project=project).order_by('name').values('id', 'name'))
+    links = field.remote_field.through.objects.filter(projectfunctionality__project=project,
+                                                      projectfunctionality__is_active=True)\
+        .values_list('projectfunctionality_id', f'{field.related_model._meta.model_name}__name')
+    requirement_ids = {}
+    for functionality_id, name in links:
+        parts = split_tree_name(name)
+        # every ancestor holds the requirements of the tags below it
+        for level in range(1, len(parts) + 1):
+            requirement_ids.setdefault(join_tree_name(parts[:level]), set()).add(functionality_id)
+
+    summaries = {}
+    for vendor_id, functionality_id, cell_count, scored_count, confirmed_count, score_sum in ScoreSummary.objects\
+            .filter(project=project, level=ScoreSummary.REQUIREMENT, vendor__is_active=True).order_by()\
+            .values_list('vendor_id', 'functionality_id', 'cell_count', 'scored_count', 'confirmed_count',
+                         'score_sum'):
+        summaries.setdefault(functionality_id, []).append((vendor_id, cell_count, scored_count, confirmed_count,
+                                                           score_sum))
+    nodes = []
+    for name in sorted(requirement_ids):
+        parts = split_tree_name(name)
+        totals = {vendor['id']: _totals() for vendor in vendors}
+        for functionality_id in requirement_ids[name]:
+            for vendor_id, cell_count, scored_count, confirmed_count, score_sum in summaries.get(functionality_id, []):
+                vendor_totals = totals.setdefault(vendor_id, _totals())
+                vendor_totals['cell_count'] += cell_count
+                vendor_totals['scored_count'] += scored_count
+                vendor_totals['confirmed_count'] += confirmed_count
+                vendor_totals['score_sum'] += score_sum
+        for vendor_totals in totals.values():
+            vendor_totals['score_avg'] = vendor_totals['score_sum'] / vendor_totals['scored_count'] \
+                if vendor_totals['scored_count'] else None
+            vendor_totals['coverage'] = vendor_totals['scored_count'] / vendor_totals['cell_count'] \
+                if vendor_totals['cell_count'] else None
+        nodes.append({
+            'name': name,
+            'label': parts[-1],
+            'level': len(parts),
+            'parent': join_tree_name(parts[:-1]) if len(parts) > 1 else None,
+            'requirement_ids': sorted(requirement_ids[name]),
+            'vendors': totals,
+        })
+    return {'project': project.code, 'tree': tree, 'vendors': vendors, 'nodes': nodes}
+
+
+def get_rollups(project, tree='categories'):
+    """
+    the cached rollups of a project (see build_rollups); built again only after the project scores or the tags change
+    :param project: a Project or project code
+    :param tree: categories or priorities
+    :return: see build_rollups
+    """
+    if tree not in ROLLUP_TREES:
+        raise ValidationError(f"Unknown rollup tree [{tree}]! Valid trees are [{', '.join(ROLLUP_TREES)}]")
+    project = get_project(project)
+    key = ROLLUP_KEY.format(project_id=project.id, tree=tree, version=project_version(project.id),
+                            tag_version=tag_version())
+    return cache.get_or_set(key, lambda: build_rollups(project, tree), ROLLUP_CACHE_TIMEOUT)
+
+
+def rollup_branch(rollups, name=None):
+    """
+    drill down into a rollup
+    :param rollups: the result of get_rollups
+    :param name: a node Ex: user; None for the top level
+    :return: dict of node (None at the top) and its direct children
+    """
+    nodes = {node['name']: node for node in rollups['nodes']}
+    if name is not None and name not in nodes:
+        raise ObjectDoesNotExist(f"Tag [{name}] is not used by project [{rollups['project']}]!")
+    return {'project': rollups['project'], 'tree': rollups['tree'], 'vendors': rollups['vendors'],
+            'node': nodes.get(name), 'children': [node for node in rollups['nodes'] if node['parent'] == name]}
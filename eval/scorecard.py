@@ -0,0 +1,372 @@
+import threading
+import weakref
+from functools import partial
+from django.db import transaction
+from django.db.models import Count, Sum, Avg, Q, F, Case, When, FloatField, ExpressionWrapper
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from eval.models import Project, ProjectVendor, ProjectFunctionality, Evaluation, ScoreSummary
+from eval.versions import bump_project_version
+
+# aggregates computed in the database for every summary row
+SUMMARY_AGGREGATES = {
+    'cell_count': Count('id'),
+    'scored_count': Count('score'),
+    'confirmed_count': Count('id', filter=Q(confirmed=True)),
+    'score_sum': Sum('score'),
+    'score_avg': Avg('score'),
+}
+# counters of a summary row changed in place by change_summaries
+SUMMARY_COUNTS = ('cell_count', 'scored_count', 'confirmed_count', 'score_sum')
+# summary level -> (the ScoreSummary field of the row it counts, the Evaluation lookup it is grouped by); the vendor
+#   row only has its vendor
+SUMMARY_TARGETS = {
+    ScoreSummary.VENDOR: (None, None),
+    ScoreSummary.REQUIREMENT: ('functionality_id', 'functionality_id'),
+    ScoreSummary.CATEGORY: ('category_id', 'functionality__categories'),
+    ScoreSummary.USER: ('user_id', 'user_id'),
+}
+# the refreshes queued in the current transaction of each thread (see queue_vendor_refresh)
+_queued = threading.local()
+# the deletes of the current transaction of each thread (see pending_deletes)
+_pending = threading.local()
+
+
+def _summary(project_id, vendor_id, level, values, functionality_id=None, category_id=None, user_id=None):
+    return ScoreSummary(project_id=project_id, vendor_id=vendor_id, level=level, functionality_id=functionality_id,
+                        category_id=category_id, user_id=user_id, cell_count=values['cell_count'],
+                        scored_count=values['scored_count'],
+                        confirmed_count=values['confirmed_count'], score_sum=values['score_sum'] or 0,
+                        score_avg=values['score_avg'])
+
+
+def refresh_vendor_summary(vendor_id, functionality_ids=None):
+    """
+    recompute the summary rows of one vendor; used after the categories of requirements change and after deletes
+        that take many evaluations with them (evaluation changes move their rows in place, see change_summaries)
+    NOTE: the vendor and category rows are always rebuilt (a requirement may have lost a tag so the rows of its old
+        categories are stale too); pass functionality_ids to only rebuild the rows of those requirements (the
+        incremental path), or None to rebuild every row of the vendor
+    NOTE: a tag change does not move the user (progress) rows so only the full rebuild writes them
+    :param vendor_id: the vendor to refresh
+    :param functionality_ids: requirements whose evaluations changed or None for all
+    """
+    with transaction.atomic():
+        # NOTE: the vendor row is locked so refreshes of one vendor run one after the other and read what the previous
+        #   one committed
+        vendor = ProjectVendor.objects.select_for_update().filter(id=vendor_id).values('id', 'project_id').first()
+        if not vendor:
+            return
+        evaluations = Evaluation.objects.filter(vendor_id=vendor_id).order_by()
+        requirement_evaluations = evaluations
+        stale = ScoreSummary.objects.filter(vendor_id=vendor_id)
+        if functionality_ids is not None:
+            functionality_ids = list(functionality_ids)
+            requirement_evaluations = evaluations.filter(functionality_id__in=functionality_ids)
+            stale = stale.filter(~Q(level=ScoreSummary.REQUIREMENT) | Q(functionality_id__in=functionality_ids))\
+                .exclude(level=ScoreSummary.USER)
+
+        # NOTE: like refresh_project_summary a vendor without evaluations has no rows
+        totals = evaluations.aggregate(**SUMMARY_AGGREGATES)
+        rows = [_summary(vendor['project_id'], vendor_id, ScoreSummary.VENDOR, totals)] if totals['cell_count'] else []
+        for values in requirement_evaluations.values('functionality_id').annotate(**SUMMARY_AGGREGATES):
+            rows.append(_summary(vendor['project_id'], vendor_id, ScoreSummary.REQUIREMENT, values,
+                                 functionality_id=values['functionality_id']))
+        for values in evaluations.filter(functionality__categories__isnull=False)\
+                .values('functionality__categories').annotate(**SUMMARY_AGGREGATES):
+            rows.append(_summary(vendor['project_id'], vendor_id, ScoreSummary.CATEGORY, values,
+                                 category_id=values['functionality__categories']))
+        for values in evaluations.values('user_id').annotate(**SUMMARY_AGGREGATES) if functionality_ids is None else []:
+            rows.append(_summary(vendor['project_id'], vendor_id, ScoreSummary.USER, values,
+                                 user_id=values['user_id']))
+        stale.delete()
+        ScoreSummary.objects.bulk_create(rows)
+    _bump_on_commit([vendor['project_id']])
+
+
+class QueuedRefreshes(dict):
+    """
+    vendor id -> requirement ids (None for every requirement) to refresh when the transaction that queued them
+        commits; registered once per transaction as its commit callback
+    """
+    done = False
+
+    def __call__(self):
+        if self.done:
+            return
+        self.done = True
+        for vendor_id, functionality_ids in self.items():
+            refresh_vendor_summary(vendor_id, functionality_ids)
+
+
+def queue_vendor_refresh(vendor_id, functionality_ids=None):
+    """
+    refresh the rows of a vendor once the current transaction commits; everything queued in one transaction is merged
+        into one refresh per vendor (retagging requirements queues every vendor with evaluations for each of them)
+    NOTE: the thread only keeps a weak reference to the queue of its transaction; a rollback drops the commit callback
+        and with it the queue so nothing rolled back is refreshed later
+    :param vendor_id: the vendor to refresh
+    :param functionality_ids: requirements whose evaluations changed or None for all
+    """
+    queued = _queued.ref() if getattr(_queued, 'ref', None) else None
+    register = queued is None or queued.done
+    if register:
+        queued = QueuedRefreshes()
+        _queued.ref = weakref.ref(queued)
+    functionality_ids = None if functionality_ids is None else set(functionality_ids)
+    if vendor_id in queued:
+        functionality_ids = None if queued[vendor_id] is None or functionality_ids is None else \
+            queued[vendor_id] | functionality_ids
+    queued[vendor_id] = functionality_ids
+    if register:
+        # NOTE: outside a transaction this runs the refresh right away
+        transaction.on_commit(queued)
+
+
+def refresh_project_summary(project):
+    """
+    rebuild every summary row of a project (after bulk changes that bypass model signals, or to fill the table)
+    NOTE: four grouped queries for the whole project no matter how many vendors it has
+    :param project: the project (or project id) to rebuild
+    :return: the number of summary rows written
+    """
+    project_id = getattr(project, 'id', project)
+    evaluations = Evaluation.objects.filter(vendor__project_id=project_id).order_by()
+    with transaction.atomic():
+        # NOTE: locked like the vendor row in refresh_vendor_summary; the vendor rows too so no progress counter
+        #   (change_summaries) moves while the rows are counted
+        Project.objects.select_for_update().filter(id=project_id).values_list('id', flat=True).first()
+        _lock_vendors(ProjectVendor.objects.filter(project_id=project_id).values('id'))
+        rows = []
+        for values in evaluations.values('vendor_id').annotate(**SUMMARY_AGGREGATES):
+            rows.append(_summary(project_id, values['vendor_id'], ScoreSummary.VENDOR, values))
+        for values in evaluations.values('vendor_id', 'functionality_id').annotate(**SUMMARY_AGGREGATES):
+            rows.append(_summary(project_id, values['vendor_id'], ScoreSummary.REQUIREMENT, values,
+                                 functionality_id=values['functionality_id']))
+        for values in evaluations.filter(functionality__categories__isnull=False)\
+                .values('vendor_id', 'functionality__categories').annotate(**SUMMARY_AGGREGATES):
+            rows.append(_summary(project_id, values['vendor_id'], ScoreSummary.CATEGORY, values,
+                                 category_id=values['functionality__categories']))
+        for values in evaluations.values('vendor_id', 'user_id').annotate(**SUMMARY_AGGREGATES):
+            rows.append(_summary(project_id, values['vendor_id'], ScoreSummary.USER, values,
+                                 user_id=values['user_id']))
+        ScoreSummary.objects.filter(project_id=project_id).delete()
+        ScoreSummary.objects.bulk_create(rows, batch_size=1000)
+    bump_project_version(project_id)
+    return len(rows)
+
+
+def _lock_vendors(vendor_ids):
+    """
+    lock the vendor rows for the rest of the transaction; every writer of the summary rows of a vendor takes the lock
+        first so they run one after the other (in id order so two of them never wait on each other)
+    :return: dict of vendor id -> project id
+    """
+    return dict(ProjectVendor.objects.select_for_update().filter(id__in=vendor_ids).order_by('id')
+                .values_list('id', 'project_id'))
+
+
+def _bump_on_commit(project_ids):
+    for project_id in set(project_ids):
+        transaction.on_commit(partial(bump_project_version, project_id))
+
+
+def cell_summary_keys(cells):
+    """
+    :param cells: iterable of (vendor id, functionality id, user id)
+    :return: set of the (level, vendor id, target id) keys of every summary row counting these cells (see
+        rebuild_summaries)
+    """
+    cells = set(cells)
+    categories = _requirement_categories({functionality_id for vendor_id, functionality_id, user_id in cells})
+    keys = set()
+    for vendor_id, functionality_id, user_id in cells:
+        keys.update(_summary_keys(vendor_id, functionality_id, user_id, categories))
+    return keys
+
+
+def _requirement_categories(functionality_ids):
+    categories = {}
+    for functionality_id, category_id in ProjectFunctionality.categories.through.objects\
+            .filter(projectfunctionality_id__in=functionality_ids)\
+            .values_list('projectfunctionality_id', 'functionalitycategory_id'):
+        categories.setdefault(functionality_id, []).append(category_id)
+    return categories
+
+
+def _summary_keys(vendor_id, functionality_id, user_id, categories):
+    return [(ScoreSummary.VENDOR, vendor_id, None), (ScoreSummary.REQUIREMENT, vendor_id, functionality_id),
+            (ScoreSummary.USER, vendor_id, user_id)] + \
+        [(ScoreSummary.CATEGORY, vendor_id, category_id) for category_id in categories.get(functionality_id, ())]
+
+
+def rebuild_summaries(keys):
+    """
+    count some summary rows again from their evaluations in the current transaction; rows left without evaluations
+        are removed
+    :param keys: iterable of (level, vendor id, target id); the target is the requirement, category or user of the row
+        (None for the vendor row) Ex: (ScoreSummary.USER, vendor id, user id)
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    with transaction.atomic():
+        projects = _lock_vendors({vendor_id for level, vendor_id, target_id in keys})
+        rows = []
+        for level, (target, group) in SUMMARY_TARGETS.items():
+            level_keys = {key for key in keys if key[0] == level}
+            if not level_keys:
+                continue
+            vendor_ids = {vendor_id for level, vendor_id, target_id in level_keys}
+            target_ids = {target_id for level, vendor_id, target_id in level_keys}
+            evaluations = Evaluation.objects.filter(vendor_id__in=vendor_ids).order_by()
+            stale = ScoreSummary.objects.filter(level=level, vendor_id__in=vendor_ids)
+            if target:
+                evaluations = evaluations.filter(**{f'{group}__in': target_ids})
+                stale = stale.filter(**{f'{target}__in': target_ids})
+            for values in evaluations.values('vendor_id', *([group] if target else [])).annotate(**SUMMARY_AGGREGATES):
+                target_id = values[group] if target else None
+                if (level, values['vendor_id'], target_id) in level_keys:
+                    rows.append(_summary(projects[values['vendor_id']], values['vendor_id'], level, values,
+                                         **({target: target_id} if target else {})))
+            ScoreSummary.objects.filter(id__in=[summary_id for summary_id, vendor_id, target_id in
+                                                stale.values_list('id', 'vendor_id', target or 'vendor_id')
+                                                if (level, vendor_id, target_id if target else None) in level_keys])\
+                .delete()
+        ScoreSummary.objects.bulk_create(rows)
+    _bump_on_commit(projects.values())
+
+
+def change_summaries(changes):
+    """
+    move evaluation changes into the summary rows in the current transaction (the transaction of the save or delete)
+        so they are never behind the evaluations; the vendor, requirement, category and user rows of each change are
+        updated in place with the difference instead of being counted again
+    NOTE: a row that is not there yet is counted from its evaluations (rebuild_summaries); one left without
+        evaluations is removed
+    NOTE: the projects of every change are bumped (eval.versions) once the transaction commits, even when no count
+        changed (the notes of an evaluation are on the cached pages too)
+    :param changes: iterable of (before, after): (vendor id, functionality id, user id, score, confirmed) of an
+        evaluation before and after the change; before is None for a new evaluation and after for a deleted one
+    """
+    changes = list(changes)
+    vendor_ids = {cell[0] for change in changes for cell in change if cell is not None}
+    changes = [(before, after) for before, after in changes if before != after]
+    categories = _requirement_categories({cell[1] for change in changes for cell in change if cell is not None})
+    deltas = {}
+    for before, after in changes:
+        for cell, sign in ((before, -1), (after, 1)):
+            if cell is None:
+                continue
+            vendor_id, functionality_id, user_id, score, confirmed = cell
+            for key in _summary_keys(vendor_id, functionality_id, user_id, categories):
+                counts = deltas.setdefault(key, dict.fromkeys(SUMMARY_COUNTS, 0))
+                counts['cell_count'] += sign
+                counts['scored_count'] += sign if score is not None else 0
+                counts['confirmed_count'] += sign if confirmed else 0
+                counts['score_sum'] += sign * (score or 0)
+    deltas = {key: counts for key, counts in deltas.items() if any(counts.values())}
+    if not deltas:
+        _bump_on_commit(ProjectVendor.objects.filter(id__in=vendor_ids).values_list('project_id', flat=True))
+        return
+    with transaction.atomic():
+        projects = _lock_vendors({vendor_id for level, vendor_id, target_id in deltas})
+        missing = set()
+        for (level, vendor_id, target_id), counts in deltas.items():
+            target = SUMMARY_TARGETS[level][0]
+            rows = ScoreSummary.objects.filter(level=level, vendor_id=vendor_id,
+                                               **({target: target_id} if target else {}))
+            score_sum = F('score_sum') + counts['score_sum']
+            scored_count = F('scored_count') + counts['scored_count']
+            updated = rows.update(cell_count=F('cell_count') + counts['cell_count'], scored_count=scored_count,
+                                  confirmed_count=F('confirmed_count') + counts['confirmed_count'],
+                                  score_sum=score_sum,
+                                  # NOTE: the right hand side of an update reads the values before it
+                                  score_avg=Case(When(scored_count__gt=-counts['scored_count'],
+                                                      then=ExpressionWrapper(Cast(score_sum, FloatField()) /
+                                                                             scored_count, output_field=FloatField())),
+                                                 default=None, output_field=FloatField()),
+                                  updated=timezone.now())
+            if not updated:
+                missing.add((level, vendor_id, target_id))
+            elif counts['cell_count'] < 0:
+                rows.filter(cell_count__lte=0).delete()
+        rebuild_summaries(missing)
+    _bump_on_commit(projects.values())
+
+
+class PendingDeletes(dict):
+    """
+    what is being deleted in the current transaction whose evaluations are taken out of the summary rows by whoever
+        deletes them instead of one change at a time by the evaluation signals (see eval.signals): model -> set of
+        ids, plus REFRESH -> the vendors to refresh once those deletes are done
+    NOTE: registered once per transaction as its commit callback and only weakly referenced by the thread so a
+        rollback drops it with the transaction (like QueuedRefreshes)
+    """
+    REFRESH = 'refresh'
+    done = False
+
+    def __call__(self):
+        self.done = True
+
+    def marked(self, model, object_id):
+        return object_id in self.get(model, ())
+
+
+def pending_deletes(create=True):
+    """
+    :param create: start the pending deletes of the current transaction if there are none yet
+    :return: the PendingDeletes of the current transaction of this thread (None if there are none and create is
+        False)
+    """
+    pending = _pending.ref() if getattr(_pending, 'ref', None) else None
+    if pending is not None and not pending.done:
+        return pending
+    if not create:
+        return None
+    pending = PendingDeletes()
+    _pending.ref = weakref.ref(pending)
+    transaction.on_commit(pending)
+    return pending
+
+
+def summary_values(summary):
+    """
+    :return: dict of the measures of a summary row for json output
+    """
+    return {
+        'cell_count': summary.cell_count,
+        'scored_count': summary.scored_count,
+        'unscored_count': summary.unscored_count,
+        'coverage': summary.coverage,
+        'confirmed_count': summary.confirmed_count,
+        'confirmed_ratio': summary.confirmed_ratio,
+        'score_avg': summary.score_avg,
+    }
+
+
+def get_scorecard(project_code):
+    """
+    build the vendor scorecard of a project from the summary table (no evaluation scans)
+    :param project_code: the project code
+    :return: dict with a list of vendors, each with its totals, requirements and categories
+    """
+    # NOTE: imported here as eval.utils imports this module
+    from eval.utils import get_project
+    project = get_project(project_code)
+    vendors = {}
+    summaries = ScoreSummary.objects.filter(project=project, vendor__is_active=True).exclude(level=ScoreSummary.USER)\
+        .select_related('vendor', 'functionality', 'category').order_by('vendor__name', 'level', 'id')
+    for summary in summaries:
+        vendor = vendors.setdefault(summary.vendor_id, {'id': summary.vendor_id, 'name': summary.vendor.name,
+                                                        'requirements': [], 'categories': []})
+        if summary.level == ScoreSummary.VENDOR:
+            vendor.update(summary_values(summary))
+        elif summary.level == ScoreSummary.REQUIREMENT:
+            vendor['requirements'].append(dict(id=summary.functionality_id, name=str(summary.functionality),
+                                               **summary_values(summary)))
+        else:
+            vendor['categories'].append(dict(id=summary.category_id, name=summary.category.name,
+                                             **summary_values(summary)))
+    return {'project': project.code, 'name': project.name, 'vendors': list(vendors.values())}
@@ -0,0 +1,118 @@
+from tagulous.utils import split_tree_name, join_tree_name
+
+from eval.models import ProjectVendor, ProjectFunctionality, PriorityWeight
+from eval.utils import get_project
+from eval.matrix import get_score_matrix
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def priority_weight(path, weights):
+    """
+    weight of a priority tag path; the closest configured tag walking up the tree wins
+    Ex: with {'large': 3.0} the path 'large/must-have' weighs 3.0
+    :param path: the priority tag name (path) Ex: 'large/must-have'
+    :param weights: dict of configured tag name -> weight
+    :return: the weight or None if neither the tag nor any of its parents is configured
+    """
+    parts = split_tree_name(path)
+    while parts:
+        weight = weights.get(join_tree_name(parts))
+        if weight is not None:
+            return weight
+        parts = parts[:-1]
+    return None
+
+
+def requirement_weights(project):
+    """
+    weight of every requirement of a project from its priority tags (two queries)
+    NOTE: a requirement with more than one weighted priority takes the highest weight; requirements without any
+        weighted priority are not in the result and use PriorityWeight.DEFAULT_WEIGHT
+    :param project: the project
+    :return: dict of functionality id -> weight
+    """
+    weights = dict(PriorityWeight.objects.filter(project=project).values_list('priority__name', 'weight'))
+    if not weights:
+        return {}
+    result = {}
+    links = ProjectFunctionality.priorities.through.objects.filter(projectfunctionality__project=project)\
+        .values_list('projectfunctionality_id', 'prioritycategory__name')
+    for functionality_id, name in links:
+        weight = priority_weight(name, weights)
+        if weight is not None:
+            result[functionality_id] = max(weight, result.get(functionality_id, weight))
+    return result
+
+
+def weighted_vendor_totals(project, use_numpy=None):
+    """
+    weighted score of every active vendor of a project computed in one pass over the scored cells of its cached score
+    matrix (eval.matrix)
+        weighted_score = sum(score * weight) / sum(weight) over the scored cells of the vendor (0-10 like a score)
+    :param project: a Project or a project code
+    :param use_numpy: force (True) or skip (False) the NumPy engine; by default NumPy is used when it is installed
+    :return: list of dicts (vendor_id, name, weighted_score, weighted_sum, weight_total, scored_count, rank) ordered
+        best first
+    """
+    project = get_project(project)
+    weights = requirement_weights(project)
+    rows = ((vendor_id, functionality_id, score)
+            for user_id, vendor_id, functionality_id, score in get_score_matrix(project).cells())
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    totals = _numpy_totals(rows, weights) if use_numpy else _python_totals(rows, weights)
+
+    vendors = ProjectVendor.objects.active().filter(project=project).values_list('id', 'name')
+    results = []
+    for vendor_id, name in vendors:
+        weighted_sum, weight_total, scored_count = totals.get(vendor_id, (0.0, 0.0, 0))
+        results.append({
+            'vendor_id': vendor_id,
+            'name': name,
+            'weighted_score': weighted_sum / weight_total if weight_total else None,
+            'weighted_sum': weighted_sum,
+            'weight_total': weight_total,
+            'scored_count': scored_count,
+        })
+    results.sort(key=lambda result: (result['weighted_score'] is None, -(result['weighted_score'] or 0),
+                                     result['name']))
+    for rank, result in enumerate(results, start=1):
+        result['rank'] = rank
+    return results
+
+
+def _python_totals(rows, weights):
+    """
+    :return: dict of vendor id -> (weighted sum, weight total, scored count)
+    """
+    default = PriorityWeight.DEFAULT_WEIGHT
+    totals = {}
+    for vendor_id, functionality_id, score in rows:
+        weight = weights.get(functionality_id, default)
+        weighted_sum, weight_total, scored_count = totals.get(vendor_id, (0.0, 0.0, 0))
+        totals[vendor_id] = (weighted_sum + score * weight, weight_total + weight, scored_count + 1)
+    return totals
+
+
+def _numpy_totals(rows, weights):
+    """
+    same as _python_totals but vectorized; weights are looked up once per distinct requirement
+    :return: dict of vendor id -> (weighted sum, weight total, scored count)
+    """
+    data = numpy.array(list(rows), dtype=numpy.int64).reshape(-1, 3)
+    if not len(data):
+        return {}
+    vendor_ids, vendor_index = numpy.unique(data[:, 0], return_inverse=True)
+    functionality_ids, functionality_index = numpy.unique(data[:, 1], return_inverse=True)
+    functionality_weights = numpy.array([weights.get(int(functionality_id), PriorityWeight.DEFAULT_WEIGHT)
+                                         for functionality_id in functionality_ids], dtype=numpy.float64)
+    row_weights = functionality_weights[functionality_index]
+    weighted_sums = numpy.bincount(vendor_index, weights=data[:, 2] * row_weights)
+    weight_totals = numpy.bincount(vendor_index, weights=row_weights)
+    counts = numpy.bincount(vendor_index)
+    return {int(vendor_id): (float(weighted_sums[i]), float(weight_totals[i]), int(counts[i]))
+            for i, vendor_id in enumerate(vendor_ids)}
@@ -0,0 +1,279 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.contrib.auth.models import Group, User
+
+from eval.models import Project, ProjectVendor, ProjectFunctionality, Evaluation, FunctionalityCategory, \
+    PriorityCategory, NOT_LOADED
+from eval.scorecard import queue_vendor_refresh, refresh_vendor_summary, change_summaries, rebuild_summaries, \
+    cell_summary_keys, pending_deletes, PendingDeletes
+from eval.utils import sync_evaluations
+from eval.lookups import clear_project_lookups, clear_group_lookups, clear_user_lookups
+from eval.versions import bump_project_version, bump_tag_version
+
+# the evaluation fields the summary rows are counted from (eval.scorecard.change_summaries)
+SUMMARY_FIELDS = ('vendor_id', 'functionality_id', 'user_id', 'score', 'confirmed')
+
+
+def summary_cell(values):
+    """
+    :param values: dict of the tracked fields (see Evaluation.TRACKED_FIELDS) Ex: the ones loaded from the database
+    :return: (vendor id, functionality id, user id, score, confirmed) for eval.scorecard.change_summaries or None if
+        one is missing
+    """
+    cell = tuple(values.get(name, NOT_LOADED) for name in SUMMARY_FIELDS)
+    return None if NOT_LOADED in cell else cell
+
+
+@receiver(post_save, sender=Evaluation)
+def evaluation_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    move the change into the summary rows in the transaction of the save (Evaluation.save runs in one) so they commit
+        or roll back with it
+    NOTE: the values the row had are the ones loaded from the database; when some were not loaded (a deferred field
+        or a raw fixture save) the rows of the evaluation are counted again instead
+    """
+    saved = instance.saved_fields(update_fields)
+    loaded = {name: instance.loaded_value(name, NOT_LOADED) for name in SUMMARY_FIELDS}
+    after = summary_cell({name: getattr(instance, name) if name in saved else loaded[name] for name in SUMMARY_FIELDS})
+    before = None if created else summary_cell(loaded)
+    if after is None or (before is None and not created):
+        cells = {(instance.vendor_id, instance.functionality_id, instance.user_id)}
+        rebuild_summaries(cell_summary_keys(cells | ({before[:3]} if before is not None else set())))
+    else:
+        change_summaries([(before, after)])
+
+
+@receiver(post_delete, sender=Evaluation)
+def evaluation_deleted(sender, instance, **kwargs):
+    """
+    take a deleted evaluation out of the summary rows in the transaction of the delete; skipped when whoever deletes
+        it takes care of that (see eval.scorecard.PendingDeletes)
+    """
+    pending = pending_deletes(create=False)
+    if pending is not None and (pending.marked(Evaluation, instance.id) or
+                                pending.marked(ProjectVendor, instance.vendor_id) or
+                                pending.marked(ProjectFunctionality, instance.functionality_id) or
+                                pending.marked(User, instance.user_id)):
+        return
+    change_summaries([(summary_cell({name: getattr(instance, name) for name in SUMMARY_FIELDS}), None)])
+
+
+@receiver(pre_delete, sender=ProjectVendor)
+@receiver(pre_delete, sender=ProjectFunctionality)
+@receiver(pre_delete, sender=User)
+def evaluations_deleting(sender, instance, **kwargs):
+    """
+    the evaluations deleted with a vendor, requirement or user (or a project, through its vendors) are not taken out
+        of the summary rows one at a time: the rows of a vendor go with it and the user rows with their user; the
+        other rows of their vendors are counted again once (eval.scorecard.refresh_vendor_summary) when the last of
+        the deletes of the transaction is done
+    NOTE: pre_delete is sent for everything a delete takes with it before any row is deleted
+    """
+    pending = pending_deletes()
+    pending.setdefault(sender, set()).add(instance.pk)
+    if sender is not ProjectVendor:
+        lookup = 'functionality' if sender is ProjectFunctionality else 'user'
+        pending.setdefault(PendingDeletes.REFRESH, set()).update(
+            Evaluation.objects.filter(**{lookup: instance}).order_by().values_list('vendor_id', flat=True).distinct())
+
+
+@receiver(post_delete, sender=ProjectVendor)
+@receiver(post_delete, sender=ProjectFunctionality)
+@receiver(post_delete, sender=User)
+def evaluations_deleted(sender, instance, **kwargs):
+    """
+    count the rows of the vendors again once the last vendor, requirement or user deleted in the transaction is gone
+        (the deleted vendors are skipped as they have no rows left)
+    """
+    pending = pending_deletes(create=False)
+    if pending is None:
+        return
+    pending.get(sender, set()).discard(instance.pk)
+    if any(ids for model, ids in pending.items() if model not in (PendingDeletes.REFRESH, Evaluation)):
+        return
+    for vendor_id in sorted(pending.pop(PendingDeletes.REFRESH, ())):
+        refresh_vendor_summary(vendor_id)
+
+
+def refresh_requirement_vendors(functionality_ids):
+    """
+    refresh the scorecard rows of every vendor with evaluations for these requirements once the change is committed
+    """
+    vendor_ids = Evaluation.objects.filter(functionality_id__in=functionality_ids).order_by()\
+        .values_list('vendor_id', flat=True).distinct()
+    for vendor_id in vendor_ids:
+        queue_vendor_refresh(vendor_id, functionality_ids)
+
+
+@receiver(post_save, sender=ProjectFunctionality)
+def requirement_changed(sender, instance, created, **kwargs):
+    """
+    the categories of a requirement may have changed; refresh its rows for every vendor that has evaluations for it
+    """
+    if not created:
+        refresh_requirement_vendors([instance.id])
+
+
+@receiver(post_save, sender=ProjectVendor)
+@receiver(post_delete, sender=ProjectVendor)
+@receiver(post_save, sender=ProjectFunctionality)
+@receiver(post_delete, sender=ProjectFunctionality)
+def project_data_changed(sender, instance, **kwargs):
+    """
+    the cached rollups and docroot pages of a project list its active vendors and requirements by name
+    """
+    bump_project_version(instance.project_id)
+
+
+@receiver(post_save, sender=FunctionalityCategory)
+@receiver(post_delete, sender=FunctionalityCategory)
+@receiver(post_save, sender=PriorityCategory)
+@receiver(post_delete, sender=PriorityCategory)
+def tags_changed(sender, **kwargs):
+    """
+    renamed, moved or deleted tags change the tag trees of every project
+    """
+    bump_tag_version()
+
+
+@receiver(m2m_changed, sender=ProjectFunctionality.categories.through)
+@receiver(m2m_changed, sender=ProjectFunctionality.priorities.through)
+def requirement_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    tagging a requirement moves it in the tag trees of its project; a new or removed category also moves its scores
+        to other category rows of the scorecard
+    NOTE: clear does not pass the ids it removes so they are kept on the instance in pre_clear
+    """
+    categories = sender is ProjectFunctionality.categories.through
+    if action == 'pre_clear':
+        instance._eval_cleared_ids = set(instance.projectfunctionality_set.values_list('id', flat=True)) \
+            if reverse and categories else None
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        bump_tag_version()
+    else:
+        bump_project_version(instance.project_id)
+    if not categories:
+        return
+    if not reverse:
+        refresh_requirement_vendors([instance.id])
+    else:
+        functionality_ids = getattr(instance, '_eval_cleared_ids', set()) if action == 'post_clear' else pk_set
+        if functionality_ids:
+            refresh_requirement_vendors(list(functionality_ids))
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed(sender, instance, **kwargs):
+    """
+    the admin project filter lists active projects by name; the cached pages of the project show its name
+    """
+    clear_project_lookups()
+    bump_project_version(instance.id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    """
+    the admin applies to filter lists requirement groups by name
+    """
+    clear_group_lookups()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    """
+    the admin user filter searches the cached usernames; logging in only saves last_login so it is skipped
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    clear_user_lookups()
+
+
+def sync_on_commit(project_id, **cells):
+    """
+    sync the cells of a project (see eval.utils.sync_evaluations) once the current transaction commits
+    """
+    transaction.on_commit(partial(sync_evaluations, project_id, **cells))
+
+
+def group_project_ids(group_names):
+    """
+    :return: ids of the active projects a group belongs to; same prefix match as get_project_groups so both the
+        <code>:Members group and the requirement groups of a project match
+    """
+    names = [name.lower() for name in group_names]
+    return [project_id for project_id, code in Project.objects.active().values_list('id', 'code')
+            if any(name.startswith(code.lower()) for name in names)]
+
+
+@receiver(post_save, sender=ProjectVendor)
+def vendor_saved(sender, instance, raw=False, **kwargs):
+    """
+    a new or reactivated vendor gets its cells; a deactivated vendor loses its empty ones
+    """
+    if not raw:
+        sync_on_commit(instance.project_id, vendor_ids=[instance.id])
+
+
+@receiver(post_save, sender=ProjectFunctionality)
+def requirement_saved(sender, instance, raw=False, **kwargs):
+    """
+    a new or reactivated requirement gets its cells; a deactivated requirement loses its empty ones
+    """
+    if not raw:
+        sync_on_commit(instance.project_id, functionality_ids=[instance.id])
+
+
+@receiver(m2m_changed, sender=ProjectFunctionality.groups.through)
+def requirement_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    the groups a requirement applies to decide which members get cells for it
+    NOTE: clear does not pass the ids it removes so they are kept on the instance in pre_clear
+    """
+    if action == 'pre_clear':
+        instance._eval_cleared_ids = set(instance.projectfunctionality_set.values_list('id', flat=True)) \
+            if reverse else None
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync_on_commit(instance.project_id, functionality_ids=[instance.id])
+        return
+    functionality_ids = getattr(instance, '_eval_cleared_ids', set()) if action == 'post_clear' else pk_set
+    projects = {}
+    for project_id, functionality_id in ProjectFunctionality.objects.filter(id__in=functionality_ids)\
+            .values_list('project_id', 'id'):
+        projects.setdefault(project_id, []).append(functionality_id)
+    for project_id, project_functionality_ids in projects.items():
+        sync_on_commit(project_id, functionality_ids=project_functionality_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    joining or leaving <code>:Members (or a requirement group of the project) changes the cells of that user
+    NOTE: clear does not pass the ids it removes so they are kept on the instance in pre_clear
+    """
+    if action == 'pre_clear':
+        instance._eval_cleared_ids = set(instance.user_set.values_list('id', flat=True)) if reverse else \
+            set(instance.groups.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    ids = getattr(instance, '_eval_cleared_ids', set()) if action == 'post_clear' else pk_set
+    if reverse:
+        group_names, user_ids = [instance.name], list(ids)
+    else:
+        group_names, user_ids = list(Group.objects.filter(id__in=ids).values_list('name', flat=True)), [instance.id]
+    if not user_ids:
+        return
+    for project_id in group_project_ids(group_names):
+        sync_on_commit(project_id, user_ids=user_ids)
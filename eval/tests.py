@@ -1,3 +1,1294 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+from datetime import timedelta
+from itertools import product
+from types import SimpleNamespace
+from asgiref.sync import async_to_sync
+from unittest import skipIf
+from unittest.mock import patch
+from markdownx.utils import markdownify
+from django.test import TestCase, TransactionTestCase, AsyncClient, RequestFactory, override_settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.template import Template, Context
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction, IntegrityError, DatabaseError
+from django.test.utils import CaptureQueriesContext
+from django.db.migrations.executor import MigrationExecutor
+from django.contrib.auth.models import User, Group
+from django.utils import timezone
 
-# Create your tests here.
+from .models import Project, ProjectVendor, ProjectFunctionality, Evaluation, FunctionalityCategory, \
+    PriorityCategory, PriorityWeight
+from .admin import EvaluationAdmin, EvaluationResource
+from .utils import generate_evaluations
+from .lookups import project_lookups, user_lookups
+from .applicability import ApplicabilityIndex
+from .benchmark import seed_project, run_benchmarks, compare_benchmarks, load_test, drop_evaluation_indexes, \
+    restore_evaluation_indexes
+from .metrics import METRICS
+from .models import ScoreSummary, Job
+from .jobs import claim_next_job, cancel_job, run_job
+from .imports import openpyxl
+from .analytics import project_statistics, numpy
+from .rollups import get_rollups
+from .pagecache import is_cacheable, page_cache_key
+from .matrix import ScoreMatrix, get_score_matrix
+from .progress import project_progress
+from .export import filter_evaluations, stream_evaluations_columns
+from .scoring import priority_weight, requirement_weights, weighted_vendor_totals
+from .grid import save_score_grid
+from .scorecard import get_scorecard, refresh_vendor_summary, queue_vendor_refresh, refresh_project_summary, \
+    change_summaries
+from docroot.context import PageContext
+
+
+class EvaluationAdminTests(TestCase):
+    """
+    the evaluation changelist should cost the same number of queries no matter how many rows are on the page
+    """
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        project = Project.objects.create(code='auth', name='Auth')
+        Group.objects.create(name='auth:Members').user_set.add(self.user)
+        for i in range(3):
+            ProjectVendor.objects.create(project=project, name=f'Vendor {i}')
+        for i in range(10):
+            ProjectFunctionality.objects.create(project=project, description=f'Requirement {i}', order=i + 1,
+                                                priorities='large/must-have, small/like-to-have',
+                                                categories='user/basic, staff/advanced')
+        generate_evaluations('auth')
+        self.client.force_login(self.user)
+
+    def changelist_queries(self, page_size):
+        original = EvaluationAdmin.list_per_page
+        EvaluationAdmin.list_per_page = page_size
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/admin/eval/evaluation/')
+        finally:
+            EvaluationAdmin.list_per_page = original
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), min(page_size, Evaluation.objects.count()))
+        return len(queries)
+
+    def test_changelist_query_count_is_constant(self):
+        self.assertEqual(self.changelist_queries(5), self.changelist_queries(30))
+
+    def test_changelist_shows_tags(self):
+        response = self.client.get('/admin/eval/evaluation/')
+        self.assertContains(response, 'large/must-have')
+        self.assertContains(response, 'staff/advanced')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LookupCacheTests(TestCase):
+    """
+    admin filter lookups are read from the cache and cleared by signals when their source rows change
+    """
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        User.objects.create_user('someone_else')
+        Project.objects.create(code='auth', name='Auth')
+        self.client.force_login(self.user)
+
+    def test_project_lookups_are_cached_and_cleared(self):
+        self.assertEqual(project_lookups(), [('auth', 'Auth')])
+        with CaptureQueriesContext(connection) as queries:
+            project_lookups()
+        self.assertEqual(len(queries), 0)
+        Project.objects.create(code='crm', name='Crm')
+        self.assertEqual(project_lookups(), [('auth', 'Auth'), ('crm', 'Crm')])
+
+    def test_user_lookups_are_cleared_on_new_user(self):
+        self.assertEqual(len(user_lookups()), 2)
+        User.objects.create_user('newcomer')
+        self.assertIn('newcomer', [username for user_id, username in user_lookups()])
+
+    def test_user_filter_is_searched_instead_of_listed(self):
+        response = self.client.get('/admin/eval/evaluation/')
+        self.assertNotContains(response, 'someone_else')
+        response = self.client.get('/eval/api/users/', {'q': 'some'})
+        self.assertEqual([user['username'] for user in response.json()['results']], ['someone_else'])
+        response = self.client.get('/eval/api/users/', {'q': 'admin'})
+        self.assertEqual(response.json()['results'], [])
+
+
+class GenerateEvaluationsTests(TestCase):
+    """
+    set based generation of the missing cells of a project, one row per (user, vendor, requirement)
+    """
+    def setUp(self):
+        self.users = [User.objects.create_user(f'member{i}') for i in range(2)]
+        self.project = Project.objects.create(code='gen', name='Generate')
+        Group.objects.create(name='gen:Members').user_set.add(*self.users)
+        self.vendor = ProjectVendor.objects.create(project=self.project, name='Vendor 0')
+        self.requirements = [ProjectFunctionality.objects.create(project=self.project, description=f'Requirement {i}')
+                             for i in range(2)]
+
+    def test_cells_created_by_another_run_are_not_reported(self):
+        def other_run(done, total):
+            # another process writes the last cell while this run is still going
+            if done == 1:
+                Evaluation.objects.create(user=self.users[1], vendor=self.vendor, functionality=self.requirements[1])
+
+        output = generate_evaluations('gen', batch_size=1, progress=other_run)
+        self.assertEqual(output.count('created evaluation'), 3)
+        self.assertNotIn('[member1], Vendor 0, Requirement 1', output)
+        self.assertIn('skipped 1 evaluations created by another run', output)
+        self.assertEqual(Evaluation.objects.count(), 4)
+        self.assertEqual(generate_evaluations('gen'), "done!\n")
+
+    def test_dry_run_writes_nothing(self):
+        Evaluation.objects.create(user=self.users[0], vendor=self.vendor, functionality=self.requirements[0])
+        out = io.StringIO()
+        call_command('evaluations', 'generate', 'gen', '--dry-run', stdout=out)
+        self.assertIn('dry run: 3 evaluations would be created for 2 members, 1 vendors and 2 requirements',
+                      out.getvalue())
+        self.assertEqual(Evaluation.objects.count(), 1)
+        self.assertEqual(generate_evaluations('gen').count('created evaluation'), 3)
+        self.assertEqual(Evaluation.objects.count(), 4)
+
+    def test_one_evaluation_per_cell(self):
+        generate_evaluations('gen')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Evaluation.objects.create(user=self.users[0], vendor=self.vendor, functionality=self.requirements[0])
+        # another vendor or user is another cell
+        Evaluation.objects.create(user=self.users[0], functionality=self.requirements[0],
+                                  vendor=ProjectVendor.objects.create(project=self.project, name='Vendor 1'))
+
+
+class DuplicateEvaluationMigrationTests(TransactionTestCase):
+    """
+    0004 merges the duplicate cells of older databases into one row before 0005 makes them unique
+    """
+    before = [('eval', '0003_alter_projectfunctionality_description')]
+    after = [('eval', '0004_merge_duplicate_evaluations')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model('auth', 'User').objects.create(username='evaluator')
+        project = apps.get_model('eval', 'Project').objects.create(code='old', name='Old')
+        vendor = apps.get_model('eval', 'ProjectVendor').objects.create(project=project, name='Vendor 0')
+        requirements = [apps.get_model('eval', 'ProjectFunctionality').objects.create(project=project,
+                                                                                      description=f'Requirement {i}')
+                        for i in range(2)]
+        Evaluation = apps.get_model('eval', 'Evaluation')
+        kept = Evaluation.objects.create(user=user, vendor=vendor, functionality=requirements[0], notes='first')
+        for score, confirmed, notes in ((6, False, 'second'), (8, True, 'first'), (None, False, None)):
+            Evaluation.objects.create(user=user, vendor=vendor, functionality=requirements[0], score=score,
+                                      confirmed=confirmed, notes=notes)
+        single = Evaluation.objects.create(user=user, vendor=vendor, functionality=requirements[1], score=3)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Evaluation = executor.loader.project_state(self.after).apps.get_model('eval', 'Evaluation')
+        self.assertEqual(sorted(Evaluation.objects.values_list('id', flat=True)), [kept.id, single.id])
+        merged = Evaluation.objects.get(id=kept.id)
+        # the first score entered, confirmed by any duplicate and the distinct notes of all of them
+        self.assertEqual((merged.score, merged.confirmed, merged.notes), (6, True, 'first\n\nsecond'))
+        self.assertEqual(Evaluation.objects.get(id=single.id).score, 3)
+
+
+class SummaryMigrationTests(TransactionTestCase):
+    """
+    0008 and 0011 fill the summary table from the evaluations of a database that had none
+    """
+    before = [('eval', '0007_job')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def rows(self):
+        return sorted(ScoreSummary.objects.values_list('vendor_id', 'level', 'functionality_id', 'category_id',
+                                                       'user_id', 'cell_count', 'scored_count', 'confirmed_count',
+                                                       'score_sum', 'score_avg'), key=str)
+
+    def test_summaries_are_filled(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        users = [apps.get_model('auth', 'User').objects.create(username=f'evaluator{i}') for i in range(2)]
+        project = apps.get_model('eval', 'Project').objects.create(code='old', name='Old')
+        vendors = [apps.get_model('eval', 'ProjectVendor').objects.create(project=project, name=f'Vendor {i}')
+                   for i in range(2)]
+        requirements = [apps.get_model('eval', 'ProjectFunctionality').objects.create(project=project,
+                                                                                      description=f'Requirement {i}')
+                        for i in range(2)]
+        requirements[0].categories.add(apps.get_model('eval', 'FunctionalityCategory').objects.create(name='Login'))
+        Evaluation = apps.get_model('eval', 'Evaluation')
+        for i, (user, vendor, requirement) in enumerate(product(users, vendors, requirements)):
+            Evaluation.objects.create(user=user, vendor=vendor, functionality=requirement, score=i if i % 3 else None,
+                                      confirmed=i % 2 == 0)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        filled = self.rows()
+        self.assertEqual(len(filled), 2 * (1 + 2 + 1 + 2))
+        refresh_project_summary(project.id)
+        self.assertEqual(filled, self.rows())
+        scorecard = get_scorecard('old')
+        self.assertEqual([len(vendor['requirements']) for vendor in scorecard['vendors']], [2, 2])
+        self.assertEqual(project_progress('old')['cell_count'], 8)
+
+
+class EvaluationIndexTests(TransactionTestCase):
+    """
+    the benchmark can measure queries without the 0006 indexes and puts them back afterwards
+    """
+    def index_columns(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return {tuple(constraint['columns']) for constraint in constraints.values()
+                if constraint['index'] and not constraint['unique']}
+
+    def test_drop_and_restore(self):
+        indexes = {('vendor_id', 'functionality_id', 'user_id'), ('user_id', 'score'), ('user_id', 'vendor_id')}
+        evaluation_indexes = self.index_columns('eval_evaluation')
+        self.assertTrue(indexes <= evaluation_indexes)
+        self.assertIn(('code',), self.index_columns('eval_project'))
+        drop_evaluation_indexes()
+        try:
+            self.assertFalse(indexes & self.index_columns('eval_evaluation'))
+            self.assertNotIn(('code',), self.index_columns('eval_project'))
+        finally:
+            restore_evaluation_indexes()
+        self.assertEqual(self.index_columns('eval_evaluation'), evaluation_indexes)
+        self.assertIn(('code',), self.index_columns('eval_project'))
+
+
+class EvaluationSyncTests(TestCase):
+    """
+    cells follow membership, vendor and requirement changes through the model signals once the change commits
+    """
+    def setUp(self):
+        self.project = Project.objects.create(code='auth', name='Auth')
+        self.members = Group.objects.create(name='auth:Members')
+        self.users = [User.objects.create_user(f'member{i}') for i in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.members.user_set.add(*self.users)
+            self.vendor = ProjectVendor.objects.create(project=self.project, name='Vendor one')
+            self.requirements = [ProjectFunctionality.objects.create(project=self.project, description=f'Req {i}')
+                                 for i in range(2)]
+
+    def cells(self):
+        return set(Evaluation.objects.values_list('user__username', 'vendor__name', 'functionality__description'))
+
+    def test_cells_are_created_for_members_vendors_and_requirements(self):
+        self.assertEqual(Evaluation.objects.count(), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProjectVendor.objects.create(project=self.project, name='Vendor two')
+        self.assertEqual(Evaluation.objects.count(), 8)
+        self.assertEqual(generate_evaluations('auth'), "done!\n")
+
+    def test_requirement_groups_remove_only_empty_cells(self):
+        developers = Group.objects.create(name='auth:Developers')
+        Evaluation.objects.filter(user=self.users[0], functionality=self.requirements[0]).update(score=7)
+        # member0 now only gets requirements that apply to developers (none yet) but keeps the scored cell
+        with self.captureOnCommitCallbacks(execute=True):
+            developers.user_set.add(self.users[0])
+        self.assertEqual(self.cells(), {
+            ('member0', 'Vendor one', 'Req 0'), ('member1', 'Vendor one', 'Req 0'),
+            ('member1', 'Vendor one', 'Req 1'),
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.requirements[1].groups.add(developers)
+        self.assertIn(('member0', 'Vendor one', 'Req 1'), self.cells())
+        self.assertEqual(Evaluation.objects.count(), 4)
+
+    def test_leaving_and_joining_members(self):
+        with patch('eval.utils.change_summaries', wraps=change_summaries) as change, \
+                patch('eval.scorecard.refresh_vendor_summary', wraps=refresh_vendor_summary) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.members.user_set.remove(self.users[0])
+        self.assertEqual(Evaluation.objects.filter(user=self.users[0]).count(), 0)
+        # both removed cells are taken out of the scorecard by one change (their delete signals skip them) and no
+        #   vendor is counted again
+        self.assertEqual((change.call_count, len(change.call_args.args[0]), refresh.call_count), (1, 2, 0))
+        self.assertEqual(get_scorecard('auth')['vendors'][0]['cell_count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].groups.add(self.members)
+        self.assertEqual(Evaluation.objects.filter(user=self.users[0]).count(), 2)
+
+
+class ApplicabilityIndexTests(TestCase):
+    """
+    requirements apply to members by their project groups; resolved from three queries
+    """
+    def setUp(self):
+        self.project = Project.objects.create(code='auth', name='Auth')
+        members = Group.objects.create(name='auth:Members')
+        developers = Group.objects.create(name='auth:Developers')
+        testers = Group.objects.create(name='auth:Testers')
+        self.everyone, self.both, self.outsider = [User.objects.create_user(name) for name in
+                                                   ('everyone', 'both', 'outsider')]
+        members.user_set.add(self.everyone, self.both)
+        developers.user_set.add(self.both, self.outsider)
+        testers.user_set.add(self.both)
+        self.shared = ProjectFunctionality.objects.create(project=self.project, description='Shared')
+        self.shared.groups.add(developers, testers)
+        self.open = ProjectFunctionality.objects.create(project=self.project, description='Open')
+        self.inactive = ProjectFunctionality.objects.create(project=self.project, description='Inactive',
+                                                            is_active=False)
+        self.inactive.groups.add(developers)
+
+    def test_requirements_for_members(self):
+        with self.assertNumQueries(3):
+            index = ApplicabilityIndex(self.project)
+        self.assertEqual(index.requirements_for(self.everyone.id), {self.shared.id, self.open.id})
+        # in two groups that share a requirement; it is only listed once and inactive ones are left out
+        self.assertEqual(index.requirements_for(self.both.id), {self.shared.id})
+        self.assertEqual(index.requirements_for(self.outsider.id), set())
+        self.assertEqual(index.users_for(self.shared.id), {self.everyone.id, self.both.id})
+
+
+class BenchmarkTests(TestCase):
+    """
+    the synthetic seed only creates applicable cells and the harness measures every hot path
+    """
+    def test_seed_and_run(self):
+        project = seed_project('seeded', members=6, vendors=2, requirements=10, groups=2, tags=2, notes=100, seed=1)
+        # two members in each group see half of the requirements, the other two see all of them
+        self.assertEqual(Evaluation.objects.filter(vendor__project=project).count(), (4 * 5 + 2 * 10) * 2)
+        self.assertEqual(generate_evaluations('seeded', dry_run=True).split(':')[1].split()[0], '0')
+        results = run_benchmarks(project, repeat=1)
+        self.assertEqual(set(results['results']), {'generate_evaluations', 'export csv',
+                                                   'admin changelist (everyone)', 'vendor report page'})
+
+    def test_compare_flags_regressions(self):
+        baseline = {'results': {'export csv': {'best_ms': 10.0, 'queries': 2}}}
+        slower = {'results': {'export csv': {'best_ms': 15.0, 'queries': 2}}}
+        more_queries = {'results': {'export csv': {'best_ms': 10.0, 'queries': 3}}}
+        self.assertFalse(compare_benchmarks(baseline, baseline)[0]['regressed'])
+        self.assertTrue(compare_benchmarks(baseline, slower)[0]['regressed'])
+        self.assertTrue(compare_benchmarks(baseline, more_queries)[0]['regressed'])
+
+
+class RequestMetricsTests(TestCase):
+    """
+    the middleware records timings per view and the staff endpoint dumps them
+    """
+    def setUp(self):
+        METRICS.reset()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        Project.objects.create(code='auth', name='Auth')
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.force_login(self.user)
+        self.client.get('/admin/eval/evaluation/')
+        self.client.get('/reports/vendor/?project=auth')
+        views = self.client.get('/eval/api/metrics/', {'reset': 'true'}).json()['views']
+        self.assertEqual(views['admin:eval_evaluation_changelist']['count'], 1)
+        self.assertGreater(views['admin:eval_evaluation_changelist']['max_queries'], 0)
+        self.assertEqual(views['docroot:/reports/vendor/']['count'], 1)
+        # only the reset request itself was recorded since
+        self.assertEqual(list(self.client.get('/eval/api/metrics/').json()['views']), ['request_metrics'])
+
+    def test_metrics_are_staff_only(self):
+        response = self.client.get('/eval/api/metrics/')
+        self.assertEqual(response.status_code, 302)
+
+
+class EvaluationExportTests(TestCase):
+    """
+    the streamed csv, jsonl and columnar exports with their filters and column selection
+    """
+    def setUp(self):
+        self.project = seed_project('export', members=2, vendors=2, requirements=3, scored=0.5, seed=3, tags=1)
+        evaluations = Evaluation.objects.filter(vendor__project=self.project).order_by('id')
+        Evaluation.objects.filter(id=evaluations[0].id).update(notes='fast, cheap\nand "good"', confirmed=True)
+        Evaluation.objects.filter(id=evaluations[1].id).update(notes='one, two')
+
+    def export(self, query):
+        response = self.client.get(f'/eval/api/export/?project=export&{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_formats_agree(self):
+        columns = 'id,user__username,score,confirmed,functionality__priorities,notes'
+        header, *rows = list(csv.reader(io.StringIO(self.export(f'columns={columns}'))))
+        self.assertEqual(header, columns.split(','))
+        self.assertEqual(len(rows), Evaluation.objects.filter(vendor__project=self.project).count())
+        self.assertTrue({'fast, cheap\nand "good"', 'one, two'} < {row[5] for row in rows})
+        lines = [json.loads(line) for line in self.export(f'columns={columns}&format=jsonl').splitlines()]
+        self.assertEqual([[str(line['id']), line['user__username'], '' if line['score'] is None else str(line['score']),
+                           str(int(line['confirmed'])), line['functionality__priorities'], line['notes'] or '']
+                          for line in lines], rows)
+        data = json.loads(self.export(f'columns={columns}&format=columns'))
+        self.assertEqual((data['columns'], data['row_count']), (header, len(rows)))
+        usernames = data['data']['user__username']
+        self.assertEqual([usernames['dictionary'][index] for index in usernames['indices']],
+                         [row[1] for row in rows])
+        self.assertEqual(data['data']['score'], [line['score'] for line in lines])
+        self.assertEqual(data['data']['confirmed'], [line['confirmed'] for line in lines])
+
+    def test_csv_matches_import_export(self):
+        requirement = ProjectFunctionality.objects.filter(project=self.project).first()
+        requirement.priorities = 'must-have, "large, slow"'
+        requirement.save()
+        queryset = Evaluation.objects.filter(vendor__project=self.project)
+        expected = EvaluationResource().export(queryset).csv
+        self.assertIn('"large, slow"', expected)
+        self.assertEqual(self.export(''), expected)
+
+    def test_columns_are_read_in_one_pass(self):
+        queryset = filter_evaluations({'project': 'export'})
+        whole = ''.join(stream_evaluations_columns(queryset))
+        # one query for the priority tags and one for the rows no matter how many columns
+        with self.assertNumQueries(2):
+            chunked = ''.join(stream_evaluations_columns(queryset, chunk_size=5))
+        self.assertEqual(json.loads(chunked), json.loads(whole))
+        self.assertEqual(json.loads(''.join(stream_evaluations_columns(queryset.none())))['data']['id'], [])
+
+    def test_database_errors_return_an_error_status(self):
+        def failing(*args, **kwargs):
+            raise DatabaseError('no such table')
+            yield
+
+        with patch('eval.export.iter_evaluation_values', failing):
+            for export_format in ('csv', 'jsonl', 'columns'):
+                response = self.client.get(f'/eval/api/export/?project=export&format={export_format}')
+                self.assertEqual((response.status_code, response.content), (500, b'no such table'))
+
+    def test_filters(self):
+        query = 'vendor=Vendor 0,Vendor 1&user=export_user0&score_min=3&score_max=8'
+        lines = [json.loads(line) for line in self.export(f'{query}&format=jsonl').splitlines()]
+        expected = Evaluation.objects.filter(vendor__project=self.project, user__username='export_user0',
+                                             score__gte=3, score__lte=8)
+        self.assertEqual(sorted(line['id'] for line in lines), sorted(expected.values_list('id', flat=True)))
+        self.assertTrue(lines)
+        confirmed = self.export('confirmed=true&columns=id').split()
+        self.assertEqual(confirmed[1:], [str(Evaluation.objects.get(confirmed=True).id)])
+
+    def test_bad_parameters(self):
+        for query, message in (('score_min=abc', 'score_min'), ('score_max=11', 'score_max'),
+                               ('columns=id,bogus', 'bogus'), ('format=xml', 'xml')):
+            response = self.client.get(f'/eval/api/export/?{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(message, response.content.decode())
+
+
+class ScorecardTests(TestCase):
+    """
+    vendor, requirement and category rows of the summary table kept up to date by the evaluation and tag signals
+    """
+    def setUp(self):
+        self.users = [User.objects.create_user(f'evaluator{i}') for i in range(2)]
+        self.project = Project.objects.create(code='auth', name='Auth')
+        Group.objects.create(name='auth:Members').user_set.add(*self.users)
+        self.vendors = [ProjectVendor.objects.create(project=self.project, name=f'Vendor {i}') for i in range(2)]
+        self.requirements = [ProjectFunctionality.objects.create(project=self.project, description=f'Requirement {i}',
+                                                                 categories=categories)
+                             for i, categories in enumerate(('user', 'staff'))]
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_evaluations('auth')
+        for score, evaluation in enumerate(Evaluation.objects.filter(user=self.users[0], vendor=self.vendors[0])
+                                           .order_by('functionality_id'), start=4):
+            evaluation.score = score
+            with self.captureOnCommitCallbacks(execute=True):
+                evaluation.save()
+
+    def categories(self):
+        vendor = get_scorecard('auth')['vendors'][0]
+        return {category['name']: category['score_avg'] for category in vendor['categories']}
+
+    def summary_rows(self):
+        return sorted(ScoreSummary.objects.values_list('vendor_id', 'level', 'functionality_id', 'category_id',
+                                                       'user_id', 'cell_count', 'scored_count', 'score_avg'))
+
+    def test_scorecard(self):
+        scorecard = self.client.get('/eval/api/scorecard/auth/').json()
+        scored, unscored = scorecard['vendors']
+        self.assertEqual((scored['name'], scored['cell_count'], scored['scored_count'], scored['score_avg']),
+                         ('Vendor 0', 4, 2, 4.5))
+        self.assertEqual([(requirement['name'], requirement['score_avg']) for requirement in scored['requirements']],
+                         [('Requirement 0', 4.0), ('Requirement 1', 5.0)])
+        self.assertEqual((unscored['scored_count'], unscored['coverage']), (0, 0.0))
+        self.assertEqual(self.client.get('/eval/api/scorecard/none/').status_code, 404)
+
+    def test_retagged_requirement_leaves_its_old_category(self):
+        self.assertEqual(self.categories(), {'staff': 5.0, 'user': 4.0})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.requirements[1].categories.remove('staff')
+            self.requirements[1].categories.add('other')
+        self.assertEqual(self.categories(), {'other': 5.0, 'user': 4.0})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.requirements[0].categories.clear()
+        self.assertEqual(self.categories(), {'other': 5.0})
+        # from the tag side
+        with self.captureOnCommitCallbacks(execute=True):
+            FunctionalityCategory.objects.get(name='other').projectfunctionality_set.clear()
+        self.assertEqual(self.categories(), {})
+
+    def test_deleting_a_requirement_refreshes_each_vendor_once(self):
+        with patch('eval.scorecard.refresh_vendor_summary', wraps=refresh_vendor_summary) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.requirements[1].delete()
+        # two members by two vendors deleted
+        self.assertEqual(sorted(call.args[0] for call in refresh.call_args_list),
+                         [vendor.id for vendor in self.vendors])
+        self.assertEqual(self.categories(), {'user': 4.0})
+        self.assertEqual(get_scorecard('auth')['vendors'][0]['cell_count'], 2)
+
+    def assertRowsRebuilt(self):
+        rows = self.summary_rows()
+        refresh_project_summary(self.project)
+        self.assertEqual(rows, self.summary_rows())
+
+    def test_changes_move_the_rows_in_place(self):
+        evaluation = Evaluation.objects.filter(user=self.users[1], vendor=self.vendors[0]).first()
+        evaluation.score, evaluation.confirmed = 9, True
+        # no evaluation is counted again: update, category lookup, vendor lock and one update per summary row
+        with patch('eval.scorecard.refresh_vendor_summary') as refresh, CaptureQueriesContext(connection) as queries:
+            evaluation.save()
+        self.assertFalse(refresh.called)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'] or 'SUM(' in query['sql']])
+        self.assertRowsRebuilt()
+        # a new category row, grid saves and deletes
+        with self.captureOnCommitCallbacks(execute=True):
+            self.requirements[0].categories.add('extra')
+        self.assertRowsRebuilt()
+        cells = Evaluation.objects.filter(user=self.users[1]).order_by('id')
+        save_score_grid(self.project, self.users[1], [{'id': cell.id, 'score': 3, 'confirmed': False,
+                                                       'expected': {'score': cell.score, 'confirmed': cell.confirmed}}
+                                                      for cell in cells])
+        self.assertRowsRebuilt()
+        Evaluation.objects.get(id=evaluation.id).delete()
+        self.assertRowsRebuilt()
+
+    def test_refresh_is_idempotent(self):
+        rows = self.summary_rows()
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_vendor_refresh(self.vendors[0].id, [self.requirements[0].id])
+            queue_vendor_refresh(self.vendors[0].id)
+        refresh_vendor_summary(self.vendors[1].id)
+        self.assertEqual(self.summary_rows(), rows)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ScoreSummary.objects.create(project=self.project, vendor=self.vendors[0], level=ScoreSummary.VENDOR)
+
+    def test_scorecard_command(self):
+        rows = self.summary_rows()
+        ScoreSummary.objects.all().delete()
+        out = io.StringIO()
+        call_command('evaluations', 'scorecard', 'auth', stdout=out)
+        self.assertIn(f'{len(rows)} summary rows written', out.getvalue())
+        self.assertEqual(self.summary_rows(), rows)
+
+
+class WeightedScoringTests(TestCase):
+    """
+    vendor ranking by scores weighted with the priority weights of the project
+    """
+    def setUp(self):
+        self.project = seed_project('weights', members=3, vendors=3, requirements=12, scored=0.7, seed=5, tags=2)
+        for name, weight in (('size0', 3.0), ('size1/level2', 0.5)):
+            PriorityWeight.objects.create(project=self.project, priority=PriorityCategory.objects.get(name=name),
+                                          weight=weight)
+
+    def expected(self, vendor_id):
+        weights = requirement_weights(self.project)
+        scored = Evaluation.objects.filter(vendor_id=vendor_id, score__isnull=False)
+        total = sum(weights.get(evaluation.functionality_id, PriorityWeight.DEFAULT_WEIGHT) for evaluation in scored)
+        return sum(evaluation.score * weights.get(evaluation.functionality_id, PriorityWeight.DEFAULT_WEIGHT)
+                   for evaluation in scored) / total
+
+    def test_weights_follow_the_priority_tree(self):
+        weights = {'size0': 3.0, 'size1/level2': 0.5}
+        self.assertEqual(priority_weight('size0/level1', weights), 3.0)
+        self.assertEqual(priority_weight('size1/level2', weights), 0.5)
+        self.assertIsNone(priority_weight('size1/level1', weights))
+        self.assertEqual(set(requirement_weights(self.project).values()), {3.0, 0.5})
+
+    def test_python_totals(self):
+        totals = weighted_vendor_totals(self.project, use_numpy=False)
+        self.assertEqual([vendor['rank'] for vendor in totals], [1, 2, 3])
+        for vendor in totals:
+            self.assertAlmostEqual(vendor['weighted_score'], self.expected(vendor['vendor_id']))
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_totals_match_python(self):
+        python, vectorized = (weighted_vendor_totals(self.project, use_numpy=use_numpy) for use_numpy in (False, True))
+        self.assertEqual([(vendor['vendor_id'], vendor['rank'], vendor['scored_count']) for vendor in vectorized],
+                         [(vendor['vendor_id'], vendor['rank'], vendor['scored_count']) for vendor in python])
+        for vendor, expected in zip(vectorized, python):
+            self.assertAlmostEqual(vendor['weighted_score'], expected['weighted_score'])
+            self.assertAlmostEqual(vendor['weight_total'], expected['weight_total'])
+
+    def test_api(self):
+        response = self.client.get('/eval/api/scorecard/weights/weighted/').json()
+        totals = weighted_vendor_totals(self.project)
+        self.assertEqual([vendor['vendor_id'] for vendor in response['vendors']],
+                         [vendor['vendor_id'] for vendor in totals])
+        self.assertAlmostEqual(response['vendors'][0]['weighted_score'], totals[0]['weighted_score'])
+        self.assertEqual(self.client.get('/eval/api/scorecard/none/weighted/').status_code, 404)
+
+
+class VendorReportTests(TestCase):
+    """
+    the vendor report pages through a project by keyset cursor
+    """
+    def setUp(self):
+        self.project = seed_project('report', members=3, vendors=3, requirements=4, scored=0.5, seed=2)
+        ProjectVendor.objects.filter(project=self.project, name='Vendor 2').update(is_active=False)
+
+    def pages(self, query, limit):
+        rows, cursor = [], ''
+        for page in range(100):
+            response = self.client.get(f'/reports/vendor/index.json?project=report&limit={limit}{query}&after={cursor}')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['evaluations']), limit)
+            rows += [row['id'] for row in data['evaluations']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return rows
+        self.fail('the report never ran out of pages')
+
+    def test_pages_cover_every_row_once(self):
+        expected = Evaluation.objects.filter(vendor__project=self.project, vendor__is_active=True)\
+            .order_by('vendor_id', 'functionality_id', 'user_id')
+        # 24 rows in pages of 5 and 7 so pages end inside and at the end of a vendor and of a requirement
+        for limit in (5, 7, 12, 100):
+            self.assertEqual(self.pages('', limit), list(expected.values_list('id', flat=True)))
+        vendor = ProjectVendor.objects.get(project=self.project, name='Vendor 1')
+        self.assertEqual(self.pages(f'&vendor={vendor.id}', 5),
+                         list(expected.filter(vendor=vendor).values_list('id', flat=True)))
+
+    def test_invalid_parameters(self):
+        for query in ('after=bad', 'after=1.2', 'after=1.2.x', 'limit=ten', 'vendor=one'):
+            self.assertEqual(self.client.get(f'/reports/vendor/index.json?project=report&{query}').status_code, 400)
+        self.assertEqual(self.client.get('/reports/vendor/index.json').status_code, 400)
+        self.assertEqual(self.client.get('/reports/vendor/index.json?project=none').status_code, 404)
+
+
+class EvaluationNotesTests(TestCase):
+    """
+    notes rendered to html once when they change and read back by the report without running markdown
+    """
+    def setUp(self):
+        self.project = seed_project('notes', members=1, vendors=1, requirements=2, scored=0, seed=1)
+        self.evaluation = Evaluation.objects.filter(vendor__project=self.project).order_by('id').first()
+
+    def test_save_renders_changed_notes_only(self):
+        with patch('eval.models.markdownify', wraps=markdownify) as render:
+            self.evaluation.notes = 'works **well**'
+            self.evaluation.save()
+            self.assertEqual(render.call_count, 1)
+            evaluation = Evaluation.objects.get(id=self.evaluation.id)
+            evaluation.score = 6
+            evaluation.save()
+            evaluation.save(update_fields=['score'])
+            Evaluation.objects.defer('notes').get(id=self.evaluation.id).save(update_fields=['score'])
+            self.assertEqual(render.call_count, 1)
+            evaluation.notes = 'works *fine*'
+            evaluation.save(update_fields=['notes'])
+            self.assertEqual(render.call_count, 2)
+        self.assertIn('<em>fine</em>', Evaluation.objects.get(id=self.evaluation.id).notes_html)
+
+    def test_notes_command(self):
+        Evaluation.objects.filter(vendor__project=self.project).update(notes='**bold**', notes_html=None)
+        out = io.StringIO()
+        call_command('evaluations', 'notes', 'notes', stdout=out)
+        self.assertIn('2 evaluation notes rendered', out.getvalue())
+        self.assertEqual(set(Evaluation.objects.values_list('notes_html', flat=True)),
+                         {Evaluation(notes='**bold**').render_notes()})
+        call_command('evaluations', 'notes', 'notes', stdout=out)
+        self.assertIn('0 evaluation notes rendered', out.getvalue())
+        call_command('evaluations', 'notes', '--all', stdout=out)
+        self.assertIn('project: all', out.getvalue())
+        self.assertEqual(out.getvalue().count('2 evaluation notes rendered'), 2)
+
+    def test_report_shows_the_stored_html(self):
+        Evaluation.objects.filter(id=self.evaluation.id).update(notes='raw notes', notes_html='<em>stored</em>')
+        with patch('eval.models.markdownify') as render:
+            rows = self.client.get('/reports/vendor/index.json?project=notes').json()['evaluations']
+            self.assertContains(self.client.get('/reports/vendor/?project=notes'), '<em>stored</em>')
+        render.assert_not_called()
+        self.assertEqual([row['notes_html'] for row in rows if row['id'] == self.evaluation.id], ['<em>stored</em>'])
+
+
+class ScoreGridTests(TestCase):
+    """
+    an evaluator loads every cell of a project at once and saves edits in one request
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('evaluator')
+        self.other = User.objects.create_user('other')
+        project = Project.objects.create(code='auth', name='Auth')
+        Group.objects.create(name='auth:Members').user_set.add(self.user, self.other)
+        for i in range(2):
+            ProjectVendor.objects.create(project=project, name=f'Vendor {i}')
+        for i in range(3):
+            ProjectFunctionality.objects.create(project=project, description=f'Requirement {i}', order=i + 1)
+        generate_evaluations('auth')
+        self.client.force_login(self.user)
+        self.cells = list(Evaluation.objects.filter(user=self.user).order_by('id'))
+
+    def patch(self, changes):
+        return self.client.patch('/eval/api/grid/auth/', {'changes': changes}, content_type='application/json')
+
+    def test_grid_loads_in_a_few_queries(self):
+        # session and user, then project, vendors, cells and requirements
+        with self.assertNumQueries(6):
+            response = self.client.get('/eval/api/grid/auth/')
+        grid = response.json()
+        self.assertEqual([vendor['name'] for vendor in grid['vendors']], ['Vendor 0', 'Vendor 1'])
+        self.assertEqual(len(grid['requirements']), 3)
+        self.assertTrue(all(cell['id'] for requirement in grid['requirements'] for cell in requirement['cells']))
+        self.assertContains(self.client.get('/evaluate/?project=auth'), 'Requirement 2')
+
+    def test_save_with_conflicts(self):
+        first, second = self.cells[:2]
+        Evaluation.objects.filter(id=second.id).update(score=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.patch([
+                {'id': first.id, 'score': 8, 'confirmed': True, 'expected': {'score': None, 'confirmed': False}},
+                {'id': second.id, 'score': 9, 'confirmed': False, 'expected': {'score': None, 'confirmed': False}},
+            ])
+        self.assertEqual(response.json(), {'saved': 1, 'conflicts': [{'id': second.id, 'score': 3,
+                                                                        'confirmed': False}]})
+        first.refresh_from_db()
+        self.assertEqual((first.score, first.confirmed), (8, True))
+        self.assertEqual(Evaluation.objects.get(id=second.id).score, 3)
+        summary = ScoreSummary.objects.get(level=ScoreSummary.REQUIREMENT, vendor_id=first.vendor_id,
+                                           functionality_id=first.functionality_id)
+        self.assertEqual(summary.scored_count, 1)
+
+    def test_only_own_cells_and_valid_scores(self):
+        foreign = Evaluation.objects.filter(user=self.other).first()
+        response = self.patch([{'id': foreign.id, 'score': 5, 'expected': {}}])
+        self.assertEqual(response.status_code, 400)
+        response = self.patch([{'id': self.cells[0].id, 'score': 11, 'expected': {}}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Evaluation.objects.filter(score__isnull=False).exists())
+
+
+class EvaluationImportTests(TestCase):
+    """
+    scores, confirmed flags and notes come back in from files shaped like the export
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('evaluator')
+        self.other = User.objects.create_user('other')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        project = Project.objects.create(code='auth', name='Auth')
+        Group.objects.create(name='auth:Members').user_set.add(self.user, self.other)
+        ProjectVendor.objects.create(project=project, name='Vendor 0')
+        for i in range(2):
+            ProjectFunctionality.objects.create(project=project, description=f'Requirement {i}', order=i + 1)
+        generate_evaluations('auth')
+
+    def upload(self, user, content, name='scores.csv', dry_run=False):
+        self.client.force_login(user)
+        upload = SimpleUploadedFile(name, content if isinstance(content, bytes) else content.encode())
+        return self.client.post(f"/eval/api/import/auth/{'?dry_run=true' if dry_run else ''}", {'file': upload})
+
+    def test_dry_run_then_apply(self):
+        content = ("user__username,vendor__name,functionality__description,score,confirmed,notes\n"
+                   "evaluator,Vendor 0,Requirement 0,7,yes,works **well**\n"
+                   "evaluator,Vendor 0,Requirement 1,,0,\n")
+        result = self.upload(self.user, content, dry_run=True).json()
+        self.assertEqual((result['rows'], result['changed'], result['updated']), (2, 1, 0))
+        self.assertEqual(result['diff'][0]['changes'], {'score': [None, 7], 'confirmed': [False, True],
+                                                        'notes': [None, 'works **well**']})
+        self.assertFalse(Evaluation.objects.filter(score__isnull=False).exists())
+
+        result = self.upload(self.user, content).json()
+        self.assertEqual(result['updated'], 1)
+        evaluation = Evaluation.objects.get(user=self.user, functionality__description='Requirement 0')
+        self.assertEqual((evaluation.score, evaluation.confirmed), (7, True))
+        self.assertEqual(evaluation.notes_html, evaluation.render_notes())
+        self.assertIn('<strong>well</strong>', evaluation.notes_html)
+        summary = ScoreSummary.objects.get(level=ScoreSummary.REQUIREMENT, vendor=evaluation.vendor,
+                                           functionality=evaluation.functionality)
+        self.assertEqual(summary.scored_count, 1)
+        # importing the same file again changes nothing
+        self.assertEqual(self.upload(self.user, content).json()['changed'], 0)
+
+    def test_errors_write_nothing(self):
+        content = ("user__username,vendor__name,functionality__description,score\n"
+                   "evaluator,Vendor 0,Requirement 0,5\n"
+                   "evaluator,Vendor 0,Requirement 1,11\n"
+                   "evaluator,Vendor 9,Requirement 1,1\n"
+                   "other,Vendor 0,Requirement 1,1\n")
+        response = self.upload(self.user, content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [3, 4, 5])
+        self.assertFalse(Evaluation.objects.filter(score__isnull=False).exists())
+        # staff can import the cells of any evaluator
+        content = "user__username,vendor__name,functionality__description,score\nother,Vendor 0,Requirement 1,1\n"
+        self.assertEqual(self.upload(self.staff, content).json()['updated'], 1)
+
+    @skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_xlsx(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['id', 'score'])
+        evaluation = Evaluation.objects.filter(user=self.user).first()
+        workbook.active.append([evaluation.id, 4])
+        content = io.BytesIO()
+        workbook.save(content)
+        result = self.upload(self.user, content.getvalue(), name='scores.xlsx').json()
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(Evaluation.objects.get(id=evaluation.id).score, 4)
+
+
+class ProjectStatisticsTests(TestCase):
+    """
+    where evaluators disagree: cell spread, evaluator bias and vendor agreement
+    """
+    def setUp(self):
+        self.users = [User.objects.create_user(f'evaluator{i}') for i in range(3)]
+        project = Project.objects.create(code='auth', name='Auth')
+        Group.objects.create(name='auth:Members').user_set.add(*self.users)
+        for i in range(2):
+            ProjectVendor.objects.create(project=project, name=f'Vendor {i}')
+        ProjectFunctionality.objects.create(project=project, description='Requirement 0')
+        generate_evaluations('auth')
+        # vendor 0 everyone agrees on; vendor 1 scores spread from 0 to 10
+        for user, scores in zip(self.users, ((6, 0), (6, 5), (6, 10))):
+            for vendor_name, score in zip(('Vendor 0', 'Vendor 1'), scores):
+                Evaluation.objects.filter(user=user, vendor__name=vendor_name).update(score=score)
+
+    def test_statistics(self):
+        with self.assertNumQueries(5):
+            statistics = project_statistics('auth', use_numpy=False)
+        self.assertEqual(statistics['scored_count'], 6)
+        spread, agreed = statistics['cells']
+        self.assertEqual((spread['vendor'], spread['mean'], spread['variance'], spread['min'], spread['max']),
+                         ('Vendor 1', 5.0, 25.0, 0, 10))
+        self.assertEqual((spread['agreement'], agreed['agreement']), (0.0, 1.0))
+        vendors = {vendor['name']: vendor for vendor in statistics['vendors']}
+        self.assertEqual(vendors['Vendor 0']['distribution'][6], 3)
+        self.assertEqual(vendors['Vendor 1']['low_agreement_cells'], 1)
+        evaluators = {evaluator['username']: evaluator for evaluator in statistics['evaluators']}
+        # against the mean of the other scores of each cell: 0 - (5 + 10) / 2 on vendor 1
+        self.assertEqual(evaluators['evaluator0']['bias'], -3.75)
+        self.assertEqual(evaluators['evaluator1']['bias'], 0.0)
+        self.assertEqual(evaluators['evaluator2']['mean_absolute_deviation'], 3.75)
+        if numpy is not None:
+            self.assertEqual(project_statistics('auth', use_numpy=True), statistics)
+
+    def test_api_is_staff_only(self):
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.client.get('/eval/api/statistics/auth/').status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get('/eval/api/statistics/auth/').json()['scored_count'], 6)
+        self.assertEqual(self.client.get('/eval/api/statistics/none/').status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'rollup-tests'}})
+class TagRollupTests(TestCase):
+    """
+    vendor scores rolled up the category tree, cached until scores or tags change
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('evaluator')
+        self.project = Project.objects.create(code='auth', name='Auth')
+        Group.objects.create(name='auth:Members').user_set.add(self.user)
+        self.vendor = ProjectVendor.objects.create(project=self.project, name='Vendor 0')
+        for i, categories in enumerate(('user/basic', 'user/advanced, staff/basic', 'user/basic, user/advanced')):
+            ProjectFunctionality.objects.create(project=self.project, description=f'Requirement {i}',
+                                                categories=categories)
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_evaluations('auth')
+        self.cells = {evaluation.functionality.description: evaluation
+                      for evaluation in Evaluation.objects.select_related('functionality')}
+
+    def node(self, name):
+        return next(node for node in get_rollups('auth')['nodes'] if node['name'] == name)
+
+    def test_rollup_up_the_tree(self):
+        for description, score in (('Requirement 0', 4), ('Requirement 1', 8), ('Requirement 2', 6)):
+            evaluation = self.cells[description]
+            evaluation.score = score
+            with self.captureOnCommitCallbacks(execute=True):
+                evaluation.save()
+        names = [node['name'] for node in get_rollups('auth')['nodes']]
+        self.assertEqual(names, ['staff', 'staff/basic', 'user', 'user/advanced', 'user/basic'])
+        user = self.node('user')
+        # requirement 2 is tagged twice under user but counted once
+        self.assertEqual(len(user['requirement_ids']), 3)
+        self.assertEqual(user['vendors'][self.vendor.id]['score_avg'], 6.0)
+        self.assertEqual(self.node('user/basic')['vendors'][self.vendor.id]['score_avg'], 5.0)
+        self.assertEqual(self.node('staff')['vendors'][self.vendor.id]['scored_count'], 1)
+        # cached: only the project lookup runs
+        with self.assertNumQueries(1):
+            get_rollups('auth')
+        response = self.client.get('/eval/api/rollups/auth/categories/?tag=user')
+        self.assertEqual([child['name'] for child in response.json()['children']], ['user/advanced', 'user/basic'])
+        self.assertEqual(self.client.get('/eval/api/rollups/auth/sizes/').status_code, 400)
+
+    def test_scores_and_tags_invalidate(self):
+        self.assertIsNone(self.node('staff')['vendors'][self.vendor.id]['score_avg'])
+        evaluation = self.cells['Requirement 1']
+        evaluation.score = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
+        self.assertEqual(self.node('staff')['vendors'][self.vendor.id]['score_avg'], 3.0)
+        requirement = evaluation.functionality
+        requirement.categories = 'user/advanced'
+        with self.captureOnCommitCallbacks(execute=True):
+            requirement.save()
+        self.assertNotIn('staff', [node['name'] for node in get_rollups('auth')['nodes']])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'page-tests'},
+                           'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                     'LOCATION': 'page-tests-pages'}})
+class PageCacheTests(TestCase):
+    """
+    docroot pages opting in with cache_ttl are served from the pages cache until their project changes
+    """
+    def setUp(self):
+        cache.clear()
+        caches['pages'].clear()
+        self.project = seed_project('one', members=1, vendors=1, requirements=2, scored=0, seed=1)
+        seed_project('two', members=1, vendors=1, requirements=2, scored=0, seed=2)
+
+    def test_cached_until_the_project_changes(self):
+        url = '/reports/vendor/?project=one'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.get('/reports/vendor/index.json?project=two')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Vendor 0')
+            self.assertEqual(self.client.get('/reports/vendor/index.json?project=two').status_code, 200)
+        evaluation = Evaluation.objects.filter(vendor__project=self.project).first()
+        evaluation.notes = 'changed notes'
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
+        self.assertContains(self.client.get(url), 'changed notes')
+        # other projects keep their pages
+        with self.assertNumQueries(0):
+            self.client.get('/reports/vendor/index.json?project=two')
+
+    def test_only_shared_responses_are_cached(self):
+        self.client.force_login(User.objects.create_user('visitor'))
+        self.assertContains(self.client.get('/'), 'visitor')
+        self.client.force_login(User.objects.create_user('other'))
+        self.assertContains(self.client.get('/'), 'other')
+        request = RequestFactory().get('/reports/vendor/')
+        self.assertTrue(is_cacheable(request, HttpResponse('page')))
+        request.META['CSRF_COOKIE_USED'] = True
+        self.assertFalse(is_cacheable(request, HttpResponse('page with a form')))
+        # writes are never cached
+        module = SimpleNamespace(cache_ttl=60)
+        self.assertTrue(page_cache_key(RequestFactory().get('/reports/vendor/index.json'), module))
+        self.assertIsNone(page_cache_key(RequestFactory().post('/reports/vendor/index.json'), module))
+        self.assertIsNone(page_cache_key(RequestFactory().get('/reports/vendor/index.json?_method=DELETE'), module))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'matrix-tests'}})
+class ScoreMatrixTests(TestCase):
+    """
+    the scores of a project as a compact int8 matrix, cached as a blob until the project changes
+    """
+    def setUp(self):
+        cache.clear()
+        self.project = seed_project('matrix', members=3, vendors=2, requirements=4, scored=0.5, seed=3)
+        self.scores = {(user_id, vendor_id, functionality_id): score for user_id, vendor_id, functionality_id, score
+                       in Evaluation.objects.filter(vendor__project=self.project)
+                       .values_list('user_id', 'vendor_id', 'functionality_id', 'score')}
+
+    def test_matrix(self):
+        with self.assertNumQueries(1):
+            matrix = ScoreMatrix.from_project(self.project)
+        self.assertEqual((len(matrix), matrix.nbytes), (24, 24))
+        self.assertEqual({cell[:3]: cell[3] for cell in matrix.cells()},
+                         {cell: score for cell, score in self.scores.items() if score is not None})
+        for cell, score in self.scores.items():
+            self.assertEqual(matrix.score(*cell), score)
+        copy = ScoreMatrix.from_bytes(matrix.to_bytes())
+        self.assertEqual((copy.axes(), copy.scores), (matrix.axes(), matrix.scores))
+        with self.assertRaises(ValidationError):
+            ScoreMatrix.from_bytes(matrix.to_bytes()[:-1])
+
+        vendor_id = matrix.vendor_ids[1]
+        scored = [score for (user_id, vendor, functionality_id), score in self.scores.items()
+                  if vendor == vendor_id and score is not None]
+        self.assertEqual(matrix.aggregate('vendor', use_numpy=False)[vendor_id], (len(scored), sum(scored)))
+        sliced = matrix.slice(vendor_ids=[vendor_id], functionality_ids=matrix.functionality_ids[:2])
+        self.assertEqual(sliced.shape, (3, 1, 2))
+        self.assertEqual(set(sliced.cells()), {cell for cell in matrix.cells() if cell[1] == vendor_id and
+                                               cell[2] in matrix.functionality_ids[:2]})
+        by_cell = matrix.aggregate(('functionality', 'vendor'), use_numpy=False)
+        self.assertEqual(len(by_cell), 8)
+        if numpy is not None:
+            self.assertEqual(matrix.aggregate(('functionality', 'vendor'), use_numpy=True), by_cell)
+            self.assertEqual(matrix.to_numpy().shape, (3, 2, 4))
+
+    def test_cached_until_the_project_changes(self):
+        matrix = get_score_matrix('matrix')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_score_matrix('matrix').scores, matrix.scores)
+        evaluation = Evaluation.objects.filter(vendor__project=self.project, score__isnull=True).first()
+        evaluation.score = 7
+        with self.captureOnCommitCallbacks(execute=True):
+            evaluation.save()
+        self.assertEqual(get_score_matrix('matrix').score(evaluation.user_id, evaluation.vendor_id,
+                                                          evaluation.functionality_id), 7)
+
+
+class EvaluationProgressTests(TestCase):
+    """
+    scored and unscored counts per user and vendor kept in the summary table and read without counting evaluations
+    """
+    def setUp(self):
+        self.users = [User.objects.create_user(f'evaluator{i}') for i in range(2)]
+        self.project = Project.objects.create(code='auth', name='Auth')
+        self.members = Group.objects.create(name='auth:Members')
+        self.members.user_set.add(*self.users)
+        self.vendors = [ProjectVendor.objects.create(project=self.project, name=f'Vendor {i}') for i in range(2)]
+        for i in range(3):
+            ProjectFunctionality.objects.create(project=self.project, description=f'Requirement {i}')
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_evaluations('auth')
+
+    def leaderboard(self):
+        return {user['username']: user for user in project_progress('auth')['users']}
+
+    def test_progress(self):
+        self.assertEqual(self.leaderboard()['evaluator0']['unscored_count'], 6)
+        for evaluation in Evaluation.objects.filter(user=self.users[1], vendor=self.vendors[0]):
+            evaluation.score = 5
+            with self.captureOnCommitCallbacks(execute=True):
+                evaluation.save()
+        # the project lookup and one summary query
+        with self.assertNumQueries(2):
+            progress = project_progress('auth')
+        self.assertEqual((progress['cell_count'], progress['scored_count']), (12, 3))
+        leader, behind = progress['users']
+        self.assertEqual((leader['username'], leader['rank'], leader['coverage']), ('evaluator1', 1, 0.5))
+        self.assertEqual([vendor['unscored_count'] for vendor in leader['vendors']], [0, 3])
+        self.assertEqual(behind['scored_count'], 0)
+        self.assertEqual(self.client.get('/eval/api/progress/auth/').json()['users'][0]['username'], 'evaluator1')
+        self.assertEqual(self.client.get('/eval/api/progress/none/').status_code, 404)
+        self.assertContains(self.client.get('/reports/progress/?project=auth'), 'evaluator1')
+
+    def test_bulk_changes(self):
+        # removed members lose their empty cells and their counters with them
+        with self.captureOnCommitCallbacks(execute=True):
+            self.members.user_set.remove(self.users[0])
+        self.assertEqual(list(self.leaderboard()), ['evaluator1'])
+        # new requirements are generated for every member
+        with self.captureOnCommitCallbacks(execute=True):
+            ProjectFunctionality.objects.create(project=self.project, description='Requirement 3')
+        self.assertEqual(self.leaderboard()['evaluator1']['cell_count'], 8)
+        # the scorecard command rebuilds them
+        ScoreSummary.objects.filter(level=ScoreSummary.USER).delete()
+        call_command('evaluations', 'scorecard', 'auth', stdout=io.StringIO())
+        self.assertEqual(self.leaderboard()['evaluator1']['unscored_count'], 8)
+
+    def counters(self):
+        return sorted(ScoreSummary.objects.values_list('level', 'vendor_id', 'functionality_id', 'category_id',
+                                                       'user_id', 'cell_count', 'scored_count', 'confirmed_count',
+                                                       'score_sum', 'score_avg'), key=str)
+
+    def assertCountersRebuilt(self):
+        counters = self.counters()
+        refresh_project_summary(self.project)
+        self.assertEqual(counters, self.counters())
+
+    def test_counters_move_with_each_change(self):
+        evaluations = list(Evaluation.objects.filter(user=self.users[0]).order_by('id'))
+        # no commit: the counters change in the transaction of the save
+        evaluations[0].score = 7
+        evaluations[0].save()
+        evaluations[1].score, evaluations[1].confirmed = 2, True
+        evaluations[1].save()
+        self.assertEqual(self.leaderboard()['evaluator0']['scored_count'], 2)
+        self.assertCountersRebuilt()
+        # a score cleared, moved to another vendor, saved from a deferred load and one only saving other fields
+        evaluations[0].score = None
+        evaluations[0].save()
+        evaluations[1].vendor = self.vendors[1] if evaluations[1].vendor == self.vendors[0] else self.vendors[0]
+        evaluations[1].functionality = ProjectFunctionality.objects.create(project=self.project, description='Moved')
+        evaluations[1].save()
+        deferred = Evaluation.objects.only('id', 'score').get(id=evaluations[2].id)
+        deferred.score = 4
+        deferred.save()
+        evaluations[3].score = 9
+        evaluations[3].notes = 'not scored yet'
+        evaluations[3].save(update_fields=['notes'])
+        self.assertCountersRebuilt()
+        # deleted evaluations (one, a queryset and the ones of a requirement) leave the counters of their user
+        evaluations[4].delete()
+        Evaluation.objects.filter(user=self.users[1], vendor=self.vendors[0]).delete()
+        ProjectFunctionality.objects.filter(description='Requirement 0').delete()
+        self.assertCountersRebuilt()
+        self.assertEqual(set(self.leaderboard()), {'evaluator0', 'evaluator1'})
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                ProjectFunctionality.objects.create(project=self.project, description=f'More {i}')
+        self.assertGreater(Evaluation.objects.filter(vendor=self.vendors[0]).count(), 20)
+        # the evaluations deleted with a vendor or user are not taken out one at a time
+        with CaptureQueriesContext(connection) as queries:
+            self.vendors[0].delete()
+        self.assertLess(len(queries), 20)
+        self.assertCountersRebuilt()
+        with CaptureQueriesContext(connection) as queries:
+            self.users[0].delete()
+        self.assertLess(len(queries), 30)
+        self.assertCountersRebuilt()
+        self.assertEqual(set(self.leaderboard()), {'evaluator1'})
+
+    def test_rolled_back_save_keeps_the_counters(self):
+        counters = self.counters()
+        evaluation = Evaluation.objects.filter(user=self.users[0]).first()
+        try:
+            with transaction.atomic():
+                evaluation.score = 5
+                evaluation.save()
+                self.assertNotEqual(self.counters(), counters)
+                raise ValidationError('rolled back')
+        except ValidationError:
+            pass
+        self.assertEqual(self.counters(), counters)
+        # the instance still holds the rolled back score until it is loaded again
+        evaluation.refresh_from_db()
+        evaluation.confirmed = True
+        evaluation.save()
+        self.assertCountersRebuilt()
+        evaluation.delete()
+        self.assertEqual(sum(row[5] for row in self.counters() if row[0] == ScoreSummary.USER), 11)
+        self.assertCountersRebuilt()
+
+
+class PageContextTests(TestCase):
+    """
+    docroot pages build their context per request and compute lazy values only when the template uses them
+    """
+    def test_lazy_values(self):
+        calls = []
+
+        def load(name):
+            calls.append(name)
+            return {'rows': [1, 2], 'cursor': name}
+        ctx = PageContext({'title': 'static'}, error=None)
+        ctx.lazy(('rows', 'cursor'), load, 'page')
+        ctx.lazy('unused', load, 'unused')
+        html = Template('{{ title }}{% for row in rows %}{{ row }}{% endfor %}{{ cursor }}{{ rows|length }}')\
+            .render(Context(ctx))
+        self.assertEqual(html, 'static12page2')
+        self.assertEqual(calls, ['page'])
+        self.assertEqual(ctx.get('cursor'), 'page')
+        self.assertEqual(ctx.resolve()['unused']['cursor'], 'unused')
+
+    def test_pages_do_not_share_context(self):
+        seed_project('ctx', members=1, vendors=1, requirements=2, scored=0, seed=1)
+        self.assertContains(self.client.get('/reports/vendor/?project=ctx'), 'Vendor 0')
+        response = self.client.get('/reports/vendor/')
+        self.assertNotContains(response, 'Vendor 0')
+        self.assertEqual(response.context['evaluations'], [])
+        self.assertContains(self.client.get('/reports/vendor/?project=ctx&after=bad'), 'Invalid page cursor')
+
+
+class AsyncViewTests(TransactionTestCase):
+    """
+    the async read endpoints answer like their sync twins with the queries run in the read pool threads
+    NOTE: a TransactionTestCase so the pool threads (with their own connections) see the committed test data
+    """
+    def setUp(self):
+        self.project = seed_project('async', members=2, vendors=2, requirements=3, scored=1, seed=1)
+        METRICS.reset()
+
+    def get(self, url):
+        async def get():
+            return await AsyncClient().get(url)
+        return async_to_sync(get)()
+
+    def test_async_views(self):
+        response = self.get('/eval/api/async/scorecard/async/')
+        self.assertEqual(response.json(), self.client.get('/eval/api/scorecard/async/').json())
+        self.assertEqual(self.get('/eval/api/async/scorecard/none/').status_code, 404)
+        page = self.get('/eval/api/async/evaluations/?project=async&limit=5').json()
+        self.assertEqual(len(page['evaluations']), 5)
+        self.assertTrue(page['next_cursor'])
+        self.assertEqual(self.get('/eval/api/async/evaluations/').status_code, 400)
+        self.assertEqual(self.get('/eval/api/async/jobs/0/').status_code, 404)
+        # the metrics middleware runs async and counts the queries of the pool threads
+        metrics = METRICS.snapshot()
+        self.assertEqual(metrics['async_vendor_scorecard']['count'], 2)
+        self.assertGreater(metrics['async_evaluation_list']['avg_queries'], 0)
+
+    def test_docroot_pages_under_asgi(self):
+        self.assertContains(self.get('/reports/vendor/?project=async'), 'Vendor 1')
+
+    def test_load_test(self):
+        results = load_test(self.project, requests=6, concurrency=3)
+        self.assertEqual(set(results), {'scorecard (wsgi, sync view)', 'scorecard (asgi, async view)'})
+        self.assertFalse(any(result['errors'] for result in results.values()))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='eval-jobs-'))
+class JobTests(TransactionTestCase):
+    """
+    generate and export jobs queued from the api and run by the worker command
+    NOTE: a TransactionTestCase as the worker runs the jobs in its own threads (and connections)
+    """
+    def setUp(self):
+        self.project = seed_project('jobs', members=2, vendors=2, requirements=3, scored=0.5, seed=4)
+        self.cells = Evaluation.objects.filter(vendor__project=self.project).count()
+
+    def run_worker(self):
+        # NOTE: one thread so the polling loop never touches the in-memory test database while a job writes to it
+        call_command('evaluations_worker', '--once', '--poll', '0', '--threads', '1', stdout=io.StringIO())
+
+    def test_generate_job(self):
+        Evaluation.objects.filter(vendor__project=self.project, score__isnull=True).delete()
+        missing = self.cells - Evaluation.objects.filter(vendor__project=self.project).count()
+        job_id = self.client.get('/eval/api/jobs/generate/jobs/').json()['id']
+        self.assertEqual(self.client.get(f'/eval/api/jobs/{job_id}/result/').status_code, 409)
+        self.run_worker()
+        status = self.client.get(f'/eval/api/jobs/{job_id}/').json()
+        self.assertEqual((status['status'], status['progress'], status['has_result']), (Job.DONE, 100, True))
+        self.assertEqual(self.client.get(f'/eval/api/jobs/{job_id}/result/').content.decode().count('created'),
+                         missing)
+        self.assertEqual(Evaluation.objects.filter(vendor__project=self.project).count(), self.cells)
+
+    def test_export_job(self):
+        response = self.client.get('/eval/api/jobs/export/?project=jobs&format=jsonl')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get('/eval/api/jobs/export/?format=xml').status_code, 400)
+        self.run_worker()
+        job_id = response.json()['id']
+        result = self.client.get(f'/eval/api/jobs/{job_id}/result/')
+        self.assertIn(f'evaluations-{job_id}.jsonl', result['Content-Disposition'])
+        self.assertEqual(len(b''.join(result.streaming_content).decode().splitlines()), self.cells)
+
+    def test_cancel(self):
+        queued = Job.objects.create(kind=Job.GENERATE, params={'project_code': 'jobs'})
+        self.assertEqual(self.client.get(f'/eval/api/jobs/{queued.id}/cancel/').status_code, 405)
+        self.assertEqual(self.client.post(f'/eval/api/jobs/{queued.id}/cancel/').json()['status'], Job.CANCELLED)
+        # a running job stops at its next progress update keeping the batches already committed
+        Evaluation.objects.filter(vendor__project=self.project).delete()
+        Job.objects.create(kind=Job.GENERATE, params={'project_code': 'jobs'})
+        job = claim_next_job()
+        self.assertTrue(cancel_job(job).cancel_requested)
+        job = run_job(job)
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertEqual(Evaluation.objects.filter(vendor__project=self.project).count(), self.cells)
+        self.assertIsNone(claim_next_job())
+
+    def test_stale_running_jobs_are_requeued(self):
+        Job.objects.create(kind=Job.GENERATE, params={'project_code': 'jobs'})
+        job = claim_next_job()
+        self.assertIsNone(claim_next_job())
+        Job.objects.filter(id=job.id).update(heartbeat=timezone.now() - timedelta(hours=1))
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.id, reclaimed.status), (job.id, Job.RUNNING))
+        self.assertIn('Requeued', reclaimed.message)
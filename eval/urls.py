@@ -1,9 +1,30 @@
 from django.urls import path
 
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     # ex: /eval/api/generate/virtual/
     path('api/generate/<product_code>/', views.generate_missing_evaluations, name='generate_evaluations'),
     path('api/export/', views.export_evaluations, name='export_evaluations'),
+    path('api/scorecard/<product_code>/', views.vendor_scorecard, name='vendor_scorecard'),
+    path('api/scorecard/<product_code>/weighted/', views.weighted_vendor_scores, name='weighted_vendor_scores'),
+    path('api/rollups/<product_code>/<tree>/', views.tag_rollups, name='tag_rollups'),
+    path('api/statistics/<product_code>/', views.score_statistics, name='score_statistics'),
+    path('api/progress/<product_code>/', views.evaluation_progress, name='evaluation_progress'),
+    path('api/grid/<product_code>/', views.score_grid, name='score_grid'),
+    path('api/import/<product_code>/', views.import_evaluations, name='import_evaluations'),
+    # background jobs; run by ./manage.py evaluations_worker
+    path('api/jobs/generate/<product_code>/', views.enqueue_generate_evaluations, name='enqueue_generate_evaluations'),
+    path('api/jobs/export/', views.enqueue_export_evaluations, name='enqueue_export_evaluations'),
+    path('api/jobs/<int:job_id>/', views.job_detail, name='job_detail'),
+    path('api/jobs/<int:job_id>/result/', views.job_result, name='job_result'),
+    path('api/jobs/<int:job_id>/cancel/', views.job_cancel, name='job_cancel'),
+    # async read endpoints for dashboards polling through an ASGI server (docroot/asgi.py)
+    path('api/async/scorecard/<product_code>/', async_views.vendor_scorecard, name='async_vendor_scorecard'),
+    path('api/async/evaluations/', async_views.evaluation_list, name='async_evaluation_list'),
+    path('api/async/jobs/<int:job_id>/', async_views.job_detail, name='async_job_detail'),
+    # admin user filter autocomplete
+    path('api/users/', views.user_lookup, name='user_lookup'),
+    # request timing histograms of this process
+    path('api/metrics/', views.request_metrics, name='request_metrics'),
 ]
\ No newline at end of file
@@ -1,16 +1,59 @@
 from eval.models import *
+from django.db import transaction
+from eval.scorecard import change_summaries, pending_deletes
+from eval.applicability import ApplicabilityIndex
 from django.contrib.auth.models import Group
 from django.core.exceptions import ObjectDoesNotExist, ValidationError, ImproperlyConfigured
 
+# number of evaluation rows written per insert statement when generating
+GENERATE_BATCH_SIZE = 500
+# evaluation rows rendered and written per update statement when backfilling notes html
+NOTES_BATCH_SIZE = 500
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def is_true(value):
+    """
+    interpret a request/command line parameter as a boolean
+    :param value: the string value passed (None is False)
+    :return: True if the value is one of TRUE_VALUES
+    """
+    return str(value).strip().lower() in TRUE_VALUES if value is not None else False
+
+
+def get_project(project):
+    """
+    :param project: a Project or a project code
+    :return: the project
+    """
+    if isinstance(project, Project):
+        return project
+    try:
+        return Project.objects.get(code__iexact=project)
+    except ObjectDoesNotExist:
+        raise ObjectDoesNotExist(f"Project was not found for project code [{project}]! Pass a valid project code")
+
 
 def get_project_groups(user, project_code):
     return user.groups.filter(name__istartswith=project_code).exclude(name__iexact=project_code+":Members")
     # return Group.objects.filter(name__istartswith=project_code).exclude(name__iexact=project_code+":Members")
 
 
-def generate_evaluations(project_code):
+def generate_evaluations(project_code, dry_run=False, batch_size=GENERATE_BATCH_SIZE, progress=None):
     """
     generate missing evaluations for the project for all people/vendors with null evaluations
+    NOTE: the existing (user, vendor, functionality) keys for the project are loaded once and the missing cells are
+        computed in memory; new rows are written with batched bulk_create, one transaction per batch.  Inserts ignore
+        conflicts on the unique_evaluation_cell constraint so generating from more than one process at the same time
+        can not create duplicate rows (a cell inserted by another process in between is just skipped) and a stopped
+        run can simply be run again to write the rest
+    :param project_code: the project code to generate evaluations for
+    :param dry_run: if True only count what would be created; nothing is written
+    :param batch_size: number of rows per insert statement
+    :param progress: optional callable(done, total) called after each batch is committed; raising from it stops the
+        run keeping the batches written so far
+    :return: status output listing the evaluations created (or the counts for a dry run); cells skipped because
+        another run created them first are counted instead of listed
     """
     # get the users for this project.  NOTE: requires group named <project_code>:Members
     group_name = f"{project_code}:Members"
@@ -25,33 +68,175 @@ def generate_evaluations(project_code):
     members_group = Group.objects.filter(name__iexact=group_name).all()
     if not members_group:
         raise ImproperlyConfigured(f"Group [{group_name}] does not exist!  You need to create and add members.")
-    members = members_group[0].user_set.all()
+    members = list(members_group[0].user_set.all())
     if not members:
         raise ValidationError(f"No members defined for group [{group_name}]!  Set some up to generate evaluations")
-    vendors = ProjectVendor.objects.active().filter(project=project)
+    vendors = list(ProjectVendor.objects.active().filter(project=project))
     if not vendors:
         raise ValidationError(
             f"No vendors defined with project [{project.code}]!  Set up a vendor to generate evaluations")
-    requirements = ProjectFunctionality.objects.active().filter(project=project)
+    requirements = list(ProjectFunctionality.objects.active().filter(project=project))
+
+    # load every key we already have for this project once instead of querying per cell
+    existing = set(Evaluation.objects.filter(vendor__project=project).values_list(
+        'user_id', 'vendor_id', 'functionality_id'))
+    # which requirements apply to which member (filtered by any project group other than project_code:Members)
+    index = ApplicabilityIndex(project)
 
-    # loop over all members/vendors and generate records if needed
+    # loop over all members/vendors and collect the missing cells
+    missing = []
     for member in members:
-        # filter evaluations if this user is in a project group other than project_code:Members
-        member_filter_groups = get_project_groups(member, project_code)
-        if member_filter_groups:
-            # member_requirements = requirements.filter(groups__in=member_groups)
-            member_requirements = requirements.filter(groups__in=member_filter_groups)
-        else:
-            member_requirements = requirements
+        member_requirement_ids = index.requirements_for(member.id)
+        member_requirements = [r for r in requirements if r.id in member_requirement_ids]
         for member_requirement in member_requirements:
             for vendor in vendors:
-                evaluation = Evaluation.objects.filter(user=member, vendor=vendor, functionality=member_requirement)
-                if not evaluation:
-                    Evaluation.objects.create(
-                        user=member,
-                        vendor=vendor,
-                        functionality=member_requirement,
-                    )
-                    return_msg += f"     created evaluation [{member.username}], {vendor}, {member_requirement}\n"
+                if (member.id, vendor.id, member_requirement.id) not in existing:
+                    missing.append(Evaluation(user=member, vendor=vendor, functionality=member_requirement))
+
+    if dry_run:
+        return_msg += f"     dry run: {len(missing)} evaluations would be created for {len(members)} members, " \
+                      f"{len(vendors)} vendors and {len(requirements)} requirements\n"
+    else:
+        skipped = set()
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            with transaction.atomic():
+                # cells another run wrote since the keys were loaded are skipped by the insert; find them so they
+                #   are not reported as created
+                batch_skipped = _existing_cells(batch)
+                skipped |= batch_skipped
+                Evaluation.objects.bulk_create(batch, ignore_conflicts=True)
+                # bulk inserts skip the model signals; the scorecard rows commit with the batch
+                change_summaries(_created_cells(batch, batch_skipped))
+            # outside the batch transaction so progress (and a cancel) is seen while the rest are written
+            if progress:
+                progress(min(start + batch_size, len(missing)), len(missing))
+        return_msg += "".join(f"     created evaluation [{evaluation.user.username}], {evaluation.vendor}, "
+                              f"{evaluation.functionality}\n" for evaluation in missing
+                              if _cell_key(evaluation) not in skipped)
+        if skipped:
+            return_msg += f"     skipped {len(skipped)} evaluations created by another run in the meantime\n"
     return_msg += "done!\n"
     return return_msg
+
+
+def _cell_key(evaluation):
+    return evaluation.user_id, evaluation.vendor_id, evaluation.functionality_id
+
+
+def _existing_cells(evaluations):
+    """
+    :return: set of the (user id, vendor id, functionality id) keys of the unsaved evaluations that are in the database
+    """
+    keys = {_cell_key(evaluation) for evaluation in evaluations}
+    user_ids, vendor_ids, functionality_ids = (set(ids) for ids in zip(*keys)) if keys else (set(), set(), set())
+    return keys & set(Evaluation.objects.filter(user_id__in=user_ids, vendor_id__in=vendor_ids,
+                                                functionality_id__in=functionality_ids).order_by()
+                      .values_list('user_id', 'vendor_id', 'functionality_id'))
+
+
+def _created_cells(evaluations, skipped):
+    """
+    :return: the eval.scorecard.change_summaries changes of the new (unscored) evaluations that were not skipped
+    """
+    return [(None, (evaluation.vendor_id, evaluation.functionality_id, evaluation.user_id, None, False))
+            for evaluation in evaluations if _cell_key(evaluation) not in skipped]
+
+
+def is_empty_evaluation(score, confirmed, notes):
+    """
+    :return: True if nobody has worked on the cell yet (no score, not confirmed and no notes)
+    """
+    return score is None and not confirmed and not notes
+
+
+def sync_evaluations(project_id, user_ids=None, vendor_ids=None, functionality_ids=None,
+                     batch_size=GENERATE_BATCH_SIZE):
+    """
+    bring part of a project in line with its members, active vendors and active requirements: missing cells are
+    created and empty cells that no longer apply are removed; called from eval.signals after the change commits so
+    full generation is only needed to repair a project
+    NOTE: only the cells of the given users/vendors/requirements are read (None means all of them) and cells that
+        have a score, are confirmed or have notes are never removed even when they no longer apply
+    NOTE: the created and removed cells are moved into the scorecard rows in the transaction of the sync with one
+        eval.scorecard.change_summaries (the removed cells are marked so their delete signals skip them)
+    :param project_id: the project id
+    :param user_ids: only these users
+    :param vendor_ids: only these vendors
+    :param functionality_ids: only these requirements
+    :param batch_size: number of rows per insert/delete statement
+    :return: (number of cells created, number of cells removed)
+    """
+    project = Project.objects.filter(id=project_id, is_active=True).first()
+    if not project:
+        return 0, 0
+    vendors = ProjectVendor.objects.active().filter(project=project)
+    cells = Evaluation.objects.filter(vendor__project=project)
+    if user_ids is not None:
+        cells = cells.filter(user_id__in=user_ids)
+    if vendor_ids is not None:
+        vendors = vendors.filter(id__in=vendor_ids)
+        cells = cells.filter(vendor_id__in=vendor_ids)
+    if functionality_ids is not None:
+        cells = cells.filter(functionality_id__in=functionality_ids)
+    vendor_ids = list(vendors.values_list('id', flat=True))
+    index = ApplicabilityIndex(project, user_ids=user_ids, functionality_ids=functionality_ids)
+
+    applicable = set()
+    for user_id, requirement_ids in index.items():
+        for requirement_id in requirement_ids:
+            for vendor_id in vendor_ids:
+                applicable.add((user_id, vendor_id, requirement_id))
+
+    existing = set()
+    stale_ids = []
+    stale_cells = []
+    for evaluation_id, user_id, vendor_id, functionality_id, score, confirmed, notes in cells.order_by().values_list(
+            'id', 'user_id', 'vendor_id', 'functionality_id', 'score', 'confirmed', 'notes'):
+        existing.add((user_id, vendor_id, functionality_id))
+        if (user_id, vendor_id, functionality_id) not in applicable and is_empty_evaluation(score, confirmed, notes):
+            stale_ids.append(evaluation_id)
+            stale_cells.append(((vendor_id, functionality_id, user_id, score, confirmed), None))
+    missing = [Evaluation(user_id=user_id, vendor_id=vendor_id, functionality_id=functionality_id)
+               for user_id, vendor_id, functionality_id in applicable - existing]
+
+    with transaction.atomic():
+        skipped = _existing_cells(missing)
+        for start in range(0, len(missing), batch_size):
+            Evaluation.objects.bulk_create(missing[start:start + batch_size], ignore_conflicts=True)
+        pending_deletes().setdefault(Evaluation, set()).update(stale_ids)
+        for start in range(0, len(stale_ids), batch_size):
+            Evaluation.objects.filter(id__in=stale_ids[start:start + batch_size]).delete()
+        change_summaries(_created_cells(missing, skipped) + stale_cells)
+    return len(missing), len(stale_ids)
+
+
+def render_evaluation_notes(project_code=None, rerender=False, batch_size=NOTES_BATCH_SIZE):
+    """
+    fill Evaluation.notes_html for rows saved before it was added (save() keeps it current after that)
+    NOTE: rows are read in id order a batch at a time and written with bulk_update, so memory stays flat and save()
+        is not run for every row
+    :param project_code: only evaluations of this project; all projects if None
+    :param rerender: render every row with notes again (after changing the markdown settings) instead of only the
+        missing ones
+    :param batch_size: rows read and written per round trip
+    :return: the number of evaluations rendered
+    """
+    queryset = Evaluation.objects.filter(notes__isnull=False)
+    if project_code:
+        queryset = queryset.filter(vendor__project=get_project(project_code))
+    if not rerender:
+        queryset = queryset.filter(notes_html__isnull=True)
+    queryset = queryset.only('id', 'notes', 'notes_html').order_by('id')
+    rendered = 0
+    last_id = 0
+    while True:
+        evaluations = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not evaluations:
+            break
+        for evaluation in evaluations:
+            evaluation.notes_html = evaluation.render_notes()
+        Evaluation.objects.bulk_update(evaluations, ['notes_html'])
+        rendered += len(evaluations)
+        last_id = evaluations[-1].id
+    return rendered
@@ -0,0 +1,38 @@
+import time
+from django.core.cache import cache
+
+# version stamps of the cached data derived from a project (rollups, docroot pages) and from the shared tag trees;
+#   cached entries put the versions they were built from in their keys so bumping a version invalidates them all at
+#   once without knowing their keys (old entries are never read again and expire)
+# NOTE: eval.scorecard bumps a project once every change of its summary rows commits, which every evaluation change
+#   ends with (signals and bulk paths alike); eval.signals bumps it for project, vendor and requirement changes and
+#   the tag version for tag changes
+PROJECT_VERSION_KEY = 'eval:version:project:{project_id}'
+TAG_VERSION_KEY = 'eval:version:tags'
+
+
+def cache_version(key):
+    """
+    :return: the current version stored under key (starting one if there is none)
+    """
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        cache.set(key, version, None)
+    return version
+
+
+def project_version(project_id):
+    return cache_version(PROJECT_VERSION_KEY.format(project_id=project_id))
+
+
+def tag_version():
+    return cache_version(TAG_VERSION_KEY)
+
+
+def bump_project_version(project_id):
+    cache.set(PROJECT_VERSION_KEY.format(project_id=project_id), time.time_ns(), None)
+
+
+def bump_tag_version():
+    cache.set(TAG_VERSION_KEY, time.time_ns(), None)
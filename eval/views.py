@@ -1,6 +1,26 @@
-from django.shortcuts import HttpResponse
-from .utils import generate_evaluations
-from .admin import EvaluationResource
+import itertools
+import json
+import os
+from django.shortcuts import HttpResponse, get_object_or_404
+from django.http import StreamingHttpResponse, JsonResponse, FileResponse
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from django.core.files.storage import default_storage
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from .models import Job
+from .utils import generate_evaluations, is_true
+from .jobs import enqueue_job, cancel_job, job_status
+from .scorecard import get_scorecard
+from .scoring import weighted_vendor_totals
+from .analytics import project_statistics
+from .progress import project_progress
+from .rollups import get_rollups, rollup_branch
+from .lookups import search_users
+from .metrics import METRICS
+from .grid import get_score_grid, save_score_grid
+from .imports import import_evaluations as run_import, get_import_format
+from .export import EXPORT_FORMATS, filter_evaluations, get_export_columns, get_export_format
 
 
 def detail(request, question_id):
@@ -12,10 +32,10 @@ def generate_missing_evaluations(request, product_code):
     generates any missing evals for a project and returns status output to include on a dialog
     :param request: request object
     :param product_code: the product_code to generate for
-    :return: list of records created or empty string
+    :return: list of records created or empty string (counts only when called with ?dry_run=true)
     """
     try:
-        return_msg = generate_evaluations(product_code)
+        return_msg = generate_evaluations(product_code, dry_run=is_true(request.GET.get('dry_run')))
     except Exception as ex:
         return HttpResponse(str(ex), status=500)
     return HttpResponse(return_msg)
@@ -23,14 +43,233 @@ def generate_missing_evaluations(request, product_code):
 
 def export_evaluations(request):
     """
-    exports all evaluations from the admin screen button
-    :param request: request object
-    :return: list of records created or empty string
+    exports evaluations from the admin screen button or for reporting jobs
+    NOTE: filters and columns are pushed down to the database and rows are streamed as they are read so memory stays
+        flat no matter how many evaluations there are; errors after the first row can no longer change the status
+    :param request: request object; optional GET params:
+        project - project code; vendor - vendor name(s); user - username(s) (comma separated lists)
+        score_min / score_max - inclusive score range; confirmed - true/false
+        columns - comma separated export columns (defaults to all in EvaluationResource export order)
+        format - csv (default), jsonl or columns (columnar json)
+    :return: streaming export of the matching evaluations
     """
     try:
-        dataset = EvaluationResource().export()
-        response = HttpResponse(dataset.csv, content_type="text/csv")
-        response['Content-Disposition'] = 'attachment; filename="evaluations.csv"'
-        return response
+        export_format = get_export_format(request.GET)
+        columns = get_export_columns(request.GET)
+        queryset = filter_evaluations(request.GET)
+        stream, content_type, extension = EXPORT_FORMATS[export_format]
+        rows = stream(queryset, columns)
+        # pull the first two fragments now so database errors still return an error status instead of a broken
+        #   download: csv (its header) and columns (its opening) yield one before the query runs, jsonl yields rows only
+        first = list(itertools.islice(rows, 2))
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
     except Exception as ex:
         return HttpResponse(str(ex), status=500)
+    file_name = f"evaluations-{request.GET['project']}" if request.GET.get('project') else "evaluations"
+    response = StreamingHttpResponse(itertools.chain(first, rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{file_name}.{extension}"'
+    return response
+
+
+def enqueue_generate_evaluations(request, product_code):
+    """
+    queues a job to generate any missing evals for a project (see generate_missing_evaluations)
+    :param request: request object; ?dry_run=true only counts what would be created
+    :param product_code: the product_code to generate for
+    :return: json status of the queued job; poll api/jobs/<id>/ for progress
+    """
+    try:
+        job = enqueue_job(Job.GENERATE, {'project_code': product_code, 'dry_run': is_true(request.GET.get('dry_run'))},
+                          user=request.user)
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
+    return JsonResponse(job_status(job), status=202)
+
+
+def enqueue_export_evaluations(request):
+    """
+    queues a job to export evaluations; takes the same parameters as export_evaluations
+    :param request: request object
+    :return: json status of the queued job; fetch api/jobs/<id>/result/ when it is done
+    """
+    try:
+        job = enqueue_job(Job.EXPORT, request.GET.dict(), user=request.user)
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
+    return JsonResponse(job_status(job), status=202)
+
+
+def job_detail(request, job_id):
+    """
+    :return: json status and progress of a job
+    """
+    return JsonResponse(job_status(get_object_or_404(Job, id=job_id)))
+
+
+def job_result(request, job_id):
+    """
+    :return: the export file or the generate output of a finished job; 409 if it is not done
+    """
+    job = get_object_or_404(Job, id=job_id)
+    if job.status != Job.DONE:
+        return HttpResponse(f"Job [{job.id}] has no result; status is [{job.status}]", status=409)
+    if job.result_file:
+        return FileResponse(default_storage.open(job.result_file, 'rb'), as_attachment=True,
+                            filename=f"evaluations-{job.id}.{job.result_file.rsplit('.', 1)[-1]}")
+    return HttpResponse(job.message)
+
+
+@require_http_methods(['POST'])
+def job_cancel(request, job_id):
+    """
+    :return: json status of the job after asking it to cancel (POST only as it changes the job)
+    """
+    return JsonResponse(job_status(cancel_job(get_object_or_404(Job, id=job_id))))
+
+
+def vendor_scorecard(request, product_code):
+    """
+    vendor scorecard for dashboards read from the summary table: per vendor, requirement and category averages,
+    counts, unscored coverage and confirmed ratios
+    :param request: request object
+    :param product_code: the project code
+    :return: json scorecard
+    """
+    try:
+        return JsonResponse(get_scorecard(product_code))
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+def weighted_vendor_scores(request, product_code):
+    """
+    vendor ranking by score weighted with the project priority weights
+    :param request: request object
+    :param product_code: the project code
+    :return: json list of vendors best first
+    """
+    try:
+        return JsonResponse({'project': product_code, 'vendors': weighted_vendor_totals(product_code)})
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+def tag_rollups(request, product_code, tree):
+    """
+    vendor scores rolled up a tag tree for drill down dashboards (see rollups.build_rollups); served from the cache
+    :param request: request object; ?tag=user returns that node and its direct children, ?tag= (empty) the top level;
+        leave it out for the whole tree
+    :param product_code: the project code
+    :param tree: categories or priorities
+    :return: json of vendors and nodes (or node and children)
+    """
+    try:
+        rollups = get_rollups(product_code, tree)
+        if 'tag' in request.GET:
+            return JsonResponse(rollup_branch(rollups, request.GET['tag'] or None))
+        return JsonResponse(rollups)
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+@staff_member_required
+def score_statistics(request, product_code):
+    """
+    score distribution and inter-rater agreement of a project (see analytics.project_statistics)
+    NOTE: staff only as it reports the bias of every evaluator
+    :param request: request object
+    :param product_code: the project code
+    :return: json of vendors (agreement and distribution), evaluators (bias) and cells (least agreement first)
+    """
+    try:
+        return JsonResponse(project_statistics(product_code))
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+def evaluation_progress(request, product_code):
+    """
+    evaluation progress leaderboard of a project read from the summary table (see progress.project_progress)
+    :param request: request object
+    :param product_code: the project code
+    :return: json of the project totals and users (scored/unscored counts and coverage per vendor) most complete first
+    """
+    try:
+        return JsonResponse(project_progress(product_code))
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+@staff_member_required
+def user_lookup(request):
+    """
+    autocomplete for the evaluation admin user filter
+    :param request: request object; q is part of a username
+    :return: json list of matching users (id, username) leaving out the current user
+    """
+    users = search_users(request.GET.get('q'), exclude_id=request.user.id)
+    return JsonResponse({'results': [{'id': user_id, 'username': username} for user_id, username in users]})
+
+
+@staff_member_required
+def request_metrics(request):
+    """
+    request timing histograms recorded by eval.middleware.RequestMetricsMiddleware in this server process
+    NOTE: every worker process keeps its own numbers; the response says which process answered
+    :param request: request object; ?reset=true starts the histograms over after reading them
+    :return: json of view name -> count, avg/p50/p95/p99/max ms, avg db ms, avg/max queries and bucket counts
+    """
+    return JsonResponse({'pid': os.getpid(), 'views': METRICS.snapshot(reset=is_true(request.GET.get('reset')))})
+
+
+@login_required
+@require_http_methods(['GET', 'POST', 'PATCH'])
+def score_grid(request, product_code):
+    """
+    the requirements x vendors score grid of the logged in evaluator (used by the docroot evaluate page)
+    :param request: request object; GET loads the grid, POST or PATCH saves a json body of
+        {"changes": [{"id": 1, "score": 7, "confirmed": false, "expected": {"score": null, "confirmed": false}}]}
+    :param product_code: the project code
+    :return: json grid for GET; json {saved, conflicts} for POST/PATCH where conflicts are cells someone else
+        changed since the grid was loaded (not saved; returned with their current values)
+    """
+    try:
+        if request.method == 'GET':
+            return JsonResponse(get_score_grid(product_code, request.user))
+        try:
+            changes = json.loads(request.body or b'{}').get('changes', [])
+        except (ValueError, AttributeError):
+            return HttpResponse("Body must be a json object with a list of changes", status=400)
+        return JsonResponse(save_score_grid(product_code, request.user, changes))
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+
+
+@login_required
+@require_http_methods(['POST'])
+def import_evaluations(request, product_code):
+    """
+    imports scores, confirmed flags and notes from an uploaded csv/xlsx shaped like the export
+    NOTE: evaluators can only import their own cells; staff can import any cell of the project
+    :param request: request object; multipart upload in file; ?dry_run=true only validates and returns the diff;
+        ?format=csv|xlsx overrides the file extension
+    :param product_code: the project code
+    :return: json result (rows, changed, updated, errors and the diff); 400 when any row has an error
+    """
+    upload = request.FILES.get('file')
+    if not upload:
+        return HttpResponse("Upload the csv or xlsx file as [file]", status=400)
+    try:
+        import_format = get_import_format(upload.name, request.GET.get('format'))
+        result = run_import(product_code, upload, import_format, user=None if request.user.is_staff else request.user,
+                            dry_run=is_true(request.GET.get('dry_run')))
+    except ValidationError as ex:
+        return HttpResponse('; '.join(ex.messages), status=400)
+    except ObjectDoesNotExist as ex:
+        return HttpResponse(str(ex), status=404)
+    return JsonResponse(result, status=400 if result['error_count'] else 200)